@@ -0,0 +1,55 @@
+"""
+Benchmark forming the initial codedstring index for large UTF-8 buffers made
+by repeating test/data/UTF-8-demo.txt.
+
+Run from the repository root with the package importable, e.g.:
+
+    $ python bench/bench_codedstring_index.py [largest size in MiB]
+
+The decoder driven indexer is only timed for the smaller sizes since it is
+several orders of magnitude slower.
+
+"""
+import codecs
+import os
+import sys
+import timeit
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer import codedstring as codedstring_module
+from bytegapbuffer.codedstring import codedstring
+
+DEMO_PATH = os.path.join(
+    os.path.dirname(__file__), '..', 'test', 'data', 'UTF-8-demo.txt'
+)
+
+def main():
+    # pylint: disable=protected-access
+    largest = int(float(sys.argv[1]) * (1<<20)) if len(sys.argv) > 1 \
+        else 128<<20
+
+    with open(DEMO_PATH, 'rb') as f:
+        demo = f.read()
+
+    print('%12s %10s %16s %16s' % ('size/MiB', 'runs', 'bulk/s', 'decoder/s'))
+    size = 1<<20
+    while size <= largest:
+        buf = bytegapbuffer((demo * (1 + size // len(demo)))[:size])
+        # keep the buffer valid UTF-8 by trimming at a line boundary
+        del buf[buf.rfind(b'\n') + 1:]
+
+        t_bulk = min(timeit.repeat(lambda: codedstring(buf),
+                                   number=1, repeat=3))
+        if size <= 4<<20:
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            t_dec = min(timeit.repeat(
+                lambda: codedstring_module._index_byte_array(buf, decoder),
+                number=1, repeat=1))
+        else:
+            t_dec = float('nan')
+        print('%12.1f %10d %16.3f %16.3f' % (
+            len(buf) / (1<<20), len(codedstring(buf)._index), t_bulk, t_dec))
+        size <<= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark reader throughput of a synchronizedbytegapbuffer under write load.
+
+Run from the repository root with the package importable, e.g.:
+
+    $ python bench/bench_concurrent_readers.py [seconds per measurement]
+
+For each number of reader threads, the readers repeatedly search, slice and
+read the segments of a 4MiB buffer while a single writer thread inserts and
+deletes small spans at random positions as fast as it can. The number of
+read and write operations per second is reported with and without the
+writer running and for an unsynchronised bytegapbuffer read from a single
+thread as a baseline.
+
+"""
+import random
+import sys
+import threading
+import time
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.synchronized import synchronizedbytegapbuffer
+
+_SIZE = 4<<20
+
+def _read_segments(b, idx):
+    for seg in b.segments(idx, idx + 4096):
+        seg.release()
+
+def _read(b, rng):
+    idx = rng.randrange(len(b) - 4096)
+    b.find(b'needle', idx, idx + 4096)
+    b[idx:idx + 1024] # pylint: disable=pointless-statement
+    if isinstance(b, synchronizedbytegapbuffer):
+        with b.reading():
+            _read_segments(b, idx)
+    else:
+        _read_segments(b, idx)
+
+def _measure(b, n_readers, write, duration):
+    done = threading.Event()
+    counts = [0] * (n_readers + 1)
+
+    def reader(k):
+        rng = random.Random(k)
+        while not done.is_set():
+            _read(b, rng)
+            counts[k] += 1
+
+    def writer():
+        rng = random.Random(-1)
+        while not done.is_set():
+            idx = rng.randrange(len(b) - 64)
+            if rng.random() < 0.5:
+                b[idx:idx] = b'x' * 16
+            else:
+                del b[idx:idx + 16]
+            counts[-1] += 1
+
+    threads = [threading.Thread(target=reader, args=(k,))
+               for k in range(n_readers)]
+    if write:
+        threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    done.set()
+    for t in threads:
+        t.join()
+    return sum(counts[:-1]) / duration, counts[-1] / duration
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    data = b'x' * _SIZE
+
+    reads, _ = _measure(bytegapbuffer(data), 1, False, duration)
+    print('unsynchronised, 1 reader: %.0f reads/s' % (reads,))
+
+    print('%8s %8s %14s %14s' % ('readers', 'writer', 'reads/s', 'writes/s'))
+    for n_readers in (1, 2, 4, 8):
+        for write in (False, True):
+            b = synchronizedbytegapbuffer(data)
+            reads, writes = _measure(b, n_readers, write, duration)
+            print('%8d %8s %14.0f %14.0f' % (
+                n_readers, 'yes' if write else 'no', reads, writes
+            ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Benchmark slice reads from a bytegapbuffer against the same reads from a
+bytearray.
+
+Run from the repository root with the package importable, e.g.:
+
+    $ python bench/bench_getitem.py [viewport size in KiB]
+
+Each read is a viewport sized slice from the middle of a 16MiB buffer whose
+gap lies inside the viewport.
+
+"""
+import sys
+import timeit
+
+from bytegapbuffer import bytegapbuffer
+
+def main():
+    # pylint: disable=protected-access
+    size = 16<<20
+    viewport = int(float(sys.argv[1]) * (1<<10)) if len(sys.argv) > 1 \
+        else 64<<10
+
+    ba = bytearray(b'0123456789abcdef' * (size >> 4))
+    b = bytegapbuffer(ba)
+    start = (size - viewport) >> 1
+    b._move_gap(start + (viewport >> 1))
+    assert b[start:start+viewport] == ba[start:start+viewport]
+
+    print('viewport: %d bytes' % viewport)
+    print('%12s %16s %16s %8s' % ('step', 'bytearray/us', 'gapbuffer/us',
+                                  'ratio'))
+    for step in (1, 2, 7, -1, -3):
+        if step > 0:
+            k = slice(start, start + viewport, step)
+        else:
+            k = slice(start + viewport, start, step)
+        t_ba = min(timeit.repeat(lambda: ba[k], number=100, repeat=5)) / 100
+        t_b = min(timeit.repeat(lambda: b[k], number=100, repeat=5)) / 100
+        print('%12d %16.2f %16.2f %8.2f' % (
+            step, 1e6 * t_ba, 1e6 * t_b, t_b / t_ba))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark the cost of moving the gap as a function of move distance.
+
+Run from the repository root with the package importable, e.g.:
+
+    $ python bench/bench_move_gap.py [buffer size in MiB]
+
+For each distance the gap is moved back and forth between two points. The
+"shift" column is the block move used by default and the "rebuild" column
+forces the buffer to be rebuilt around the new gap position (see
+bytegapbuffer._MOVE_REBUILD_THRESHOLD).
+
+"""
+import sys
+import timeit
+
+from bytegapbuffer import bytegapbuffer
+
+def _time_moves(b, distance, repeat=5):
+    # pylint: disable=protected-access
+    def move():
+        b._move_gap(distance)
+        b._move_gap(0)
+    b._move_gap(0)
+    return min(timeit.repeat(move, number=1, repeat=repeat)) / 2
+
+def main():
+    # pylint: disable=protected-access
+    size = int(float(sys.argv[1]) * (1<<20)) if len(sys.argv) > 1 else 16<<20
+    b = bytegapbuffer(b'x' * size)
+
+    print('buffer size: %d bytes' % size)
+    print('%12s %12s %12s' % ('distance', 'shift/ms', 'rebuild/ms'))
+    distance = 1<<10
+    while distance <= size:
+        b._MOVE_REBUILD_THRESHOLD = None
+        shift = _time_moves(b, distance)
+
+        b._MOVE_REBUILD_THRESHOLD, b._MOVE_REBUILD_FRACTION = 0, 0
+        rebuild = _time_moves(b, distance)
+
+        del b._MOVE_REBUILD_THRESHOLD, b._MOVE_REBUILD_FRACTION
+
+        print('%12d %12.3f %12.3f' % (distance, 1e3 * shift, 1e3 * rebuild))
+        distance <<= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark ways of writing the contents of a bytegapbuffer to a file.
+
+Run from the repository root with the package importable, e.g.:
+
+    $ python bench/bench_save.py [buffer size in MiB]
+
+The buffer has its gap in the middle. Writing a copy made by slicing is
+compared with writeto() on a file object and on a file descriptor, with a
+full save() and with an incremental save() after editing the last 4KiB.
+Writes go to a temporary directory.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from bytegapbuffer import bytegapbuffer
+
+def main():
+    # pylint: disable=protected-access
+    size = int(float(sys.argv[1]) * (1<<20)) if len(sys.argv) > 1 \
+        else 64<<20
+
+    b = bytegapbuffer(b'0123456789abcdef' * (size >> 4))
+    b._move_gap(size >> 1)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'out')
+
+    def sliced():
+        with open(path, 'wb') as f:
+            f.write(b[:])
+
+    def writeto_file():
+        with open(path, 'wb') as f:
+            b.writeto(f)
+
+    def writeto_fd():
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            b.writeto(fd)
+        finally:
+            os.close(fd)
+
+    def incremental():
+        b[-4096:] = b'x' * 4096
+        b.save(path, incremental=True)
+
+    try:
+        print('size: %d bytes' % size)
+        print('%24s %12s' % ('method', 'time/ms'))
+        for name, f in (('slice and write', sliced),
+                        ('writeto(file object)', writeto_file),
+                        ('writeto(fd)', writeto_fd),
+                        ('save()', lambda: b.save(path)),
+                        ('save(incremental=True)', incremental)):
+            t = min(timeit.repeat(f, number=5, repeat=3)) / 5
+            print('%24s %12.2f' % (name, 1e3 * t))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,149 @@
-from __future__ import division
+from collections.abc import MutableSequence
+import hashlib
+import mmap as _mmap
+import os
+import re
+import weakref
+from itertools import chain, zip_longest
 
-# pylint: disable=redefined-builtin
-from builtins import range
+from .fileio import file_identity, poll_reads, read_into, savepoint, \
+    save_atomically, save_in_place, write_fd, write_file
+from .growth import STRATEGIES as _GROWTH_STRATEGIES
+from .journal import journal, _edit_group
+from .lineindex import lineindex
+from .marks import markset
+from .match import gapmatch
+from .snapshot import snapshot
 
-from future import standard_library
-standard_library.install_aliases()
+class bytegapbuffer(MutableSequence):
+    """A bytearray work-alike which uses a gap buffer for storage.
 
-import struct
-from collections import MutableSequence
-from itertools import zip_longest
+    If *init_gap_size* is None, a heuristic is used to choose the size of the
+    initial gap.
 
-class bytegapbuffer(MutableSequence):
+    *growth* decides how much the gap grows by when it runs out. It may be one
+    of 'proportional' (the default), 'geometric' or 'fixed', or a strategy
+    callable as described in the growth module.
+
+    If *shrink_fraction* is not None, the gap is shrunk back to the size the
+    growth strategy would give it whenever a deletion leaves it larger than
+    *shrink_fraction* times the length of the contents.
+
+    """
     _GAP_BYTE = 0xFF
     _GAP_BLOCK_SIZE = 4<<10 # 4KiB
+    _ITER_CHUNK_SIZE = 64<<10 # 64KiB
+    _REGEX_OVERLAP = 4<<10 # 4KiB
+    _MAP_CHUNK_SIZE = 64<<10 # 64KiB
+    _READ_CHUNK_SIZE = 64<<10 # 64KiB
+
+    # Gap moves longer than _MOVE_REBUILD_THRESHOLD bytes *and* spanning more
+    # than _MOVE_REBUILD_FRACTION of the contents rebuild the buffer rather
+    # than shifting it. On CPython a memmove() beats allocating a new array at
+    # every distance measured by bench/bench_move_gap.py so this is disabled
+    # by default.
+    _MOVE_REBUILD_THRESHOLD = None
+    _MOVE_REBUILD_FRACTION = 0.75
 
-    def __init__(self, other=b'', init_gap_size=None):
+    def __init__(self, other=b'', init_gap_size=None, growth=None,
+                 shrink_fraction=1.0):
         self._ba = bytearray(other)
         if init_gap_size is None:
             # heuristic to choose initial gap size
             init_gap_size = max(8, min(self._GAP_BLOCK_SIZE, len(self._ba) >> 1))
         self._gap_start = len(self._ba) # start of gap
         self._gap_end = self._gap_start + init_gap_size # just past end of gap
-        self._ba.extend(self._GAP_BYTE for _ in range(self._gap_size))
+        self._ba.extend(self._gap_fill(self._gap_size))
+
+        if growth is None:
+            growth = 'proportional'
+        if not callable(growth):
+            try:
+                growth = _GROWTH_STRATEGIES[growth]()
+            except KeyError:
+                raise ValueError('unknown growth strategy: %r' % (growth,))
+        self._growth = growth
+        self._last_growth = 0
+        self._shrink_fraction = shrink_fraction
+
+        # objects with on_insert() and on_delete() methods which are told about
+        # modifications
+        self._listeners = []
+        self._lines = None
+        self._marks = None
+        self._journal = None
+        self._savepoint = None
+
+        # weak references to the snapshots which may share _ba
+        self._snapshots = []
+
+        # Contents loaded by from_file() are held in a read-only mapping of the
+        # file until they are edited. See from_file().
+        self._map = None
+        self._map_identity = None
+        self._head_start, self._n_head = 0, 0
+        self._tail_start, self._n_tail = 0, 0
+
+    @classmethod
+    def from_file(cls, path, mmap=True, **kwargs):
+        """Return a new buffer holding the contents of the file at *path*.
+        Other keyword arguments are as for the constructor.
+
+        If *mmap* is True, the file is mapped into memory read-only rather than
+        read. The gap buffer storage then only covers a window of the
+        contents, which starts out empty, and the parts of the file before and
+        after the window are read directly from the mapping. The window is
+        widened to take in the parts of the file which are edited, so memory
+        use grows with the span of the file between the edits rather than
+        with its size. There is only one window, so an edit at the end of
+        the file followed by one at its start reads in everything between
+        them. Deleting contents at either end of the mapped parts does not
+        widen the window. Reads, searches and slicing work across the window
+        and the mapping alike. compact() and getbuffer() read the whole file
+        into memory.
+
+        The file should not be modified while the buffer is in use, other
+        than by save(). Empty files, which cannot be mapped, are read.
+
+        """
+        # pylint: disable=protected-access
+        with open(path, 'rb') as f:
+            mapped = None
+            if mmap:
+                try:
+                    mapped = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+                except ValueError:
+                    # empty files cannot be mapped
+                    pass
+            if mapped is None:
+                b = cls(f.read(), **kwargs)
+            else:
+                b = cls(**kwargs)
+                b._map = mapped
+                b._map_identity = file_identity(os.fstat(f.fileno()))[:2]
+                b._tail_start, b._n_tail = 0, len(mapped)
+                # any listeners a subclass has added see the contents appear
+                b._notify_insert(0, len(mapped))
+        b._set_savepoint(path)
+        return b
 
     def copy(self):
         """Return a deep copy of this gap buffer with the gap in the same
-        place.
+        place. The copy has no marks or journal. See snapshot() for a cheap
+        read-only copy.
 
         """
         # pylint: disable=protected-access
-        c = bytegapbuffer()
+        c = bytegapbuffer(growth=self._growth,
+                          shrink_fraction=self._shrink_fraction)
         c._ba = bytearray(self._ba)
         c._gap_start = self._gap_start
         c._gap_end = self._gap_end
+        c._last_growth = self._last_growth
+        # the mapping is read-only and so may be shared
+        c._map, c._map_identity = self._map, self._map_identity
+        c._head_start, c._n_head = self._head_start, self._n_head
+        c._tail_start, c._n_tail = self._tail_start, self._n_tail
         return c
 
     # MUTABLE SEQUENCE METHODS
@@ -42,24 +153,12 @@ class bytegapbuffer(MutableSequence):
             index = max(0, index + len(self))
         index = min(index, len(self))
 
-        while self._gap_size < 1:
-            # need to increase gap size
-            bs = self._GAP_BLOCK_SIZE
-            self._ba[self._gap_start:self._gap_start] = bytearray(
-                self._GAP_BYTE for _ in range(bs)
-            )
-            self._gap_end += bs
-
-        # simple case: append to beginning
-        if index == self._gap_start:
-            self._ba[self._gap_start] = v
-            self._gap_start += 1
-            return
-
         # move the gap to start at the insertion point
-        self._move_gap(index)
+        self._reserve(index, 1)
+        self._preserve(self._gap_start, self._gap_start + 1)
         self._ba[self._gap_start] = v
         self._gap_start += 1
+        self._notify_insert(index, index + 1)
 
     def __delitem__(self, k):
         start, stop = None, None
@@ -74,28 +173,8 @@ class bytegapbuffer(MutableSequence):
         else:
             raise TypeError('invalid key type: %s' % type(k))
 
-        if stop <= start:
-            # a nop
-            return
-
-        assert stop > start
-        assert start >= 0 and start < len(self)
-        assert stop >= 0 and stop <= len(self)
-
-        n_to_del = stop - start
-        if stop == self._gap_start:
-            # We can just grow the gap towards the start.
-            self._gap_start -= n_to_del
-        elif start == self._gap_start:
-            # We can just grow the gap towards the end.
-            self._gap_end += n_to_del
-        else:
-            # Move the gap so that the sequence to delete is just
-            # at the end of the gap
-            self._move_gap(start)
-
-            # grow the gap to cover it
-            self._gap_end += n_to_del
+        self._delete(start, stop)
+        self._maybe_shrink_gap()
 
     def __setitem__(self, k, v):
         if isinstance(k, int):
@@ -104,14 +183,112 @@ class bytegapbuffer(MutableSequence):
                 raise IndexError('index out of range')
             self[k:k+1] = [v]
         elif isinstance(k, slice):
-            start, stop, _ = k.indices(len(self))
+            start, stop, step = k.indices(len(self))
+            if step != 1:
+                with _edit_group(self._journal):
+                    self._set_extended_slice(start, stop, step, v)
+                return
 
-            del self[start:stop]
-            for offset, elem in enumerate(v):
-                self.insert(offset + start, elem)
+            # capture *v* before the deletion moves the gap in case it refers
+            # to our own contents
+            src = self._source_view(v)
+            try:
+                # a replacement is one undo step but a plain insertion or
+                # deletion may be coalesced with its neighbours
+                replacing = start < stop and src.nbytes > 0
+                with _edit_group(self._journal if replacing else None):
+                    self._delete(start, stop)
+                    if src.nbytes > 0:
+                        self._reserve(start, src.nbytes)
+                        self._write_gap(start, src)
+            finally:
+                src.release()
+            self._maybe_shrink_gap()
         else:
             raise TypeError('invalid key type: %s' % type(k))
 
+    def insert_bytes(self, index, data):
+        """Insert the contents of *data* before *index*. *data* may be any
+        object supporting the buffer protocol, whose bytes are copied directly
+        into the gap, or an iterable of integers.
+
+        """
+        if index < 0:
+            index = max(0, index + len(self))
+        index = min(index, len(self))
+
+        with self._source_view(data) as src:
+            n = src.nbytes
+            if n == 0:
+                return
+            self._reserve(index, n)
+            self._write_gap(index, src)
+
+        self._maybe_shrink_gap()
+
+    def apply_edits(self, edits, gap=None):
+        """Apply a sequence of (start, stop, data) *edits* in a single pass
+        over the buffer. Each edit replaces the contents between *start* and
+        *stop* with *data*, which may be anything accepted by insert_bytes().
+        Indices refer to the contents before any of the edits are applied.
+        Edits may be given in any order but may not overlap. Insertions at
+        the same index are applied in the order given.
+
+        All of the edits are validated before any is applied: IndexError is
+        raised if an edit lies outside of the buffer and ValueError if edits
+        overlap, in which case the buffer is unchanged.
+
+        The gap is left after the last edit or, if *gap* is not None, at
+        index *gap* of the edited contents. If a journal has been started, the
+        edits are undone as a single step.
+
+        """
+        length = len(self)
+        prepared = []
+        try:
+            for start, stop, data in edits:
+                if start < 0 or stop < start or stop > length:
+                    raise IndexError(
+                        'invalid edit range: %s to %s' % (start, stop)
+                    )
+                prepared.append((start, stop, self._source_view(data)))
+
+            prepared.sort(key=lambda edit: edit[:2])
+            for (_, stop, _), (start, _, _) in zip(prepared, prepared[1:]):
+                if start < stop:
+                    raise ValueError('edits overlap at index %s' % (start,))
+
+            # Sweep from left to right so that the gap only moves forwards.
+            # Reserving all of the inserted length up front means the gap
+            # never has to grow part way through.
+            if len(prepared) > 0:
+                self._reserve(
+                    prepared[0][0], sum(src.nbytes for _, _, src in prepared)
+                )
+            delta = 0
+            with _edit_group(self._journal):
+                for start, stop, src in prepared:
+                    start, stop = start + delta, stop + delta
+                    self._delete(start, stop)
+                    if src.nbytes > 0:
+                        self._move_gap(start)
+                        self._write_gap(start, src)
+                    delta += src.nbytes - (stop - start)
+        finally:
+            for _, _, src in prepared:
+                src.release()
+
+        self._maybe_shrink_gap()
+        if gap is not None:
+            self._move_gap(max(0, min(gap, len(self))))
+
+    def extend(self, values):
+        self.insert_bytes(len(self), values)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
     # SEQUENCE METHODS
 
     def index(self, x, i=None, j=None):
@@ -121,101 +298,1237 @@ class bytegapbuffer(MutableSequence):
             return f
         raise ValueError('not in buffer: %r' % (x,))
 
+    def rindex(self, x, i=None, j=None):
+        f = self.rfind(x, i, j)
+        if f != -1:
+            return f
+        raise ValueError('not in buffer: %r' % (x,))
+
     def find(self, sub, i=None, j=None):
-        # find start and stop indices
-        sub = bytes(sub)
-        start, stop, _ = slice(i, j).indices(len(self))
-        gs, ge = self._gap_start, self._gap_end
+        """Return the lowest index in the buffer where *sub* is found within
+        the slice [i:j] or -1 if it is not found.
 
-        if start >= stop:
-            return -1
+        """
+        sub = self._as_needle(sub)
+        start, stop = self._search_range(i, j)
+        if len(sub) == 0:
+            return start if start <= stop else -1
 
-        # Is starting position ahead of gap?
-        if start < gs:
-            # firstly, look to see if substring is in pre-gap area
-            f = self._ba.find(sub, start, min(gs, stop))
+        # Look in each stretch of storage in turn and, before moving on to
+        # the next, for a match straddling the boundary between them.
+        pos = start
+        ranges = self._storage_ranges(start, stop)
+        for idx, (storage, lo, hi) in enumerate(ranges):
+            if idx > 0:
+                f = self._find_straddling(sub, start, stop, pos, last=False)
+                if f != -1:
+                    return f
+            f = storage.find(sub, lo, hi)
             if f != -1:
-                return f
+                return f - lo + pos
+            pos += hi - lo
+
+        # no match
+        return -1
 
-        if start < gs and stop >= gs:
-            # no, linearly search over gap (slow)
-            sub_len = len(sub)
-            search_start = max(start, gs-sub_len)
-            for search_idx in range(search_start, search_start+sub_len):
-                if self[search_idx:min(stop, search_idx+sub_len)] == sub:
-                    return search_idx
+    def rfind(self, sub, i=None, j=None):
+        """Return the highest index in the buffer where *sub* is found within
+        the slice [i:j] or -1 if it is not found.
 
-        # finally, check post-gap
-        gap_size = self._gap_size
-        if stop >= gs:
-            f = self._ba.find(sub, max(ge, start + gap_size), stop + gap_size)
+        """
+        sub = self._as_needle(sub)
+        start, stop = self._search_range(i, j)
+        if len(sub) == 0:
+            return stop if start <= stop else -1
+
+        pos = stop
+        ranges = self._storage_ranges(start, stop)
+        for idx, (storage, lo, hi) in reversed(list(enumerate(ranges))):
+            pos -= hi - lo
+            f = storage.rfind(sub, lo, hi)
             if f != -1:
-                return f - gap_size
+                return f - lo + pos
+            if idx > 0:
+                f = self._find_straddling(sub, start, stop, pos, last=True)
+                if f != -1:
+                    return f
 
-        # no match
         return -1
 
+    def count(self, sub, i=None, j=None):
+        """Return the number of non-overlapping occurrences of *sub* within
+        the slice [i:j].
+
+        """
+        # pylint: disable=arguments-differ
+        sub = self._as_needle(sub)
+        start, stop = self._search_range(i, j)
+        if len(sub) == 0:
+            return max(0, stop - start + 1)
+
+        ranges = self._storage_ranges(start, stop)
+        pos = start
+        for _, lo, hi in ranges[:-1]:
+            pos += hi - lo
+            if self._find_straddling(sub, start, stop, pos, last=False) != -1:
+                # Matches either side of the boundary interact and so we need
+                # to walk them in order.
+                return sum(1 for _ in self.finditer(sub, i, j))
+
+        n = 0
+        for storage, lo, hi in ranges:
+            if storage is self._ba:
+                n += storage.count(sub, lo, hi)
+            else:
+                # mmap has no count()
+                f = storage.find(sub, lo, hi)
+                while f != -1:
+                    n += 1
+                    f = storage.find(sub, f + len(sub), hi)
+        return n
+
+    def finditer(self, sub, i=None, j=None):
+        """Return an iterator over the index of each non-overlapping
+        occurrence of *sub* within the slice [i:j]. Matches are found lazily
+        as the iterator is advanced. See iter_search() for regular
+        expressions.
+
+        """
+        sub = self._as_needle(sub)
+        start, stop = self._search_range(i, j)
+        def g():
+            pos = start
+            while pos <= stop:
+                # Search the storage directly until the buffer is changed
+                # between items. stop may need to be clipped if it shrinks.
+                layout = self._layout()
+                for f in self._find_all(sub, pos, min(stop, len(self))):
+                    yield f
+                    pos = f + max(1, len(sub))
+                    if self._layout() != layout:
+                        break
+                else:
+                    return
+        return g()
+
+    def search(self, pattern, i=None, j=None, overlap=None):
+        """Scan the slice [i:j] for the first match of the bytes regular
+        expression *pattern* and return a gapmatch object for it or None if
+        there is no match. *pattern* may be compiled or a bytes string.
+
+        The pattern is run directly on the storage on each side of the gap.
+        Matches which may straddle the gap are found by searching a window of
+        *overlap* bytes either side of it. If *overlap* is None, a default of
+        4KiB is used. Matches, including any lookaround, which are longer
+        than *overlap* bytes are only found correctly if they do not straddle
+        the gap. As for the *pos* and *endpos* arguments to re's search(),
+        '^' does not match at i and the match may not extend past j.
+
+        """
+        pattern = re.compile(pattern)
+        start, stop = self._search_range(i, j)
+        if start > stop:
+            return None
+        overlap = overlap if overlap is not None else self._REGEX_OVERLAP
+        return self._search_regex(pattern, start, stop, overlap)
+
+    def iter_search(self, pattern, i=None, j=None, overlap=None):
+        """Return an iterator over gapmatch objects for each non-overlapping
+        match of the bytes regular expression *pattern* within the slice
+        [i:j]. *pattern* may be compiled or a bytes string and *overlap* is
+        as for search(). Matches are found lazily as the iterator is advanced.
+
+        """
+        pattern = re.compile(pattern)
+        start, stop = self._search_range(i, j)
+        overlap = overlap if overlap is not None else self._REGEX_OVERLAP
+        def g():
+            pos = start
+            while pos <= stop:
+                # As for finditer(), start again if the buffer is changed.
+                layout = self._layout()
+                for m in self._search_all(
+                        pattern, pos, min(stop, len(self)), overlap):
+                    yield m
+                    pos = m.end() if m.end() > m.start() else m.end() + 1
+                    if self._layout() != layout:
+                        break
+                else:
+                    return
+        return g()
+
+    def startswith(self, prefix, i=None, j=None):
+        """Return True if the slice [i:j] starts with *prefix*. *prefix* may
+        also be a tuple of prefixes to look for.
+
+        """
+        if isinstance(prefix, tuple):
+            return any(self.startswith(p, i, j) for p in prefix)
+        prefix = self._as_needle(prefix)
+        start, stop = self._search_range(i, j)
+        if stop - start < len(prefix):
+            return False
+        with memoryview(prefix) as view:
+            return self._matches_at(start, view)
+
+    def endswith(self, suffix, i=None, j=None):
+        """Return True if the slice [i:j] ends with *suffix*. *suffix* may
+        also be a tuple of suffixes to look for.
+
+        """
+        if isinstance(suffix, tuple):
+            return any(self.endswith(s, i, j) for s in suffix)
+        suffix = self._as_needle(suffix)
+        start, stop = self._search_range(i, j)
+        if stop - start < len(suffix):
+            return False
+        with memoryview(suffix) as view:
+            return self._matches_at(stop - len(suffix), view)
+
     def __repr__(self):
         return 'bytegapbuffer(%r, start=%s, end=%s)' % (
-            bytes(self._ba[:self._gap_start] + self._ba[self._gap_end:]),
-            self._gap_start, self._gap_end
+            self[:], self._gap_start, self._gap_end
         )
 
     def __eq__(self, other):
-        for a, b in zip_longest(self, other):
-            if a != b:
+        if isinstance(other, bytegapbuffer):
+            if len(other) != len(self):
                 return False
-        return True
+            pos = 0
+            for seg in other.segments():
+                with seg:
+                    if not self._matches_at(pos, seg):
+                        return False
+                    pos += len(seg)
+            return True
+
+        try:
+            view = memoryview(other)
+        except TypeError:
+            view = None
+        if view is None or view.format != 'B' or view.ndim != 1:
+            # fall back to comparing element by element
+            for a, b in zip_longest(self, other):
+                if a != b:
+                    return False
+            return True
+
+        with view:
+            if len(view) != len(self):
+                return False
+            if not view.contiguous:
+                # strided views cannot be compared in place
+                return self._matches_at(0, memoryview(view.tobytes()))
+            return self._matches_at(0, view)
 
     def __contains__(self, sub):
         return self.find(sub) != -1
 
     def __iter__(self):
+        return chain.from_iterable(self.iter_chunks())
+
+    def iter_chunks(self, size=None):
+        """Return an iterator over the contents as bytes objects of length
+        *size*, except possibly the last which may be shorter. If *size* is
+        None, a default chunk size is used.
+
+        """
+        size = size if size is not None else self._ITER_CHUNK_SIZE
+        if size < 1:
+            raise ValueError('chunk size must be positive: %r' % (size,))
         def g():
-            for idx in range(len(self)):
-                yield self[idx]
+            idx = 0
+            while idx < len(self):
+                yield self[idx:idx+size]
+                idx += size
         return g()
 
+    def digest(self, algorithm='sha256'):
+        """Return the digest of the contents computed by the named hashlib
+        *algorithm* without copying them.
+
+        """
+        h = hashlib.new(algorithm)
+        for seg in self.segments():
+            with seg:
+                h.update(seg)
+        return h.digest()
+
     def __len__(self):
-        return len(self._ba) - self._gap_size
+        return len(self._ba) - self._gap_end + self._gap_start + \
+            self._n_head + self._n_tail
 
     def __getitem__(self, k):
         if isinstance(k, int):
-            return self._ba[self._idx_to_ba(k)]
+            if self._map is None:
+                return self._ba[self._idx_to_ba(k)]
+            k = k if k >= 0 else k + len(self)
+            if k < 0 or k >= len(self):
+                raise IndexError('index out of range')
+            storage, lo, _ = self._storage_ranges(k, k + 1)[0]
+            return storage[lo]
         elif isinstance(k, slice):
             r = range(*k.indices(len(self)))
-            # this horrible magic is required since py3 bytearray returns ints
-            # and py2 bytearray returns bytes
-            def cond_int(v):
-                if isinstance(v, int):
-                    return struct.pack('B', v)
-                return v
-            return b''.join(cond_int(self._ba[self._idx_to_ba(i)]) for i in r)
+            if r.step != 1:
+                if self._map is not None:
+                    if len(r) == 0:
+                        return b''
+                    lo, hi = min(r[0], r[-1]), max(r[0], r[-1]) + 1
+                    return self[lo:hi][r.start - lo::r.step]
+                # stepped bytearray slicing is much faster than stepped
+                # memoryview slicing
+                return b''.join(self._ba[s] for s in self._ba_slices(r))
+            ranges = self._storage_ranges(r.start, max(r.start, r.stop))
+            if len(ranges) == 1:
+                storage, lo, hi = ranges[0]
+                with memoryview(storage) as mv:
+                    return mv[lo:hi].tobytes()
+            return b''.join(
+                memoryview(storage)[lo:hi] for storage, lo, hi in ranges
+            )
         raise TypeError('invalid index type:', type(k))
 
+    # LINE METHODS
+
+    def line_count(self):
+        """Return the number of lines in the buffer. Lines are separated by
+        b'\\n' and an empty buffer has one line.
+
+        The first call to any of the line methods builds an index of the line
+        starts which is then kept up to date as the buffer is modified. Look
+        ups via the index take logarithmic time.
+
+        """
+        return self._line_index().line_count()
+
+    def line_of(self, offset):
+        """Return the index of the line containing the byte at *offset*. An
+        offset of len(self) is allowed and gives the last line.
+
+        """
+        return self._line_index().line_of(offset)
+
+    def offset_of_line(self, n):
+        """Return the offset of the first byte of line *n*."""
+        return self._line_index().offset_of_line(n)
+
+    def add_mark(self, offset, left_gravity=False):
+        """Return a new mark at *offset* which tracks that position across
+        subsequent modifications. See bytegapbuffer.marks.mark.
+
+        """
+        return self._mark_set().add(offset, left_gravity)
+
+    def remove_mark(self, m):
+        """Stop tracking the mark *m*."""
+        self._mark_set().remove(m)
+
+    def marks(self, start=None, stop=None):
+        """Return a list of the marks whose offset lies between *start* and
+        *stop* in ascending order. If *stop* is None, marks at the very end of
+        the buffer are included.
+
+        """
+        return self._mark_set().marks(start, stop)
+
+    # JOURNAL METHODS
+
+    def start_journal(self, max_bytes=None):
+        """Start recording modifications so that they can be undone and
+        return the journal. If a journal has already been started, its memory
+        cap is set to *max_bytes* and it is returned. See
+        bytegapbuffer.journal.journal.
+
+        """
+        if self._journal is None:
+            self._journal = journal(self, max_bytes)
+            self._listeners.append(self._journal)
+        else:
+            self._journal.max_bytes = max_bytes
+        return self._journal
+
+    def stop_journal(self):
+        """Stop recording modifications and discard the journal."""
+        if self._journal is not None:
+            self._listeners.remove(self._journal)
+            self._journal = None
+
+    def undo(self):
+        """Undo the most recent undo step recorded by the journal. Return
+        False if there was nothing to undo. Raises ValueError if no journal
+        has been started.
+
+        """
+        return self._started_journal().undo()
+
+    def redo(self):
+        """Redo the most recently undone undo step. Return False if there was
+        nothing to redo. Raises ValueError if no journal has been started.
+
+        """
+        return self._started_journal().redo()
+
+    # BUFFER METHODS
+
+    def segments(self, start=None, stop=None):
+        """Return a tuple of read-only memoryviews onto the underlying
+        storage which, when concatenated, give the contents between *start*
+        and *stop*. No copying is performed. There are at most two views, one
+        either side of the gap, or four for a buffer created by from_file().
+
+        The views should be released before the buffer is next modified since
+        their contents are undefined after any modification.
+
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return tuple(
+            memoryview(storage)[lo:hi].toreadonly() for storage, lo, hi
+            in self._storage_ranges(start, max(start, stop))
+        )
+
+    def snapshot(self):
+        """Return an immutable bytegapbuffer.snapshot.snapshot of the current
+        contents which shares storage with the buffer until the buffer
+        overwrites it. Taking a snapshot takes constant time.
+
+        """
+        head, tail = b'', b''
+        if self._map is not None:
+            with memoryview(self._map) as mv:
+                head = mv[self._head_start:self._head_start + self._n_head]
+                tail = mv[self._tail_start:self._tail_start + self._n_tail]
+        s = snapshot(self._ba, self._gap_start, self._gap_end, head, tail)
+        self._snapshots.append(weakref.ref(s))
+        return s
+
+    def compact(self):
+        """Move the gap to the end of the buffer so that the contents are
+        contiguous in the underlying storage. The contents of a buffer created
+        by from_file() are first read into memory.
+
+        """
+        self._cover(0, len(self))
+        self._move_gap(len(self))
+
+    def getbuffer(self):
+        """Compact the buffer and return a single read-only memoryview onto
+        its entire contents. No copying beyond moving the gap is performed.
+
+        The same caveats as for segments() apply to the returned view.
+
+        """
+        self.compact()
+        with memoryview(self._ba) as mv:
+            return mv[:len(self)].toreadonly()
+
+    # FILE METHODS
+
+    def writeto(self, f, start=None, stop=None):
+        """Write the contents between *start* and *stop* to *f* directly
+        from the underlying storage and return the number of bytes written.
+        *f* may be a file descriptor, which is written to with a single
+        os.writev() call where available, or a file object with a write()
+        method.
+
+        """
+        segments = self.segments(start, stop)
+        try:
+            if isinstance(f, int):
+                return write_fd(f, segments)
+            return write_file(f, segments)
+        finally:
+            for seg in segments:
+                seg.release()
+
+    def save(self, path, incremental=False):
+        """Save the contents to the file at *path* and return the number of
+        bytes written.
+
+        The contents are written to a temporary file in the same directory,
+        flushed to disk and renamed over *path* so that an interrupted save
+        leaves the old contents in place.
+
+        If *incremental* is True and the buffer was last saved to or loaded
+        by from_file() from *path*, which has not changed since, the file is
+        instead rewritten in place from the first byte which has been
+        modified since and then truncated. This is much faster when only the
+        end of a large file has changed but an interrupted save may leave the
+        file partially written. A full save is made if the file is mapped by
+        the buffer since rewriting it in place would change the mapped
+        contents.
+
+        """
+        sp = self._savepoint
+        if incremental and sp is not None and sp.matches(path) and \
+                sp.identity[:2] != self._map_identity:
+            n = save_in_place(
+                path, sp.clean, len(self), lambda fd: self.writeto(fd, sp.clean)
+            )
+        else:
+            n = save_atomically(path, self.writeto)
+        self._set_savepoint(path)
+        return n
+
+    def readfrom(self, f, chunk_size=None, max_len=None):
+        """Append everything which can currently be read from *f* and
+        return the number of bytes appended. *f* may be a file descriptor or a
+        file object. Reading stops at the end of the file or, if *f* is
+        non-blocking, when no more data is available.
+
+        Chunks of *chunk_size* bytes, or a default size if it is None, are
+        read straight into the gap, which is kept at the end of the buffer,
+        via readinto() or os.readv() where available.
+
+        If *max_len* is not None, the oldest contents are discarded after
+        each chunk so that the buffer holds at most *max_len* bytes, as in a
+        ring buffer.
+
+        """
+        total = 0
+        while True:
+            n = self._read_chunk(f, chunk_size)
+            if n == 0:
+                return total
+            total += n
+            if max_len is not None and len(self) > max_len:
+                del self[:len(self) - max_len]
+
+    def follow(self, f, chunk_size=None, max_len=None, interval=0.5):
+        """Return an iterator which follows *f* as it grows, in the manner of
+        tail -f. Each step calls readfrom() with *chunk_size* and *max_len*
+        and yields the number of bytes appended, first sleeping for
+        *interval* seconds if there were none. The iterator never finishes.
+
+        """
+        return poll_reads(
+            lambda: self.readfrom(f, chunk_size, max_len), interval
+        )
+
+    def __buffer__(self, flags):
+        # Python 3.12+ buffer protocol support. Unlike getbuffer(), the gap
+        # is left where it is and the contents are copied if they are not
+        # already contiguous.
+        # pylint: disable=unused-argument
+        ranges = self._storage_ranges(0, len(self))
+        if len(ranges) > 1:
+            return memoryview(self[:])
+        storage, lo, hi = ranges[0] if ranges else (self._ba, 0, 0)
+        with memoryview(storage) as mv:
+            return mv[lo:hi].toreadonly()
+
     # PRIVATE METHODS
 
     def _move_gap(self, new_start):
-        """Move the gap to a new starting index *new_start*."""
+        """Move the gap to a new starting index *new_start*.
+
+        The bytes between the old and new gap positions are shifted across the
+        gap with a single block move. If _MOVE_REBUILD_THRESHOLD is not None,
+        moves which are longer than that many bytes and which cover more than
+        _MOVE_REBUILD_FRACTION of the contents rebuild the buffer around the
+        new gap position instead.
+
+        """
         # check index
         if new_start < 0 or new_start > len(self):
             raise IndexError('invalid start index: %s' % new_start)
+        if self._map is not None:
+            new_start = self._cover(new_start, new_start)
 
         if self._gap_start == new_start:
             # do nothing
             return
 
-        # We need to copy in a defined order depending on where new_start is in
-        # relation to the existing start point.
+        distance = abs(new_start - self._gap_start)
+        threshold = self._MOVE_REBUILD_THRESHOLD
+        if threshold is not None and distance > threshold and \
+                distance > self._MOVE_REBUILD_FRACTION * len(self):
+            self._rebuild(new_start, self._gap_size)
+            return
+
+        # Slice assignment between memoryviews of the same object is a single
+        # memmove() so the overlapping source and destination are fine.
         gs = self._gap_size
         if new_start < self._gap_start:
-            for idx in range(self._gap_start-1, new_start-1, -1):
-                self._ba[idx + gs] = self._ba[idx]
+            self._preserve(new_start + gs, self._gap_end)
         else:
-            for idx in range(self._gap_end, new_start + gs):
-                self._ba[idx - gs] = self._ba[idx]
+            self._preserve(self._gap_start, new_start)
+        with memoryview(self._ba) as mv:
+            if new_start < self._gap_start:
+                mv[new_start + gs:self._gap_end] = mv[new_start:self._gap_start]
+            else:
+                mv[self._gap_start:new_start] = mv[self._gap_end:new_start + gs]
         self._gap_start, self._gap_end = new_start, new_start + gs
 
+    def _rebuild(self, gap_start, gap_size):
+        """Replace the underlying byte array with a newly allocated one holding
+        the same contents but with a gap of *gap_size* bytes starting at index
+        *gap_start*.
+
+        """
+        n, old_start, old_size = \
+            len(self._ba) - self._gap_size, self._gap_start, self._gap_size
+        ba = bytearray(n + gap_size)
+        with memoryview(self._ba) as src, memoryview(ba) as dst:
+            # copy [0, gap_start) to the start of the new array and
+            # [gap_start, n) to just past the new gap
+            for lo, hi, offset in ((0, gap_start, 0), (gap_start, n, gap_size)):
+                pre_hi, post_lo = min(hi, old_start), max(lo, old_start)
+                if lo < pre_hi:
+                    dst[lo + offset:pre_hi + offset] = src[lo:pre_hi]
+                if post_lo < hi:
+                    dst[post_lo + offset:hi + offset] = \
+                        src[post_lo + old_size:hi + old_size]
+        self._ba = ba
+        self._gap_start, self._gap_end = gap_start, gap_start + gap_size
+
+        # snapshots keep the old array to themselves
+        self._snapshots = []
+
+    def _line_index(self):
+        """Return the line index, creating it if necessary."""
+        if self._lines is None:
+            self._lines = lineindex(self)
+            self._listeners.append(self._lines)
+        return self._lines
+
+    def _mark_set(self):
+        """Return the set of marks, creating it if necessary."""
+        if self._marks is None:
+            self._marks = markset(len(self))
+            self._listeners.append(self._marks)
+        return self._marks
+
+    def _set_savepoint(self, path):
+        """Record that the contents have just been saved to or loaded from
+        the file at *path*.
+
+        """
+        if self._savepoint is None:
+            self._savepoint = savepoint(path, len(self))
+            self._listeners.append(self._savepoint)
+        else:
+            self._savepoint.reset(path, len(self))
+
+    def _started_journal(self):
+        """Return the journal, raising ValueError if there is none."""
+        if self._journal is None:
+            raise ValueError('no journal has been started')
+        return self._journal
+
+    def _journal_capture(self, start, stop):
+        """Return the contents between *start* and *stop* in a form which
+        the journal can later restore and their size in bytes.
+
+        """
+        data = self[start:stop]
+        return data, len(data)
+
+    @staticmethod
+    def _journal_join(a, b):
+        """Concatenate two values returned by _journal_capture()."""
+        return a + b
+
+    def _journal_restore(self, index, data):
+        """Insert a value returned by _journal_capture() at *index*."""
+        self.insert_bytes(index, data)
+
+    def _notify_insert(self, start, stop):
+        """Tell listeners that the bytes between *start* and *stop* have
+        been inserted.
+
+        """
+        for listener in self._listeners:
+            listener.on_insert(self, start, stop)
+
+    def _notify_delete(self, start, stop):
+        """Tell listeners that the bytes between *start* and *stop* are
+        about to be deleted.
+
+        """
+        for listener in self._listeners:
+            listener.on_delete(self, start, stop)
+
+    def _delete(self, start, stop):
+        """Delete the contents between indices *start* and *stop* by growing
+        the gap over them.
+
+        """
+        if stop <= start:
+            # a nop
+            return
+
+        assert stop > start
+        assert start >= 0 and start < len(self)
+        assert stop >= 0 and stop <= len(self)
+
+        self._notify_delete(start, stop)
+        if self._map is not None:
+            start, stop = self._unmap_range(start, stop)
+            if stop <= start:
+                return
+
+        n_to_del = stop - start
+        if stop == self._gap_start:
+            # We can just grow the gap towards the start.
+            self._gap_start -= n_to_del
+        elif start == self._gap_start:
+            # We can just grow the gap towards the end.
+            self._gap_end += n_to_del
+        else:
+            if start == 0 and stop < self._gap_start:
+                # Deleting from the start of a bytearray just advances its
+                # start, which is cheaper than moving the gap. This is how a
+                # ring buffer discards the oldest contents.
+                try:
+                    del self._ba[:stop]
+                except BufferError:
+                    pass
+                else:
+                    self._gap_start -= stop
+                    self._gap_end -= stop
+                    return
+
+            # Move the gap so that the sequence to delete is just
+            # at the end of the gap
+            self._move_gap(self._n_head + start)
+
+            # grow the gap to cover it
+            self._gap_end += n_to_del
+
+    def _set_extended_slice(self, start, stop, step, v):
+        """Replace the elements in range(start, stop, step) with the elements
+        of *v* which must be of the same length.
+
+        """
+        r = range(start, stop, step)
+        with self._source_view(v) as src:
+            v = bytearray(src)
+        if len(v) != len(r):
+            raise ValueError(
+                'attempt to assign sequence of size %d to extended slice of '
+                'size %d' % (len(v), len(r))
+            )
+        if len(r) == 0:
+            return
+
+        # report the overwritten span as being deleted and re-inserted
+        lo, hi = min(r[0], r[-1]), max(r[0], r[-1]) + 1
+        self._notify_delete(lo, hi)
+        n_head = lo - self._cover(lo, hi)
+        for idx, elem in zip(r, v):
+            ba_idx = self._idx_to_ba(idx - n_head)
+            self._preserve(ba_idx, ba_idx + 1)
+            self._ba[ba_idx] = elem
+        self._notify_insert(lo, hi)
+
+    def _reserve(self, index, n):
+        """Move the gap to start at *index* and grow it, if necessary, so
+        that it is at least *n* bytes long.
+
+        """
+        self._move_gap(index)
+        if self._gap_size >= n:
+            return
+
+        # for a buffer created by from_file(), only the window is considered
+        length = len(self._ba) - self._gap_size
+        needed = n - self._gap_size
+        grow = max(needed, self._growth(length, needed, self._last_growth))
+        self._last_growth = grow
+        try:
+            self._ba[self._gap_end:self._gap_end] = self._gap_fill(grow)
+        except BufferError:
+            # there are views on the storage which stop it being resized in
+            # place so move to a new array
+            self._rebuild(self._gap_start, self._gap_size + grow)
+        else:
+            self._gap_end += grow
+
+    def _source_view(self, data):
+        """Return a memoryview onto the bytes of *data*, which may be any
+        object supporting the buffer protocol or an iterable of integers.
+
+        """
+        if isinstance(data, int):
+            # bytearray() would take this as a length
+            raise TypeError('can assign only bytes, buffers, or iterables of '
+                            'ints in range(0, 256)')
+        try:
+            src = memoryview(data)
+        except TypeError:
+            src = memoryview(bytearray(data))
+
+        if src.obj is self._ba or src.obj is self:
+            # *data* is a view on our own storage which moving the gap would
+            # scramble so take a copy of it first
+            copy = memoryview(src.tobytes())
+            src.release()
+            src = copy
+        return src
+
+    def _write_gap(self, index, src):
+        """Copy the memoryview *src* into the start of the gap, which must be
+        at *index* and large enough, and tell listeners.
+
+        """
+        n = src.nbytes
+        self._preserve(self._gap_start, self._gap_start + n)
+        self._ba[self._gap_start:self._gap_start + n] = src
+        self._gap_start += n
+        self._notify_insert(index, index + n)
+
+    def _read_chunk(self, f, chunk_size=None):
+        """Read up to *chunk_size* bytes, or a default size if it is None,
+        from *f* straight into the gap after moving it to the end, tell
+        listeners and return the number of bytes read.
+
+        """
+        chunk_size = chunk_size if chunk_size is not None \
+            else self._READ_CHUNK_SIZE
+        if chunk_size < 1:
+            raise ValueError('chunk size must be positive: %r' % (chunk_size,))
+        index = len(self)
+        self._reserve(index, chunk_size)
+        self._preserve(self._gap_start, self._gap_start + chunk_size)
+        with memoryview(self._ba) as mv:
+            view = mv[self._gap_start:self._gap_start + chunk_size]
+            try:
+                n = read_into(f, view)
+            finally:
+                view.release()
+        if n > 0:
+            self._gap_start += n
+            self._notify_insert(index, index + n)
+        return n
+
+    def _preserve(self, start, stop):
+        """Tell any snapshots sharing the underlying storage that the bytes
+        between storage indices *start* and *stop* are about to be
+        overwritten.
+
+        """
+        # pylint: disable=protected-access
+        if len(self._snapshots) == 0 or start >= stop:
+            return
+        live = []
+        for ref in self._snapshots:
+            s = ref()
+            if s is not None and s._shares(self._ba):
+                s._preserve(start, stop)
+                live.append(ref)
+        self._snapshots = live
+
+    def _maybe_shrink_gap(self):
+        """Shrink the gap back to the size the growth strategy would give it
+        if it has become larger than the shrink fraction of the contents.
+
+        """
+        if self._shrink_fraction is None:
+            return
+        gap_size = self._gap_size
+        length = len(self._ba) - gap_size
+        if gap_size <= self._shrink_fraction * length:
+            return
+        keep = self._growth(length, 1, 0)
+        if keep >= gap_size:
+            return
+
+        try:
+            del self._ba[self._gap_start + keep:self._gap_end]
+        except BufferError:
+            # there are views on the storage which stop it being resized so
+            # leave the gap as it is
+            return
+        self._gap_end = self._gap_start + keep
+        self._last_growth = 0
+
+    def _gap_fill(self, n):
+        """Return *n* bytes with which to fill new gap space."""
+        return bytearray((self._GAP_BYTE,)) * n
+
+    def _ba_slices(self, r):
+        """Split the range of indices *r* into at most two slices of the
+        underlying byte array, one for each side of the gap, which give the
+        elements of *r* in order when concatenated.
+
+        """
+        gs, gap_size = self._gap_start, self._gap_size
+
+        # Find how many leading elements of r lie on the same side of the gap
+        # as r.start. Since r is monotonic, the remaining ones are on the
+        # other side.
+        if r.step > 0:
+            n_first = len(range(r.start, min(r.stop, gs), r.step))
+        else:
+            n_first = len(range(r.start, max(r.stop, gs - 1), r.step))
+
+        slices = []
+        for sub_r in (r[:n_first], r[n_first:]):
+            if len(sub_r) == 0:
+                continue
+            # shift indices past the gap, being careful that a negative stop
+            # means "run off the start" and not "count from the end"
+            offset = gap_size if sub_r[0] >= gs else 0
+            stop = sub_r.stop + offset
+            slices.append(slice(
+                sub_r.start + offset, stop if stop >= 0 else None, sub_r.step
+            ))
+        return slices
+
+    def _search_range(self, i, j):
+        """Convert the optional slice bounds *i* and *j* into a start and stop
+        index in the same way as bytearray's searching methods. The start
+        index may be greater than the stop index or than len(self).
+
+        """
+        n = len(self)
+        start = 0 if i is None else (max(0, i + n) if i < 0 else i)
+        stop = n if j is None else (max(0, j + n) if j < 0 else min(j, n))
+        return start, stop
+
+    @staticmethod
+    def _as_needle(sub):
+        """Convert a search argument into a bytes object. Integers search for
+        the corresponding single byte as for bytearray.
+
+        """
+        if isinstance(sub, int):
+            return bytes(bytearray((sub,)))
+        return bytes(sub)
+
+    def _find_straddling(self, sub, start, stop, boundary, last):
+        """Return the index of the first (or *last*) occurrence of *sub*
+        within [start, stop) which straddles index *boundary*, such as the
+        gap, or -1 if there is none. Only a window of 2*len(sub) - 2 bytes
+        around the boundary is copied.
+
+        """
+        n = len(sub)
+        lo, hi = max(start, boundary - n + 1), min(stop, boundary + n - 1)
+        if n < 2 or lo >= boundary or hi <= boundary or hi - lo < n:
+            return -1
+
+        # any match in the window must straddle the boundary since neither
+        # side of the window is long enough to hold one
+        window = self[lo:hi]
+        f = window.rfind(sub) if last else window.find(sub)
+        return f + lo if f != -1 else -1
+
+    def _find_all(self, sub, start, stop):
+        """Implementation of finditer() with start and stop already
+        normalised for a buffer which is not changed while the returned
+        iterator is in use.
+
+        """
+        if len(sub) == 0:
+            yield from range(start, stop + 1)
+            return
+
+        # As for find(), look in each stretch of storage in turn and check
+        # once for a match straddling each boundary. pos is the lowest index
+        # at which the next match may start and offset is the index of the
+        # start of the stretch.
+        pos = offset = start
+        for idx, (storage, lo, hi) in enumerate(
+                self._storage_ranges(start, stop)):
+            if idx > 0:
+                f = self._find_straddling(sub, pos, stop, offset, last=False)
+                if f != -1:
+                    yield f
+                    pos = f + len(sub)
+            f = storage.find(sub, lo + max(0, pos - offset), hi)
+            while f != -1:
+                yield f - lo + offset
+                pos = f - lo + offset + len(sub)
+                f = storage.find(sub, f + len(sub), hi)
+            offset += hi - lo
+
+    def _search_regex(self, pattern, start, stop, overlap):
+        """Implementation of search() with start and stop already
+        normalised.
+
+        """
+        # Search each stretch of storage in turn. The boundary at the end of
+        # each stretch other than the last is handled in the same way as the
+        # gap.
+        ranges = self._storage_ranges(0, len(self)) or [(self._ba, 0, 0)]
+        pos, offset = start, 0
+        # Matches in a stretch which start at or before fp_start and end
+        # before fp_stop lie well within the stitched window at the previous
+        # boundary, which ruled them out. They can only have been found
+        # without the context before the boundary, e.g. for a negative
+        # lookbehind, and are skipped.
+        fp_start, fp_stop = -1, -1
+
+        def search_stretch(view, offset, pos, endpos):
+            m = pattern.search(view, pos - offset, endpos - offset)
+            while m is not None and m.start() + offset <= fp_start and \
+                    m.end() + offset < fp_stop:
+                m = pattern.search(view, m.start() + 1, endpos - offset)
+            return m
+
+        for idx, (storage, lo, hi) in enumerate(ranges):
+            # offset and end are the indices of the stretch in the contents
+            end = offset + hi - lo
+            if end + overlap <= pos and idx < len(ranges) - 1:
+                # too far before pos for lookbehind to reach across
+                offset = end
+                continue
+            with memoryview(storage) as mv:
+                view = mv[lo:hi]
+            if stop <= end or idx == len(ranges) - 1:
+                # the boundary plays no part
+                m = search_stretch(view, offset, pos, stop)
+                return gapmatch(m, offset) if m is not None else None
+
+            # A match in the stretch which starts before the window is too far
+            # from the boundary to be affected by it.
+            w_lo = max(pos, end - overlap)
+            if pos < end:
+                m = search_stretch(view, offset, pos, end)
+                if m is not None and m.start() + offset < w_lo:
+                    return gapmatch(m, offset)
+
+            # Otherwise search a stitched window around the boundary. Include
+            # some context before the window so that lookbehind and '^'
+            # behave, and after it so that a match starting up to overlap
+            # bytes after the boundary is not cut short by the end of the
+            # window.
+            ctx_lo, w_hi = max(0, w_lo - overlap), min(stop, end + 2 * overlap)
+            m = pattern.search(self[ctx_lo:w_hi], w_lo - ctx_lo)
+            if m is None and w_hi == stop:
+                return None
+            m_start = m.start() + ctx_lo if m is not None else None
+            if m is not None and (
+                    m_start <= end or w_hi == stop or (
+                        m_start <= end + overlap and
+                        # '$' may match before a final newline
+                        m.end() + ctx_lo < w_hi - 1
+                    )):
+                return gapmatch(m, ctx_lo)
+
+            # Finally, carry on with the next stretch. A match cut short by
+            # the end of the window is longer than overlap bytes so its left
+            # context does not matter. Otherwise the window has ruled out
+            # shorter matches near the boundary.
+            if m is not None and m_start <= end + overlap:
+                pos, fp_start, fp_stop = m_start, -1, -1
+            else:
+                pos, fp_start, fp_stop = \
+                    max(pos, end + 1), end + overlap, w_hi - 1
+            offset = end
+            if pos > stop:
+                return None
+        return None
+
+    def _matches_at(self, pos, view):
+        """Return True if the contents starting at index *pos* begin with
+        the bytes in the memoryview *view*. The contents must be at least
+        len(view) + pos long.
+
+        """
+        offset = 0
+        for storage, lo, hi in self._storage_ranges(pos, pos + len(view)):
+            n = hi - lo
+            if storage is self._ba:
+                # bytearray.startswith() with a buffer compares with memcmp()
+                if not storage.startswith(view[offset:offset + n], lo):
+                    return False
+            elif memoryview(storage)[lo:hi] != view[offset:offset + n]:
+                return False
+            offset += n
+        return True
+
+    def _layout(self):
+        """Return a value which changes whenever the contents are moved
+        within the storage.
+
+        """
+        return (
+            self._ba, self._gap_start, self._gap_end, self._map,
+            self._head_start, self._n_head, self._n_tail
+        )
+
+    def _search_all(self, pattern, start, stop, overlap):
+        """Implementation of iter_search() with start and stop already
+        normalised for a buffer which is not changed while the returned
+        iterator is in use.
+
+        """
+        ranges = self._storage_ranges(0, len(self)) or [(self._ba, 0, 0)]
+        pos = start
+        while pos <= stop:
+            # find the stretch of storage holding pos
+            offset = 0
+            for idx, (storage, lo, hi) in enumerate(ranges):
+                end = offset + hi - lo
+                if pos < end or idx == len(ranges) - 1:
+                    break
+                offset = end
+            last = stop <= end or idx == len(ranges) - 1
+
+            # Away from the boundaries, matches are the same as those found
+            # by _search_regex() and can be taken from a single scan of the
+            # stretch. Near the previous boundary there may not be enough
+            # context before pos and a match within overlap bytes of the
+            # next may straddle it.
+            if idx == 0 or pos >= offset + max(1, overlap):
+                with memoryview(storage) as mv:
+                    view = mv[lo:hi]
+                safe = stop + 1 if last else end - overlap
+                empty_at = -1
+                for m in pattern.finditer(
+                        view, pos - offset, (stop if last else end) - offset):
+                    m_start = m.start() + offset
+                    # After an empty match, re's finditer() allows a match
+                    # to start at the same index but search() does not.
+                    if m_start >= safe or m_start == empty_at:
+                        break
+                    yield gapmatch(m, offset)
+                    pos = m.end() + offset
+                    empty_at = pos if m.end() == m.start() else -1
+                    pos += m.end() == m.start()
+                else:
+                    if last:
+                        return
+
+            m = self._search_regex(pattern, pos, stop, overlap)
+            if m is None:
+                return
+            yield m
+            pos = m.end() if m.end() > m.start() else m.end() + 1
+
+    def _storage_ranges(self, start, stop):
+        """Split the contents between *start* and *stop* into a list of
+        non-empty (storage, lo, hi) ranges which give the contents in order
+        when concatenated. The storage is either the underlying byte array or
+        the mapping of a file created by from_file(). The list is empty if
+        *stop* is not greater than *start*.
+
+        """
+        gs, ge = self._gap_start, self._gap_end
+        if self._map is None:
+            ranges = []
+            if start < min(stop, gs):
+                ranges.append((self._ba, start, min(stop, gs)))
+            if stop > max(start, gs):
+                ranges.append(
+                    (self._ba, max(start, gs) + ge - gs, stop + ge - gs)
+                )
+            return ranges
+
+        n_head = self._n_head
+        window_stop = n_head + len(self._ba) - ge + gs
+        ranges = []
+        if start < min(stop, n_head):
+            ranges.append((
+                self._map, self._head_start + start,
+                self._head_start + min(stop, n_head)
+            ))
+        lo, hi = max(start, n_head) - n_head, min(stop, window_stop) - n_head
+        if lo < min(hi, gs):
+            ranges.append((self._ba, lo, min(hi, gs)))
+        if hi > max(lo, gs):
+            ranges.append((self._ba, max(lo, gs) + ge - gs, hi + ge - gs))
+        lo = max(start, window_stop)
+        if lo < stop:
+            ranges.append((
+                self._map, self._tail_start + lo - window_stop,
+                self._tail_start + stop - window_stop
+            ))
+        return ranges
+
+    def _cover(self, start, stop):
+        """Widen or move the window of a buffer created by from_file() so
+        that it includes the contents between *start* and *stop* and return
+        the index of *start* within the window. At least _MAP_CHUNK_SIZE bytes
+        are taken from the mapping at a time so that a run of edits moving
+        away from the window does not have to widen it on every edit.
+
+        """
+        if self._map is None:
+            return start
+        n_head, n_tail = self._n_head, self._n_tail
+        window_stop = n_head + len(self._ba) - self._gap_size
+        if window_stop == n_head and \
+                self._head_start + n_head == self._tail_start:
+            # The window is empty and the head and tail are adjacent in the
+            # file, as they are to begin with, and so the window can move to
+            # *start* without copying anything.
+            self._n_head, self._n_tail = start, n_head + n_tail - start
+            self._tail_start = self._head_start + start
+            n_head, n_tail, window_stop = start, self._n_tail, start
+        take_head, take_tail = 0, 0
+        if start < n_head:
+            take_head = min(n_head, max(n_head - start, self._MAP_CHUNK_SIZE))
+        if stop > window_stop:
+            take_tail = min(
+                n_tail, max(stop - window_stop, self._MAP_CHUNK_SIZE)
+            )
+        if take_head > 0 or take_tail > 0:
+            self._unmap(take_head, take_tail)
+        return start - self._n_head
+
+    def _unmap(self, take_head, take_tail):
+        """Copy the last *take_head* bytes of the mapped head and the first
+        *take_tail* bytes of the mapped tail into the window.
+
+        """
+        head_stop = self._head_start + self._n_head
+        with memoryview(self._map) as mv:
+            head = mv[head_stop - take_head:head_stop]
+            tail = mv[self._tail_start:self._tail_start + take_tail]
+            try:
+                self._ba[0:0] = head
+                self._ba.extend(tail)
+            except BufferError:
+                # there are views on the storage which stop it being resized in
+                # place so move to a new array, leaving the old one to any
+                # snapshots
+                ba = bytearray(head)
+                ba.extend(self._ba)
+                ba.extend(tail)
+                self._ba = ba
+                self._snapshots = []
+            head.release()
+            tail.release()
+        self._gap_start += take_head
+        self._gap_end += take_head
+        self._n_head -= take_head
+        self._tail_start += take_tail
+        self._n_tail -= take_tail
+
+    def _unmap_range(self, start, stop):
+        """Remove the parts of the contents between *start* and *stop* of a
+        buffer created by from_file() which lie at either end of the mapped
+        head or tail by trimming them. Return the range of the window which
+        remains to be deleted, widening the window if necessary.
+
+        """
+        window_stop = self._n_head + len(self._ba) - self._gap_size
+        if stop > window_stop and (start <= window_stop or stop == len(self)):
+            lo = max(start, window_stop)
+            if lo == window_stop:
+                self._tail_start += stop - lo
+            self._n_tail -= stop - lo
+            stop = lo
+
+        n_head = self._n_head
+        if start < n_head and (stop >= n_head or start == 0):
+            hi = min(stop, n_head)
+            if hi == n_head:
+                self._n_head = start
+            else:
+                self._head_start += hi
+                self._n_head -= hi
+            stop -= hi - start
+
+        if stop <= start:
+            return 0, 0
+        n = stop - start
+        start = self._cover(start, stop)
+        return start, start + n
+
     @property
     def _gap_size(self):
         return self._gap_end - self._gap_start
@@ -1,11 +1,135 @@
-from __future__ import unicode_literals, division
-
-from builtins import range
-
 import codecs
-from collections import MutableSequence, deque
+import re
+import sys
+from collections import deque
+from collections.abc import MutableSequence
+from itertools import islice
 
 from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.fileio import poll_reads
+from bytegapbuffer.grapheme import graphemeindex
+from bytegapbuffer.journal import journal, _edit_group
+from bytegapbuffer.marks import markset
+from bytegapbuffer.runindex import fixedindex, runindex
+
+# Size of chunks fed to the fast indexers
+_INDEX_CHUNK_SIZE = 1<<20
+
+# Size of chunks decoded when iterating
+_DECODE_CHUNK_SIZE = 64<<10
+
+# Translation table mapping UTF-8 lead bytes to the number of bytes in the
+# sequence they start. Continuation bytes are deleted by translating with
+# _UTF8_CONTINUATION_BYTES.
+_UTF8_LEAD_BYTE_WIDTHS = bytes(bytearray(
+    [1] * 0x80 + [0] * 0x40 + [2] * 0x20 + [3] * 0x10 + [4] * 0x10
+))
+_UTF8_CONTINUATION_BYTES = bytes(bytearray(range(0x80, 0xC0)))
+_UTF8_RUN_RE = re.compile(b'(\x01+)|(\x02+)|(\x03+)|(\x04+)')
+
+# Matches runs of code points of equal UTF-8 width with the width given by the
+# index of the matching group. Lone surrogates cannot be encoded and are
+# replaced by a single byte.
+_UTF8_TEXT_RUN_RE = re.compile(
+    '([\x00-\x7f\ud800-\udfff]+)|([\x80-\u07ff]+)|'
+    '([\u0800-\ud7ff\ue000-\uffff]+)|([\U00010000-\U0010ffff]+)'
+)
+
+def _index_text(text, encoded, encoding, decoder):
+    """Index *encoded*, the result of encoding *text* with the 'replace' error
+    handler, returning the same result as _index_byte_array. For UTF-8 and
+    single byte encodings the index is formed without decoding *encoded*.
+
+    """
+    name = codecs.lookup(encoding).name
+    if name == 'utf-8':
+        index = deque(
+            (match.lastindex, match.end() - match.start())
+            for match in _UTF8_TEXT_RUN_RE.finditer(text)
+        )
+        return index, len(text)
+    elif _is_single_byte(name):
+        return deque([(1, len(encoded))] if len(encoded) > 0 else []), \
+            len(encoded)
+    return _index_byte_array(encoded, decoder)
+
+def _buffer_segments(buf, start, stop):
+    """Return the bytes of *buf* between *start* and *stop* as a sequence of
+    objects supporting the buffer protocol without copying if possible.
+
+    """
+    if hasattr(buf, 'segments'):
+        return buf.segments(start, stop)
+    return (memoryview(buf)[start:stop],)
+
+def _index_buffer(buf, encoding, decoder):
+    """Index *buf* returning the same result as _index_byte_array. UTF-8 and
+    single byte encodings are indexed in bulk. Other encodings, and UTF-8
+    which is not valid, are indexed by *decoder*.
+
+    """
+    name = codecs.lookup(encoding).name
+    if name == 'utf-8':
+        try:
+            return _index_utf8(buf)
+        except UnicodeDecodeError:
+            pass
+    elif _is_single_byte(name):
+        return deque([(1, len(buf))] if len(buf) > 0 else []), len(buf)
+    return _index_byte_array(buf, decoder)
+
+def _fixed_width(encoding):
+    """Return the number of bytes per rune if every rune in *encoding* is
+    encoded with the same number of bytes or 0 otherwise.
+
+    """
+    name = codecs.lookup(encoding).name
+    if _is_single_byte(name):
+        return 1
+    elif name in ('utf-32-le', 'utf-32-be'):
+        return 4
+    return 0
+
+def _is_single_byte(name):
+    """Return True if the codec *name* maps each byte to exactly one rune."""
+    if name in ('ascii', 'iso8859-1'):
+        return True
+    # charmap codecs each define a 256 entry decoding table
+    module = sys.modules.get(getattr(codecs.lookup(name).decode, '__module__',
+                                     None))
+    table = getattr(module, 'decoding_table', None)
+    return table is not None and len(table) == 256
+
+def _index_utf8(buf):
+    """Index *buf* as UTF-8 by classifying lead bytes chunk by chunk. Raises
+    UnicodeDecodeError if *buf* is not valid UTF-8.
+
+    """
+    index = deque()
+    length = 0
+    validator = codecs.getincrementaldecoder('utf-8')('strict')
+    for chunk_start in range(0, len(buf), _INDEX_CHUNK_SIZE):
+        chunk = buf[chunk_start:chunk_start+_INDEX_CHUNK_SIZE]
+        validator.decode(chunk)
+
+        # one width byte per rune
+        widths = chunk.translate(
+            _UTF8_LEAD_BYTE_WIDTHS, _UTF8_CONTINUATION_BYTES
+        )
+        runs = [
+            (match.lastindex, match.end() - match.start())
+            for match in _UTF8_RUN_RE.finditer(widths)
+        ]
+
+        # merge runs which straddle chunks
+        if len(runs) > 0 and len(index) > 0 and index[-1][0] == runs[0][0]:
+            index[-1] = (runs[0][0], index[-1][1] + runs[0][1])
+            del runs[0]
+        index.extend(runs)
+        length += len(widths)
+    validator.decode(b'', True)
+
+    return index, length
 
 def _index_byte_array(buf, decoder):
     index = deque()
@@ -41,6 +165,50 @@ def _index_byte_array(buf, decoder):
 
     return index, length
 
+class _edit_sweep(object):
+    """Listens to the underlying buffer of the codedstring *cs* while
+    codedstring.apply_edits() applies the byte edits corresponding to the
+    sorted rune edits *prepared* and keeps the index of *cs* and its
+    listeners in step with them.
+
+    """
+    def __init__(self, cs, prepared):
+        self._cs = cs
+        # the edits to which the buffer has yet to be told of a change
+        self._pending = deque(
+            (start, stop, encoded) for start, stop, encoded in prepared
+            if start < stop or len(encoded[0]) > 0
+        )
+        # the change in length of the string from the edits made so far
+        self._delta = 0
+
+    def on_insert(self, target, start, stop):
+        # pylint: disable=unused-argument
+        self._finish()
+
+    def on_delete(self, target, start, stop):
+        # pylint: disable=unused-argument
+        start, stop, encoded = self._pending[0]
+        self._cs._notify_delete(start + self._delta, stop + self._delta)
+        if len(encoded[0]) == 0:
+            self._finish()
+
+    def _finish(self):
+        """Update the index for the next edit once its bytes have been
+        replaced and tell the listeners of any runes inserted.
+
+        """
+        # pylint: disable=protected-access
+        cs = self._cs
+        start, stop, (encoded_v, v_idx, v_len) = self._pending.popleft()
+        start, stop = start + self._delta, stop + self._delta
+        byte_start, byte_stop = cs._index.splice(start, stop, v_idx)
+        cs._frontier += len(encoded_v) - (byte_stop - byte_start)
+        cs._length += v_len - (stop - start)
+        self._delta += v_len - (stop - start)
+        if v_len > 0:
+            cs._notify_insert(start, start + v_len)
+
 class codedstring(MutableSequence):
     """A wrapper around a bytegapbuffer which is intended to manage coded
     Unicode strings.
@@ -62,23 +230,56 @@ class codedstring(MutableSequence):
     in all likelihood have long runs of two byte per rune and three byte per
     rune sections.
 
+    If *fixed_width* is None, encodings in which every rune is encoded with
+    the same number of bytes, such as latin-1 and UTF-32-LE, are detected and
+    the mapping between rune and byte index is computed arithmetically in
+    constant time without indexing the buffer. Passing a number of bytes
+    forces this mode for other encodings, for example 2 to treat UTF-16-LE
+    as UCS-2 where each surrogate is a rune. Passing 0 disables the mode.
+
+    If *lazy* is True and the encoding is UTF-8, the buffer is indexed on
+    demand. Only the prefix of the buffer up to the highest rune accessed so
+    far is indexed, so opening a large buffer and looking at its start is
+    cheap. Operations which need the total length, such as len(), negative
+    indices, open ended slices and iteration, index the remainder of the
+    buffer. estimated_len() estimates the length without doing so and
+    index_more() extends the index incrementally, for example from an idle
+    callback. For other encodings *lazy* is ignored.
+
     The length of the sequence as returned by len() is measured in runes.
 
     """
 
     # Implementation note:
-    # The buffer index is represented as a sequence of (bpr, rune_count)
-    # tuples giving the number of bytes per rune (bpr) and number of runes in
-    # the run.
-
-    def __init__(self, bgb=None, encoding=None):
+    # The buffer index is represented as a runindex holding a sequence of
+    # (bpr, rune_count) tuples giving the number of bytes per rune (bpr) and
+    # number of runes in the run. Mapping between rune and byte indices is
+    # logarithmic in the number of runs. Fixed width encodings use a
+    # fixedindex with the same interface instead.
+    #
+    # The index covers the first _frontier bytes of the buffer, which is all
+    # of it once _complete is set. Before then _length is the number of runes
+    # indexed so far. Edits are always within the indexed prefix.
+
+    def __init__(self, bgb=None, encoding=None, fixed_width=None, lazy=False):
         self._buf = bgb if bgb is not None else bytegapbuffer()
         self._encoding = encoding if encoding is not None else 'utf-8'
+        self._fixed_width = fixed_width if fixed_width is not None \
+            else _fixed_width(self._encoding)
+        self._lazy = lazy and not self._fixed_width and \
+            codecs.lookup(self._encoding).name == 'utf-8'
 
-        self._index = []
+        self._index = self._new_index()
         self._length = 0
+        self._frontier = 0
+        self._complete = False
         self._form_initial_index()
 
+        self._listeners = []
+        self._graphemes = None
+        self._marks = None
+        self._journal = None
+
     @property
     def buffer(self):
         return self._buf
@@ -87,6 +288,163 @@ class codedstring(MutableSequence):
     def encoding(self):
         return self._encoding
 
+    @property
+    def fixed_width(self):
+        """The number of bytes per rune if the fixed width mode is in use or
+        None otherwise.
+
+        """
+        return self._fixed_width if self._fixed_width else None
+
+    def estimated_len(self):
+        """Return len(self) if the buffer has been indexed entirely or an
+        estimate extrapolated from the indexed prefix otherwise.
+
+        """
+        if self._complete:
+            return self._length
+        if self._frontier == 0:
+            return len(self._buf)
+        return int(self._length * len(self._buf) / self._frontier)
+
+    def index_more(self):
+        """Extend the index of a lazy codedstring by a chunk of the buffer.
+        Return True if some of the buffer remains to be indexed.
+
+        """
+        if not self._complete:
+            self._index_more()
+        return not self._complete
+
+    def utf16_offset(self, idx):
+        """Return the offset in UTF-16 code units of the rune at index *idx*,
+        which may be len(self). Raises ValueError if the encoding is not
+        UTF-8, UTF-16-LE, UTF-16-BE or a single byte encoding.
+
+        """
+        self._check_utf16()
+        idx = idx if idx >= 0 else len(self) + idx
+        self._index_to(idx)
+        return self._index.rune_to_unit(idx)
+
+    def map_utf16_offset(self, offset):
+        """Return the index of the rune which includes the UTF-16 code unit at
+        *offset*, which may be one past the final code unit. An offset within
+        a surrogate pair maps to the rune the pair encodes. Raises ValueError
+        as for utf16_offset().
+
+        """
+        self._check_utf16()
+        while not self._complete and self._index.units <= offset:
+            self._index_more()
+        return self._index.unit_to_rune(offset)
+
+    def grapheme_count(self):
+        """Return the number of grapheme clusters. See the grapheme module
+        for how clusters are determined.
+
+        The grapheme cluster index is formed on the first call to one of the
+        grapheme methods and is kept up to date thereafter.
+
+        """
+        return self._grapheme_index().grapheme_count()
+
+    def grapheme_index(self, idx):
+        """Return the index of the grapheme cluster containing the rune at
+        index *idx*, which may be len(self).
+
+        """
+        idx = idx if idx >= 0 else len(self) + idx
+        return self._grapheme_index().grapheme_index(idx)
+
+    def map_grapheme_index(self, n):
+        """Return the index of the first rune of grapheme cluster *n*, which
+        may be grapheme_count().
+
+        """
+        return self._grapheme_index().map_grapheme_index(n)
+
+    def add_mark(self, idx, left_gravity=False):
+        """Return a new mark at rune index *idx* which tracks that position
+        across subsequent modifications. See bytegapbuffer.marks.mark.
+        Creating the first mark of a lazy codedstring indexes it entirely.
+
+        """
+        return self._mark_set().add(idx, left_gravity)
+
+    def remove_mark(self, m):
+        """Stop tracking the mark *m*."""
+        self._mark_set().remove(m)
+
+    def marks(self, start=None, stop=None):
+        """Return a list of the marks whose rune index lies between *start*
+        and *stop* in ascending order. If *stop* is None, marks at the very
+        end of the string are included.
+
+        """
+        return self._mark_set().marks(start, stop)
+
+    def start_journal(self, max_bytes=None):
+        """Start recording modifications so that they can be undone and
+        return the journal, which works in runes. The underlying bytes and
+        index are restored exactly on undo. See bytegapbuffer.start_journal().
+        Starting the journal of a lazy codedstring indexes it entirely.
+
+        """
+        if self._journal is None:
+            self._index_all()
+            self._journal = journal(self, max_bytes)
+            self._listeners.append(self._journal)
+        else:
+            self._journal.max_bytes = max_bytes
+        return self._journal
+
+    def stop_journal(self):
+        """Stop recording modifications and discard the journal."""
+        if self._journal is not None:
+            self._listeners.remove(self._journal)
+            self._journal = None
+
+    def undo(self):
+        """See bytegapbuffer.undo()."""
+        return self._started_journal().undo()
+
+    def redo(self):
+        """See bytegapbuffer.redo()."""
+        return self._started_journal().redo()
+
+    def readfrom(self, f, chunk_size=None, max_len=None):
+        """Append everything which can currently be read from *f* to the
+        buffer and return the number of bytes appended. See
+        bytegapbuffer.readfrom(). The buffer must be a bytegapbuffer.
+
+        The index is extended after each chunk to cover just the new bytes
+        and any incomplete rune at the end of the string which they complete.
+        A lazy codedstring which has not been indexed to the end indexes the
+        new bytes on demand instead.
+
+        If *max_len* is not None, the oldest runes are discarded after each
+        chunk so that the string holds at most *max_len* runes.
+
+        """
+        # pylint: disable=protected-access
+        total = 0
+        while True:
+            old_len = len(self._buf)
+            n = self._buf._read_chunk(f, chunk_size)
+            if n == 0:
+                return total
+            total += n
+            self._extend_index(old_len)
+            if max_len is not None and len(self) > max_len:
+                del self[:len(self) - max_len]
+
+    def follow(self, f, chunk_size=None, max_len=None, interval=0.5):
+        """See bytegapbuffer.follow()."""
+        return poll_reads(
+            lambda: self.readfrom(f, chunk_size, max_len), interval
+        )
+
     def byte_slice(self, idx):
         """Return a slice for the underlying buffer corresponding to the rune at
         index idx. Raises IndexError if the index is invalid.
@@ -108,19 +466,11 @@ class codedstring(MutableSequence):
         if idx >= len(self._buf):
             raise IndexError('index out of range')
 
-        # walk the index until we have an entry in this range
-        byte_idx, rune_idx = 0, 0
-        for bpr, n_runes in self._index:
-            n_bytes = bpr * n_runes
-
-            if byte_idx <= idx and byte_idx + n_bytes > idx:
-                return rune_idx + (idx - byte_idx) // bpr
-
-            byte_idx += n_bytes
-            rune_idx += n_runes
-
-        # never reached
-        assert False
+        while self._frontier <= idx and not self._complete:
+            self._index_more()
+        byte_idx, rune_idx, _, entry = self._index.find_byte(idx)
+        bpr, _ = entry
+        return rune_idx + (idx - byte_idx) // bpr
 
     def __getitem__(self, k):
         if isinstance(k, int):
@@ -130,28 +480,16 @@ class codedstring(MutableSequence):
                 self._encoding, 'replace'
             )
         elif isinstance(k, slice):
-            if len(self) == 0:
+            start, stop, step = self._slice_indices(k)
+            if step != 1:
+                return ''.join(self.slice_iter(k))
+            if start >= stop:
                 return ''
-            start, stop, step = k.indices(len(self))
-            start = min(start, len(self))
-            stop = min(stop, len(self))
-
-            if start < len(self):
-                byte_start = self.byte_slice(start).start
-            else:
-                byte_start = len(self._buf)
 
-            if stop < len(self):
-                byte_stop = self.byte_slice(stop).start
-            else:
-                byte_stop = len(self._buf)
-
-            s = codecs.decode(
-                self._buf[byte_start:byte_stop], self._encoding, 'replace'
+            return codecs.decode(
+                self._buf[self._byte_offset(start):self._byte_offset(stop)],
+                self._encoding, 'replace'
             )
-            if step == 1 or step is None:
-                return s
-            return s[::step]
 
         raise TypeError('indexing not supported for %r' % (type(k),))
 
@@ -163,26 +501,24 @@ class codedstring(MutableSequence):
         no-no.
 
         """
-        start, stop, step = s.indices(len(self))
-        if start >= len(self):
-            return
+        start, stop, step = self._slice_indices(s)
+        if step < 0:
+            # decode the covered range forwards and walk it backwards
+            runes = list(self._iter_range(stop + 1, start + 1))
+            return iter(runes[::-1][::-step])
+        if step == 1:
+            return self._iter_range(start, stop)
+        return islice(self._iter_range(start, stop), 0, None, step)
+
+    def view(self, start=None, stop=None):
+        """Return a codedstringview onto the runes between *start* and *stop*.
+        Nothing is decoded until the view is iterated over or rendered.
 
-        bs = self.byte_slice(start)
-        decoder = self._new_decoder()
-        buf_len = len(self._buf)
-        n_runes = 0
-        n_to_output = stop - start
-        for byte_idx in range(bs.start, buf_len):
-            final = byte_idx == buf_len - 1
-            decoded_ch = decoder.decode(self._buf[byte_idx:byte_idx+1], final)
-            for c in decoded_ch:
-                if n_runes == n_to_output:
-                    raise StopIteration
-                if n_runes % step == 0:
-                    yield c
-                n_runes += 1
+        """
+        return codedstringview(self, start, stop)
 
     def __iter__(self):
+        self._index_all()
         byte_idx = 0
         for bpr, n_runes in self._index:
             slc = slice(byte_idx, byte_idx + bpr * n_runes)
@@ -192,6 +528,7 @@ class codedstring(MutableSequence):
             byte_idx += bpr * n_runes
 
     def __len__(self):
+        self._index_all()
         return self._length
 
     def __delitem__(self, k):
@@ -200,65 +537,38 @@ class codedstring(MutableSequence):
 
             # find the index entry for this rune index
             ie = self._find_index_entry_for_rune_index(k)
-            byte_idx, rune_idx, entry_idx, entry = ie
+            byte_idx, rune_idx, pos, entry = ie
             bpr, n_runes = entry
+            self._notify_delete(k, k + 1)
 
             # delete from underlying buffer
             assert k >= rune_idx
             byte_start = byte_idx + bpr * (k - rune_idx)
             byte_slice = slice(byte_start, byte_start + bpr)
             del self._buf[byte_slice]
+            self._frontier -= bpr
 
             # update entry
-            if n_runes > 1:
-                self._index[entry_idx] = (bpr, n_runes - 1)
-            else:
-                del self._index[entry_idx]
+            self._index.replace(
+                pos, [(bpr, n_runes - 1)] if n_runes > 1 else []
+            )
 
             # update length
             self._length -= 1
         elif isinstance(k, slice):
-            start, stop, _ = k.indices(len(self))
-            start = min(start, len(self))
-            stop = min(stop, len(self))
-
-            if start >= len(self):
-                # do nothing
-                return
-
+            start, stop, _ = self._slice_indices(k)
             n_to_delete = stop - start
-            if n_to_delete == 0:
+            if n_to_delete <= 0:
                 # do nothing
                 return
 
-            del_idx = start
-
-            # deleting one rune at a time may change the index entry but never
-            # change the starting indices
-            ie = self._find_index_entry_for_rune_index(del_idx)
-            byte_idx, rune_idx, entry_idx, entry = ie
-            for _ in range(n_to_delete):
-                entry = self._index[entry_idx]
-                bpr, n_runes = entry
-
-                # check that the entry still covers the deletion range
-                if del_idx >= rune_idx + n_runes:
-                    # need to re-scan index
-                    ie = self._find_index_entry_for_rune_index(del_idx)
-                    byte_idx, rune_idx, entry_idx, entry = ie
-                    bpr, n_runes = entry
+            self._notify_delete(start, stop)
 
-                assert del_idx >= rune_idx and del_idx < rune_idx + n_runes
-
-                byte_start = byte_idx + bpr * (del_idx - rune_idx)
-                byte_slice = slice(byte_start, byte_start + bpr)
-                del self._buf[byte_slice]
-
-                # update entry
-                if n_runes > 1:
-                    self._index[entry_idx] = (bpr, n_runes - 1)
-                else:
-                    del self._index[entry_idx]
+            # remove the span from the index and the corresponding bytes from
+            # the underlying buffer in one go
+            byte_start, byte_stop = self._index.splice(start, stop)
+            del self._buf[byte_start:byte_stop]
+            self._frontier -= byte_stop - byte_start
 
             # update length
             self._length -= n_to_delete
@@ -270,108 +580,437 @@ class codedstring(MutableSequence):
             self[k:k+1] = v
         elif isinstance(k, slice):
             # find start index
-            start, stop, _ = k.indices(len(self))
-            assert start <= len(self)
-            assert stop >= start
-
-            # delete items to replace
-            del self[start:stop]
-
-            # Encode the item using the encoding and then index it. This is a
-            # little inefficient since we decode for no good reason. A better
-            # solution would be to use an incremental encoder and build the
-            # index as we encode. For the moment we accept the additional decode
-            # overhead for the sake of simplicity.
-            encoded_v = codecs.encode(v, self._encoding, 'replace')
-            v_idx, v_len = _index_byte_array(encoded_v, self._new_decoder())
-
-            # handle special cases
-            if len(self._index) == 0:
-                # simple case if the index is currently empty :)
-                self._buf[:] = encoded_v
-                self._index = list(v_idx)
-                self._length = v_len
-                return
-            elif len(v_idx) == 0:
-                # nothing to add
-                return
-
-            # At this point we know there is at least one item in the current
-            # index and the index for the new value. Find the insertion point in
-            # the current index.
-            if start < len(self):
-                ie = self._find_index_entry_for_rune_index(start)
-                byte_idx, rune_idx, entry_idx, entry = ie
-
-                # split entry at insertion point
-                bpr, n_runes = entry
-                delta = start - rune_idx
-                assert delta >= 0 and delta < n_runes
-                head, tail = (bpr, delta), (bpr, n_runes - delta)
-
-                # prepend head to v_idx
-                if head[0] == v_idx[0][0]:
-                    v_idx[0] = (v_idx[0][0], v_idx[0][1] + head[1])
-                elif head[1] > 0:
-                    v_idx.appendleft(head)
-
-                # append tail to v_idx
-                if tail[0] == v_idx[-1][0]:
-                    v_idx[-1] = (v_idx[-1][0], v_idx[-1][1] + tail[1])
-                elif tail[1] > 0:
-                    v_idx.append(tail)
-
-                # insert encoded data
-                byte_idx += bpr * delta
-                self._buf[byte_idx:byte_idx] = encoded_v
-
-                # replace index entry
-                self._index[entry_idx:entry_idx+1] = v_idx
-
-                # increase length
-                self._length += v_len
-            else:
-                # this is a pure append
-                if self._index[-1][0] == v_idx[0][0]:
-                    self._index[-1] = (
-                        v_idx[0][0], v_idx[0][1] + self._index[-1][1]
-                    )
-                    v_idx.popleft()
-                self._buf[len(self._buf):] = encoded_v
-                self._index.extend(v_idx)
-                self._length += v_len
+            start, stop, _ = self._slice_indices(k)
+            stop = max(start, stop)
+            encoded = self._encode(v)
+
+            # a replacement is one undo step but a plain insertion or deletion
+            # may be coalesced with its neighbours
+            replacing = start < stop and encoded[2] > 0
+            with _edit_group(self._journal if replacing else None):
+                self._replace(start, stop, encoded)
         else:
             raise TypeError('deletion not supported for type: %r' % (type(k),))
 
+    def apply_edits(self, edits, gap=None):
+        """Apply a sequence of (start, stop, text) *edits* in a single pass
+        over the buffer. Each edit replaces the runes between *start* and
+        *stop* with the string *text*. Indices refer to the string before any
+        of the edits are applied. Edits may be given in any order but may not
+        overlap. Insertions at the same index are applied in the order given.
+
+        All of the edits are validated and encoded before any is applied:
+        IndexError is raised if an edit lies outside of the string, ValueError
+        if edits overlap and TypeError if some text cannot be encoded, in
+        which case the string is unchanged. If a journal has been started, the
+        edits are undone as a single step.
+
+        The gap in the buffer is left after the last edit or, if *gap* is not
+        None, before rune *gap* of the edited string. See
+        bytegapbuffer.apply_edits().
+
+        """
+        # Index a lazy string only as far as the edits reach.
+        edits = list(edits)
+        self._index_to(max((edit[1] for edit in edits), default=0))
+        length = self._length
+        prepared = []
+        for start, stop, text in edits:
+            if start < 0 or stop < start or stop > length:
+                raise IndexError('invalid edit range: %s to %s' % (start, stop))
+            prepared.append((start, stop, self._encode(text)))
+
+        prepared.sort(key=lambda edit: edit[:2])
+        for (_, stop, _), (start, _, _) in zip(prepared, prepared[1:]):
+            if start < stop:
+                raise ValueError('edits overlap at index %s' % (start,))
+
+        # Apply the corresponding byte edits in one pass over the underlying
+        # buffer. As it makes each of them, the index is updated and our
+        # listeners are told of the rune edit.
+        # pylint: disable=protected-access
+        byte_edits = [
+            (self._byte_offset(start), self._byte_offset(stop), encoded[0])
+            for start, stop, encoded in prepared
+        ]
+        sweep = _edit_sweep(self, prepared)
+        self._buf._listeners.append(sweep)
+        try:
+            with _edit_group(self._journal):
+                self._buf.apply_edits(byte_edits)
+        finally:
+            self._buf._listeners.remove(sweep)
+
+        if gap is not None:
+            gap = max(0, gap)
+            self._index_to(gap)
+            self._buf._move_gap(self._byte_offset(min(gap, self._length)))
+
     def insert(self, idx, v):
         self[idx:idx] = v
 
+    def _encode(self, v):
+        """Return a tuple giving *v* encoded using the encoding, the index for
+        the encoded bytes and the number of runes.
+
+        """
+        # Encode the item using the encoding and then index it. Where
+        # possible the index is formed from the code points of the item
+        # rather than by decoding the encoded bytes.
+        encoded_v = codecs.encode(v, self._encoding, 'replace')
+        if self._fixed_width:
+            v_len = len(encoded_v) // self._fixed_width
+            v_idx = deque([(self._fixed_width, v_len)] if v_len > 0 else [])
+        else:
+            v_idx, v_len = _index_text(
+                v, encoded_v, self._encoding, self._new_decoder()
+            )
+        return encoded_v, v_idx, v_len
+
+    def _replace(self, start, stop, encoded):
+        """Replace the runes between *start* and *stop* with the result of
+        _encode().
+
+        """
+        encoded_v, v_idx, v_len = encoded
+
+        # delete items to replace
+        del self[start:stop]
+
+        if len(self._index) == 0 and self._complete:
+            # simple case if the index is currently empty :)
+            self._buf[:] = encoded_v
+            self._index = self._new_index(v_idx)
+            self._length = v_len
+            self._frontier = len(self._buf)
+        elif len(v_idx) > 0:
+            # splice the new runs into the index and insert the encoded
+            # data at the corresponding byte index
+            byte_idx, _ = self._index.splice(start, start, v_idx)
+            self._buf[byte_idx:byte_idx] = encoded_v
+            self._length += v_len
+            self._frontier += len(encoded_v)
+
+        if v_len > 0:
+            self._notify_insert(start, start + v_len)
+
     def _form_initial_index(self):
-        index, self._length = _index_byte_array(
-            self._buf, self._new_decoder()
+        if self._lazy:
+            # index on demand
+            self._complete = len(self._buf) == 0
+            return
+
+        self._frontier, self._complete = len(self._buf), True
+        if self._fixed_width:
+            # no need to scan the buffer
+            self._index = fixedindex(self._fixed_width, len(self._buf))
+            self._length = self._index.runes
+            return
+
+        index, self._length = _index_buffer(
+            self._buf, self._encoding, self._new_decoder()
+        )
+        self._index = self._new_index(index)
+
+    def _index_more(self):
+        """Extend the index of a lazy codedstring by a chunk of about
+        _INDEX_CHUNK_SIZE bytes.
+
+        """
+        start = self._frontier
+        stop = min(len(self._buf), start + _INDEX_CHUNK_SIZE)
+        if stop < len(self._buf):
+            # do not split a UTF-8 sequence between chunks
+            for lead in range(stop, max(start, stop - 4), -1):
+                if self._buf[lead] & 0xC0 != 0x80:
+                    stop = lead
+                    break
+
+        runs, n_runes = _index_buffer(
+            self._buf[start:stop], self._encoding, self._new_decoder()
         )
-        self._index = list(index)
+        self._index.splice(self._index.runes, self._index.runes, runs)
+        self._length += n_runes
+        self._frontier = stop
+        self._complete = stop == len(self._buf)
+
+    def _index_to(self, idx):
+        """Extend the index until it covers the rune at *idx* or the entire
+        buffer.
+
+        """
+        while not self._complete and self._index.runes <= idx:
+            self._index_more()
+
+    def _index_all(self):
+        """Extend the index to cover the entire buffer."""
+        while not self._complete:
+            self._index_more()
+
+    def _extend_index(self, old_len):
+        """Extend the index to cover the bytes appended to the buffer after
+        its first *old_len* bytes and tell listeners.
+
+        """
+        if self._frontier < old_len:
+            # a lazy string indexes the new bytes when they are needed
+            self._complete = False
+            return
+
+        start = self._length
+        if self._fixed_width:
+            # any incomplete rune at the end is ignored and so is counted
+            # once it is complete
+            self._index = fixedindex(self._fixed_width, len(self._buf))
+        else:
+            # The runes at the end of the old contents were indexed as if
+            # nothing followed them. If they include an incomplete sequence,
+            # index them again along with the new bytes.
+            byte_idx, rune_idx = self._rune_start(max(0, old_len - 3))
+            decoder = self._new_decoder()
+            decoder.decode(self._buf[byte_idx:old_len])
+            if len(decoder.getstate()[0]) > 0:
+                self._notify_delete(rune_idx, self._length)
+                self._index.splice(rune_idx, self._length)
+                self._length = start = rune_idx
+                self._frontier = byte_idx
+
+            runs, n_runes = _index_buffer(
+                self._buf[self._frontier:], self._encoding,
+                self._new_decoder()
+            )
+            self._index.splice(self._index.runes, self._index.runes, runs)
+        self._length = self._index.runes
+        self._frontier, self._complete = len(self._buf), True
+        if self._length > start:
+            self._notify_insert(start, self._length)
+
+    def _rune_start(self, byte_idx):
+        """Return the byte and rune index of the start of the rune whose
+        representation includes the byte at *byte_idx*, or of the end of the
+        index if *byte_idx* lies beyond it.
+
+        """
+        if byte_idx >= self._index.nbytes:
+            return self._index.nbytes, self._index.runes
+        run_byte_idx, run_rune_idx, _, entry = self._index.find_byte(byte_idx)
+        n = (byte_idx - run_byte_idx) // entry[0]
+        return run_byte_idx + n * entry[0], run_rune_idx + n
+
+    def _slice_indices(self, k):
+        """Return k.indices(len(self)), indexing only as much of the buffer as
+        is necessary.
+
+        """
+        start, stop, step = k.start, k.stop, k.step
+        if self._complete or (step is not None and step < 0) or \
+                stop is None or stop < 0 or \
+                (start is not None and start < 0):
+            return k.indices(len(self))
+        self._index_to(max(start or 0, stop))
+        return k.indices(self._length)
+
+    def _byte_offset(self, idx):
+        """Return the byte offset of the rune at index *idx* which may be one
+        past the final rune.
+
+        """
+        self._index_to(idx)
+        if idx < self._length:
+            return self.byte_slice(idx).start
+        return len(self._buf)
+
+    def _new_index(self, runs=()):
+        """Return a new index appropriate for the encoding holding *runs*."""
+        if self._fixed_width:
+            return fixedindex(
+                self._fixed_width, sum(bpr * n for bpr, n in runs)
+            )
+        return runindex(runs)
 
     def _find_index_entry_for_rune_index(self, idx):
         """Return a tuple giving the starting byte index, starting rune index
-        index into the _index sequence and index entry for the index entry
+        position in the _index runindex and index entry for the index entry
         containing the rune index *idx*. Raises IndexError if idx is invalid.
 
         """
-        if idx < 0:
-            raise IndexError('Invalid index: %s' % idx)
+        self._index_to(idx)
+        return self._index.find_rune(idx)
 
-        byte_idx, rune_idx = 0, 0
-        for entry_idx, entry in enumerate(self._index):
-            bpr, n_runes = entry
-            if rune_idx <= idx and rune_idx + n_runes > idx:
-                return byte_idx, rune_idx, entry_idx, entry
+    def _iter_range(self, start, stop):
+        """Return an iterator over the runes between *start* and *stop*."""
+        for chunk in self._iter_range_chunks(start, stop):
+            for ch in chunk:
+                yield ch
 
-            byte_idx += bpr * n_runes
-            rune_idx += n_runes
+    def _iter_range_chunks(self, start, stop):
+        """Return an iterator over strings which, when concatenated, give the
+        runes between *start* and *stop*. The underlying buffer is decoded in
+        chunks of at most _DECODE_CHUNK_SIZE bytes.
 
-        raise IndexError('Invalid index: %s' % idx)
+        """
+        start = max(0, start)
+        self._index_to(stop)
+        stop = min(stop, self._length)
+        if start >= stop:
+            return
+
+        byte_start = self.byte_slice(start).start
+        byte_stop = self._byte_offset(stop)
+
+        decoder = self._new_decoder()
+        n_to_output = stop - start
+        for chunk_start in range(byte_start, byte_stop, _DECODE_CHUNK_SIZE):
+            chunk_stop = min(byte_stop, chunk_start + _DECODE_CHUNK_SIZE)
+            decoded = ''.join(
+                decoder.decode(seg)
+                for seg in _buffer_segments(self._buf, chunk_start, chunk_stop)
+            )
+            if chunk_stop == byte_stop:
+                decoded += decoder.decode(b'', True)
+            if len(decoded) >= n_to_output:
+                yield decoded[:n_to_output]
+                return
+            n_to_output -= len(decoded)
+            yield decoded
+
+    def _check_utf16(self):
+        """Raise ValueError if UTF-16 offsets cannot be computed from the
+        index for this encoding.
+
+        """
+        name = codecs.lookup(self._encoding).name
+        if name not in ('utf-8', 'utf-16-le', 'utf-16-be') and \
+                not _is_single_byte(name):
+            raise ValueError(
+                'UTF-16 offsets not supported for encoding %r' % (
+                    self._encoding,
+                )
+            )
+
+    def _grapheme_index(self):
+        """Return the grapheme cluster index, creating it if necessary."""
+        if self._graphemes is None:
+            self._graphemes = graphemeindex(self)
+            self._listeners.append(self._graphemes)
+        return self._graphemes
+
+    def _mark_set(self):
+        """Return the set of marks, indexing the string entirely and creating
+        the set if necessary.
+
+        """
+        self._index_all()
+        if self._marks is None:
+            self._marks = markset(self._length)
+            self._listeners.append(self._marks)
+        return self._marks
+
+    def _started_journal(self):
+        """Return the journal, raising ValueError if there is none."""
+        if self._journal is None:
+            raise ValueError('no journal has been started')
+        return self._journal
+
+    def _journal_capture(self, start, stop):
+        """Return the encoded runes between *start* and *stop* together with
+        their runs in the form returned by _encode() and their size in bytes.
+
+        """
+        byte_start, byte_stop = self._byte_offset(start), self._byte_offset(stop)
+        data = self._buf[byte_start:byte_stop]
+        return (data, self._index.runs(start, stop), stop - start), len(data)
+
+    @staticmethod
+    def _journal_join(a, b):
+        """Concatenate two values returned by _journal_capture()."""
+        return a[0] + b[0], a[1] + b[1], a[2] + b[2]
+
+    def _journal_restore(self, idx, encoded):
+        """Insert a value returned by _journal_capture() at *idx*."""
+        self._replace(idx, idx, encoded)
+
+    def _notify_insert(self, start, stop):
+        """Tell listeners that the runes between *start* and *stop* have been
+        inserted.
+
+        """
+        for listener in self._listeners:
+            listener.on_insert(self, start, stop)
+
+    def _notify_delete(self, start, stop):
+        """Tell listeners that the runes between *start* and *stop* are about
+        to be deleted.
+
+        """
+        for listener in self._listeners:
+            listener.on_delete(self, start, stop)
 
     def _new_decoder(self):
         return codecs.getincrementaldecoder(self._encoding)('replace')
 
+
+class codedstringview(object):
+    """A lazy view onto the runes between *start* and *stop* of the
+    codedstring *cs*. Indices are interpreted as for slicing and are fixed
+    when the view is created: the view does not track subsequent
+    modifications of *cs*.
+
+    Iterating over the view or calling iter_chunks() decodes the underlying
+    buffer on demand without forming a string for the entire view. Indexing
+    with an integer returns a single rune and indexing with a slice of step 1
+    returns another view. The text of the view is rendered via str().
+
+    """
+    def __init__(self, cs, start=None, stop=None):
+        # pylint: disable=protected-access
+        self._cs = cs
+        self._start, self._stop, _ = cs._slice_indices(slice(start, stop))
+        self._stop = max(self._start, self._stop)
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def stop(self):
+        return self._stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        # pylint: disable=protected-access
+        return self._cs._iter_range(self._start, self._stop)
+
+    def iter_chunks(self):
+        """Return an iterator over strings which, when concatenated, give the
+        text of the view.
+
+        """
+        # pylint: disable=protected-access
+        return self._cs._iter_range_chunks(self._start, self._stop)
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            k = k if k >= 0 else k + len(self)
+            if k < 0 or k >= len(self):
+                raise IndexError('index out of range')
+            return self._cs[self._start + k]
+        elif isinstance(k, slice):
+            start, stop, step = k.indices(len(self))
+            if step != 1:
+                raise ValueError('views only support slices with step 1')
+            return codedstringview(
+                self._cs, self._start + start, self._start + max(start, stop)
+            )
+
+        raise TypeError('indexing not supported for %r' % (type(k),))
+
+    def __str__(self):
+        return ''.join(self.iter_chunks())
+
+    def __repr__(self):
+        return 'codedstringview(%r, %d, %d)' % (
+            self._cs, self._start, self._stop
+        )
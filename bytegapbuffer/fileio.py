@@ -0,0 +1,216 @@
+"""
+Reading and writing the contents of a bytegapbuffer from and to files.
+
+"""
+import binascii
+import errno
+import os
+import stat
+import time
+
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+
+def file_identity(path_or_stat):
+    """Return a value which changes whenever the file at *path_or_stat*, or
+    described by the result of os.stat() *path_or_stat*, is replaced or
+    written to.
+
+    """
+    st = path_or_stat
+    if not isinstance(st, os.stat_result):
+        st = os.stat(st)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+def write_fd(fd, views):
+    """Write all of the bytes in the sequence of memoryviews *views* to the
+    file descriptor *fd*, gathering them with a single os.writev() call where
+    available, and return the number of bytes written.
+
+    """
+    views = [v for v in views if len(v) > 0]
+    writev = getattr(os, 'writev', None)
+    total = 0
+    while len(views) > 0:
+        n = writev(fd, views) if writev is not None else os.write(fd, views[0])
+        total += n
+        # drop whatever was written and go round again for the rest
+        while len(views) > 0 and n >= len(views[0]):
+            n -= len(views[0])
+            views.pop(0)
+        if n > 0:
+            views[0] = views[0][n:]
+    return total
+
+def write_file(f, views):
+    """Write all of the bytes in the sequence of memoryviews *views* to the
+    file object *f* and return the number of bytes written.
+
+    """
+    total = 0
+    for view in views:
+        while len(view) > 0:
+            # raw files may write only part of the view
+            n = f.write(view)
+            n = len(view) if n is None else n
+            total += n
+            view = view[n:]
+    return total
+
+def read_into(f, view):
+    """Read up to len(*view*) bytes from *f*, which may be a file descriptor
+    or a file object, directly into the memoryview *view* where possible and
+    return the number read. Zero is returned at end of file or if *f* is
+    non-blocking and has no data available.
+
+    """
+    try:
+        if isinstance(f, int):
+            readv = getattr(os, 'readv', None)
+            if readv is not None:
+                return readv(f, [view])
+            data = os.read(f, len(view))
+        elif hasattr(f, 'readinto'):
+            # non-blocking files return None if there is no data
+            return f.readinto(view) or 0
+        else:
+            data = f.read(len(view)) or b''
+    except OSError as e:
+        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return 0
+        raise
+    view[:len(data)] = data
+    return len(data)
+
+def poll_reads(readfrom, interval):
+    """Return an iterator which calls *readfrom* repeatedly and yields what
+    it returns, the number of bytes appended, sleeping for *interval* seconds
+    after each call which appended nothing.
+
+    """
+    while True:
+        n = readfrom()
+        if n == 0:
+            time.sleep(interval)
+        yield n
+
+def save_atomically(path, write):
+    """Replace the file at *path* with one whose contents are written by
+    calling *write* with a file descriptor and return what *write* returns.
+
+    The contents are written to a temporary file in the same directory which
+    is flushed to disk and then renamed over *path* so that *path* never holds
+    partially written contents. The permissions of any existing file are
+    kept.
+
+    """
+    path = os.path.abspath(path)
+    directory, name = os.path.split(path)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0o666
+
+    while True:
+        tmp = os.path.join(directory, '.%s.%s.tmp' % (
+            name, binascii.hexlify(os.urandom(6)).decode('ascii')
+        ))
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_BINARY,
+                         mode)
+        except OSError:
+            if os.path.exists(tmp):
+                continue
+            raise
+        break
+
+    try:
+        try:
+            result = write(fd)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+    # make the rename itself durable where directories can be synced
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return result
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+    return result
+
+def save_in_place(path, offset, length, write):
+    """Overwrite the file at *path* from *offset* onwards with the bytes
+    written by calling *write* with a file descriptor positioned at *offset*,
+    truncate it to *length* bytes, flush it to disk and return what *write*
+    returns.
+
+    """
+    fd = os.open(path, os.O_WRONLY | _O_BINARY)
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+        result = write(fd)
+        os.ftruncate(fd, length)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return result
+
+class savepoint(object):
+    """Records the file a bytegapbuffer was last saved to or loaded from and
+    how long a prefix of the contents is still the same as the start of that
+    file. Savepoints are created by the buffer and should not be created
+    directly.
+
+    """
+    def __init__(self, path, length):
+        self.path, self.identity, self.clean = None, None, 0
+        self.reset(path, length)
+
+    def reset(self, path, length):
+        """Record that the *length* bytes of contents have just been saved to
+        or loaded from the file at *path*.
+
+        """
+        self.path = os.path.abspath(path)
+        self.identity = file_identity(path)
+        # length of the prefix of the contents which matches the file
+        self.clean = length
+
+    def matches(self, path):
+        """Return True if the file at *path* is the file recorded by the
+        savepoint and has not changed since.
+
+        """
+        try:
+            return os.path.abspath(path) == self.path and \
+                file_identity(path) == self.identity
+        except OSError:
+            return False
+
+    def on_insert(self, target, start, stop):
+        """Note that *target* has had the bytes between *start* and *stop*
+        inserted.
+
+        """
+        # pylint: disable=unused-argument
+        self.clean = min(self.clean, start)
+
+    def on_delete(self, target, start, stop):
+        """Note that *target* is about to have the bytes between *start* and
+        *stop* deleted.
+
+        """
+        # pylint: disable=unused-argument
+        self.clean = min(self.clean, start)
@@ -0,0 +1,196 @@
+"""
+Incrementally maintained index of the grapheme cluster boundaries within a
+codedstring.
+
+"""
+import re
+import sys
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+_ZWJ = '\u200d'
+
+# Lazily compiled by _extender_re()
+_EXTENDER_RE = None
+
+def _extender_re():
+    """Return a compiled regular expression matching the runes which extend
+    the grapheme cluster of the rune before them.
+
+    This approximates the extended grapheme clusters of Unicode Standard Annex
+    #29. A rune extends the preceding cluster if it is a combining mark
+    (including variation selectors), a zero width joiner, an emoji modifier,
+    a symbol following a zero width joiner or a line feed following a
+    carriage return. Hangul syllable sequences, prepended concatenation marks
+    and regional indicator pairs are not joined.
+
+    """
+    global _EXTENDER_RE # pylint: disable=global-statement
+    if _EXTENDER_RE is None:
+        marks, symbols = [], []
+        for cp in range(sys.maxunicode + 1):
+            category = unicodedata.category(chr(cp))
+            if category in ('Mn', 'Mc', 'Me'):
+                marks.append(cp)
+            elif category == 'So':
+                symbols.append(cp)
+        _EXTENDER_RE = re.compile(
+            '[%s%s\U0001F3FB-\U0001F3FF]|(?<=%s)[%s]|(?<=\r)\n' % (
+                _char_class(marks), _ZWJ, _ZWJ, _char_class(symbols)
+            )
+        )
+    return _EXTENDER_RE
+
+def _char_class(code_points):
+    """Return the body of a regular expression character class matching the
+    sorted sequence of *code_points*.
+
+    """
+    ranges = []
+    for cp in code_points:
+        if len(ranges) > 0 and ranges[-1][1] == cp - 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ''.join(
+        re.escape(chr(lo)) if lo == hi else
+        '%s-%s' % (re.escape(chr(lo)), re.escape(chr(hi)))
+        for lo, hi in ranges
+    )
+
+def _extenders(text, offset, prev):
+    """Return a list of the indices of the runes in *text*, which begins at
+    rune index *offset*, which extend a grapheme cluster. *prev* is the rune
+    before *text* or '' if *text* begins the string.
+
+    """
+    extenders = []
+    for match in _extender_re().finditer(prev + text, len(prev)):
+        idx = offset + match.start() - len(prev)
+        if idx > 0:
+            extenders.append(idx)
+    return extenders
+
+class graphemeindex(object):
+    """An index of the grapheme clusters within a codedstring. The index is
+    kept up to date with modifications to the string by registering it as a
+    listener.
+
+    Look ups take logarithmic time in the number of runes which extend a
+    cluster, i.e. which do not start one. Modifications take time
+    proportional to the number of such runes between the modification and the
+    previous one plus the length of the modification.
+
+    """
+    # Implementation note:
+    # The indices of runes which extend a cluster are split in two at the
+    # most recent modification in the same manner as for lineindex. Those
+    # before it are stored in _pre as absolute indices in ascending order.
+    # Those after it are stored in _post as distances from the end of the
+    # string in ascending order.
+
+    def __init__(self, cs):
+        # pylint: disable=protected-access
+        self._pre = []
+        self._post = []
+        self._length = len(cs)
+        offset, prev = 0, ''
+        for chunk in cs._iter_range_chunks(0, len(cs)):
+            self._pre.extend(_extenders(chunk, offset, prev))
+            offset += len(chunk)
+            prev = chunk[-1:]
+
+    def grapheme_count(self):
+        """Return the number of grapheme clusters."""
+        return self._length - len(self._pre) - len(self._post)
+
+    def grapheme_index(self, idx):
+        """Return the index of the grapheme cluster containing the rune at
+        index *idx*, which may be one past the final rune.
+
+        """
+        if idx < 0 or idx > self._length:
+            raise IndexError('index out of range: %s' % (idx,))
+        post = self._post
+        n_extenders = (
+            bisect_right(self._pre, idx) +
+            len(post) - bisect_left(post, self._length - idx)
+        )
+        return idx - n_extenders
+
+    def map_grapheme_index(self, n):
+        """Return the index of the first rune in grapheme cluster *n*, which
+        may be one past the final cluster.
+
+        """
+        if n < 0 or n > self.grapheme_count():
+            raise IndexError('grapheme index out of range: %s' % (n,))
+
+        # The cluster starts at n + k where k is the number of extenders
+        # before it, i.e. the smallest k with extender k lying beyond it.
+        lo, hi = 0, len(self._pre) + len(self._post)
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if self._extender(mid) - mid > n:
+                hi = mid
+            else:
+                lo = mid + 1
+        return n + lo
+
+    def on_insert(self, cs, start, stop):
+        """Update the index after *cs* has had the runes between *start* and
+        *stop* inserted.
+
+        """
+        self._split(start)
+        self._length += stop - start
+
+        # the rune now following the insertion may have changed status
+        post = self._post
+        if len(post) > 0 and self._length - post[-1] == stop:
+            post.pop()
+        stop = min(stop + 1, self._length)
+        prev = cs[start - 1] if start > 0 else ''
+        self._pre.extend(_extenders(cs[start:stop], start, prev))
+
+    def on_delete(self, cs, start, stop):
+        """Update the index before *cs* has the runes between *start* and
+        *stop* deleted.
+
+        """
+        self._split(start)
+
+        # work out the status of the rune which will follow the deletion
+        following = []
+        if stop < self._length:
+            prev = cs[start - 1] if start > 0 else ''
+            following = _extenders(cs[stop], start, prev)
+
+        # drop the deleted runes and the rune following them
+        post = self._post
+        del post[bisect_left(post, self._length - stop):]
+        self._length -= stop - start
+        self._pre.extend(following)
+
+    def _extender(self, k):
+        """Return the index of the *k*-th rune which extends a cluster."""
+        if k < len(self._pre):
+            return self._pre[k]
+        return self._length - self._post[-1 - (k - len(self._pre))]
+
+    def _split(self, idx):
+        """Move the split so that _pre holds exactly the extenders before
+        *idx*.
+
+        """
+        pre, post, length = self._pre, self._post, self._length
+        k = bisect_left(pre, idx)
+        if k < len(pre):
+            post.extend(length - v for v in reversed(pre[k:]))
+            del pre[k:]
+            return
+
+        k = bisect_right(post, length - idx)
+        if k < len(post):
+            pre.extend(length - d for d in reversed(post[k:]))
+            del post[k:]
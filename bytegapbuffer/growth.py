@@ -0,0 +1,54 @@
+"""
+Gap growth strategies for bytegapbuffer.
+
+A growth strategy is a callable which is passed the current length of the
+buffer contents, the number of additional gap bytes *needed* and the size of
+the previous growth (or 0 if the gap has not grown since the buffer was
+created or last shrunk). It returns the number of bytes to grow the gap by.
+The buffer never grows the gap by less than *needed* bytes.
+
+"""
+def fixed_growth(block_size=4<<10):
+    """Return a strategy which grows the gap by a whole number of blocks of
+    *block_size* bytes.
+
+    """
+    if block_size < 1:
+        raise ValueError('block size must be positive: %r' % (block_size,))
+
+    def strategy(length, needed, last):
+        # pylint: disable=unused-argument
+        return block_size * max(1, -(-needed // block_size))
+    return strategy
+
+def geometric_growth(factor=2, minimum=4<<10):
+    """Return a strategy which grows the gap by *factor* times the previous
+    growth, starting at *minimum* bytes.
+
+    """
+    if factor < 1:
+        raise ValueError('growth factor must be at least 1: %r' % (factor,))
+
+    def strategy(length, needed, last):
+        # pylint: disable=unused-argument
+        return max(needed, minimum, int(last * factor))
+    return strategy
+
+def proportional_growth(fraction=0.125, minimum=4<<10):
+    """Return a strategy which grows the gap by *fraction* of the current
+    length of the buffer, but by at least *minimum* bytes.
+
+    """
+    if fraction <= 0:
+        raise ValueError('growth fraction must be positive: %r' % (fraction,))
+
+    def strategy(length, needed, last):
+        # pylint: disable=unused-argument
+        return max(needed, minimum, int(length * fraction))
+    return strategy
+
+STRATEGIES = {
+    'fixed': fixed_growth,
+    'geometric': geometric_growth,
+    'proportional': proportional_growth,
+}
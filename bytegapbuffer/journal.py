@@ -0,0 +1,237 @@
+"""
+Undo and redo journal for a bytegapbuffer or codedstring.
+
+"""
+from collections import deque
+from contextlib import contextmanager
+
+# record kinds: the inverse of an insertion deletes a range and the inverse of
+# a deletion inserts the deleted content
+_DELETE = 0
+_INSERT = 1
+
+# nominal number of bytes charged for each record against the memory cap
+_RECORD_OVERHEAD = 64
+
+@contextmanager
+def _edit_group(j):
+    """Context manager grouping the edits made within it into a single undo
+    step of the journal *j*, which may be None.
+
+    """
+    if j is None:
+        yield
+        return
+    j.begin_group()
+    try:
+        yield
+    finally:
+        j.end_group()
+
+class journal(object):
+    """A journal of the modifications to a bytegapbuffer or codedstring
+    which allows them to be undone and redone. Journals are created by the
+    start_journal() method of the buffer or string and should not be created
+    directly.
+
+    Only the inverse of each modification is recorded: the range of an
+    insertion and the content removed by a deletion. Consecutive insertions
+    which each start where the previous one stopped, and consecutive
+    deletions by backspace or forward delete, are coalesced into a single
+    undo step as they would be when typing. Call boundary() to stop the next
+    modification from being coalesced with the previous one.
+
+    If *max_bytes* is not None, the oldest history is discarded once the
+    recorded content plus a small overhead per record exceeds *max_bytes*.
+
+    """
+    # Implementation note:
+    # The undo and redo stacks hold groups, each of which is a list of records
+    # applied in reverse order to undo or redo the group. A record is a list
+    # of [_DELETE, start, stop, 0] or [_INSERT, start, payload, nbytes] where
+    # payload is in the form returned by the target's _journal_capture()
+    # method. Undoing or redoing a group replays its records through the
+    # target so that the inverse modifications are recorded onto the other
+    # stack.
+
+    def __init__(self, target, max_bytes=None):
+        self._target = target
+        self.max_bytes = max_bytes
+        self._undo = deque()
+        self._redo = deque()
+        self._nbytes = 0
+
+        # the group new records are added to or coalesced with, if any
+        self._group = None
+        self._depth = 0
+        self._replaying = None
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes charged against *max_bytes* by the
+        history.
+
+        """
+        return self._nbytes
+
+    @property
+    def can_undo(self):
+        """True if there is a modification to undo."""
+        return len(self._undo) > 0
+
+    @property
+    def can_redo(self):
+        """True if there is an undone modification to redo."""
+        return len(self._redo) > 0
+
+    def undo(self):
+        """Undo the most recent undo step. Return False if there was nothing
+        to undo.
+
+        """
+        return self._replay(self._undo, self._redo)
+
+    def redo(self):
+        """Redo the most recently undone undo step. Return False if there was
+        nothing to redo.
+
+        """
+        return self._replay(self._redo, self._undo)
+
+    def boundary(self):
+        """Stop the next modification from being coalesced with the previous
+        one.
+
+        """
+        if self._depth == 0:
+            self._group = None
+
+    def group(self):
+        """Return a context manager which groups the modifications made
+        within it into a single undo step. Groups may be nested.
+
+        """
+        return _edit_group(self)
+
+    def begin_group(self):
+        """Start a group of modifications. See group()."""
+        self._depth += 1
+        if self._depth == 1:
+            # the group is pushed when its first record is added
+            self._group = []
+
+    def end_group(self):
+        """End a group of modifications. See group()."""
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        self._group = None
+        self._trim()
+
+    def clear(self):
+        """Discard all of the history."""
+        if self._depth > 0:
+            raise RuntimeError('cannot clear the journal within a group')
+        self._undo.clear()
+        self._redo.clear()
+        self._nbytes = 0
+        self._group = None
+
+    def on_insert(self, target, start, stop):
+        """Record the inverse of *target* having had the items between
+        *start* and *stop* inserted.
+
+        """
+        # pylint: disable=unused-argument
+        last = self._last_record()
+        if last is not None and last[0] == _DELETE and last[2] == start:
+            last[2] = stop
+        else:
+            self._record([_DELETE, start, stop, 0])
+
+    def on_delete(self, target, start, stop):
+        """Record the inverse of *target* having the items between *start*
+        and *stop* deleted.
+
+        """
+        # pylint: disable=protected-access
+        payload, nbytes = target._journal_capture(start, stop)
+        last = self._last_record()
+        if last is not None and last[0] == _INSERT and last[1] in (start, stop):
+            if last[1] == stop:
+                # backspace
+                last[1:3] = start, target._journal_join(payload, last[2])
+            else:
+                # forward delete
+                last[2] = target._journal_join(last[2], payload)
+            last[3] += nbytes
+            self._nbytes += nbytes
+            self._trim()
+        else:
+            self._record([_INSERT, start, payload, nbytes])
+
+    def _last_record(self):
+        """Return the record new records may be coalesced with or None."""
+        group = self._group
+        return group[-1] if group is not None and len(group) > 0 else None
+
+    def _record(self, record):
+        """Add *record* to the current group or a new undo step."""
+        self._nbytes += _RECORD_OVERHEAD + record[3]
+        if self._depth > 0:
+            if len(self._group) == 0:
+                self._push(self._group)
+            self._group.append(record)
+            return
+        self._group = self._push([record])
+        self._trim()
+
+    def _push(self, group):
+        """Push *group* onto the stack being recorded to and return it."""
+        if self._replaying is not None:
+            self._replaying.append(group)
+        else:
+            self._undo.append(group)
+            while len(self._redo) > 0:
+                self._nbytes -= _group_nbytes(self._redo.pop())
+        return group
+
+    def _replay(self, source, dest):
+        """Pop the most recent group from *source* and apply its records,
+        recording the inverse onto *dest*.
+
+        """
+        if self._depth > 0:
+            raise RuntimeError('cannot undo or redo within a group')
+        if len(source) == 0:
+            return False
+
+        # pylint: disable=protected-access
+        group = source.pop()
+        self._nbytes -= _group_nbytes(group)
+        self._replaying = dest
+        try:
+            with self.group():
+                for kind, start, value, _ in reversed(group):
+                    if kind == _DELETE:
+                        del self._target[start:value]
+                    else:
+                        self._target._journal_restore(start, value)
+        finally:
+            self._replaying = None
+        return True
+
+    def _trim(self):
+        """Discard the oldest history until it fits within max_bytes."""
+        if self.max_bytes is None or self._depth > 0:
+            return
+        for stack in (self._undo, self._redo):
+            while self._nbytes > self.max_bytes and len(stack) > 0:
+                group = stack.popleft()
+                self._nbytes -= _group_nbytes(group)
+                if group is self._group:
+                    self._group = None
+
+def _group_nbytes(group):
+    """Return the number of bytes charged for the records in *group*."""
+    return sum(_RECORD_OVERHEAD + record[3] for record in group)
@@ -0,0 +1,128 @@
+"""
+Incrementally maintained index of the line starts within a bytegapbuffer.
+
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+_NEWLINE = re.compile(b'\n')
+_match_end = type(_NEWLINE.match(b'\n')).end
+
+def _line_starts(view, offset):
+    """Return a list of the line starts due to the newlines in *view*, which
+    begins at index *offset* of the buffer.
+
+    """
+    # map() keeps the per-newline work in C
+    starts = map(_match_end, _NEWLINE.finditer(view))
+    if offset != 0:
+        starts = map(offset.__add__, starts)
+    return list(starts)
+
+class lineindex(object):
+    """An index of the offsets at which lines start within a bytegapbuffer.
+    A line starts at index 0 and just after each b'\\n'. The index is kept up
+    to date with modifications to the buffer.
+
+    Look ups take logarithmic time in the number of lines. Modifications
+    take time proportional to the number of lines between the modification
+    and the previous one.
+
+    """
+    # Implementation note:
+    # Like the buffer itself, the line starts are split in two at the most
+    # recent modification. Those before it are stored in _pre as absolute
+    # offsets in ascending order. Those after it are stored in _post as
+    # distances from the end of the buffer in *ascending* order, i.e. with the
+    # nearest to the split last. Modifying the buffer at the split therefore
+    # does not change any stored values and moving the split only converts
+    # the line starts it passes over.
+
+    def __init__(self, buf):
+        self._pre = []
+        for offset, seg in _offset_segments(buf):
+            with seg:
+                self._pre.extend(_line_starts(seg, offset))
+        self._post = []
+        self._length = len(buf)
+
+    def line_count(self):
+        """Return the number of lines. An empty buffer has one line."""
+        return 1 + len(self._pre) + len(self._post)
+
+    def line_of(self, offset):
+        """Return the index of the line containing the byte at *offset*."""
+        if offset < 0:
+            offset += self._length
+        if offset < 0 or offset > self._length:
+            raise IndexError('offset out of range: %s' % (offset,))
+        post = self._post
+        return (
+            bisect_right(self._pre, offset) +
+            len(post) - bisect_left(post, self._length - offset)
+        )
+
+    def offset_of_line(self, n):
+        """Return the offset of the first byte of line *n*."""
+        if n < 0:
+            n += self.line_count()
+        if n < 0 or n >= self.line_count():
+            raise IndexError('line out of range: %s' % (n,))
+        if n == 0:
+            return 0
+        n -= 1
+        if n < len(self._pre):
+            return self._pre[n]
+        return self._length - self._post[-1 - (n - len(self._pre))]
+
+    def on_insert(self, buf, start, stop):
+        """Update the index after *buf* has had the bytes between *start* and
+        *stop* inserted.
+
+        """
+        self._split(start)
+        self._length += stop - start
+        for offset, seg in _offset_segments(buf, start, stop):
+            with seg:
+                self._pre.extend(_line_starts(seg, offset))
+
+    def on_delete(self, buf, start, stop):
+        """Update the index before *buf* has the bytes between *start* and
+        *stop* deleted.
+
+        """
+        # pylint: disable=unused-argument
+        self._split(start)
+
+        # line starts in (start, stop] are due to deleted newlines
+        post = self._post
+        del post[bisect_left(post, self._length - stop):]
+        self._length -= stop - start
+
+    def _split(self, offset):
+        """Move the split so that _pre holds exactly the line starts at or
+        before *offset*.
+
+        """
+        pre, post, length = self._pre, self._post, self._length
+        k = bisect_right(pre, offset)
+        if k < len(pre):
+            post.extend(length - v for v in reversed(pre[k:]))
+            del pre[k:]
+            return
+
+        k = bisect_left(post, length - offset)
+        if k < len(post):
+            pre.extend(length - d for d in reversed(post[k:]))
+            del post[k:]
+
+def _offset_segments(buf, start=None, stop=None):
+    """Yield (offset, memoryview) pairs for the segments of *buf* between
+    *start* and *stop*.
+
+    """
+    start = 0 if start is None else start
+    for seg in buf.segments(start, stop):
+        n = len(seg)
+        yield start, seg
+        start += n
@@ -0,0 +1,290 @@
+"""
+Marks which track positions within a bytegapbuffer or codedstring across
+edits.
+
+"""
+from bisect import bisect_left, bisect_right
+
+from bytegapbuffer.runindex import _fenwick_add, _fenwick_build, \
+    _fenwick_prefix
+
+class mark(object):
+    """A position within a bytegapbuffer or codedstring which is kept up to
+    date as the contents are modified. Marks are created by the add_mark()
+    method of the buffer or string and should not be created directly.
+
+    When text is inserted at a mark, a mark with left gravity stays to the
+    left of it and a mark with right gravity moves to the right of it. When
+    the text around a mark is deleted, the mark moves to the start of the
+    deletion.
+
+    """
+    __slots__ = ('_set', '_leaf', '_key', '_left_gravity')
+
+    def __init__(self, mark_set, left_gravity):
+        self._set = mark_set
+        self._leaf = None
+        self._key = 0
+        self._left_gravity = left_gravity
+
+    @property
+    def position(self):
+        """The current position of the mark. Raises ValueError if the mark
+        has been removed.
+
+        """
+        # pylint: disable=protected-access
+        mark_set = self._set
+        if mark_set is None or mark_set._reading is None:
+            return self._position()
+        with mark_set._reading():
+            return self._position()
+
+    @property
+    def left_gravity(self):
+        """True if the mark stays to the left of text inserted at it."""
+        return self._left_gravity
+
+    @property
+    def removed(self):
+        """True if the mark has been removed from its buffer."""
+        return self._set is None
+
+    def _position(self):
+        """Implementation of the position property."""
+        if self._set is None:
+            raise ValueError('mark has been removed')
+        # pylint: disable=protected-access
+        return self._set._base(self._leaf.index) + self._key
+
+    def __repr__(self):
+        if self._set is None:
+            return '<mark (removed)>'
+        return '<mark at %d%s>' % (
+            self.position, ' (left gravity)' if self._left_gravity else ''
+        )
+
+class _leaf(object):
+    """A block of marks in ascending order of position. *keys* holds the
+    position of each mark relative to the base position of the block.
+
+    """
+    __slots__ = ('index', 'keys', 'marks')
+
+    def __init__(self, index, keys, marks):
+        self.index, self.keys, self.marks = index, keys, marks
+
+class markset(object):
+    """The set of marks within a buffer of length *length*. The set is kept up
+    to date by registering it as a listener with the buffer.
+
+    Adding, removing and looking up the position of a mark and finding the
+    marks in a range take time logarithmic in the number of marks.
+    Modifications only touch the marks within the modified region, those at
+    an insertion point and the others sharing a leaf with them.
+
+    """
+    # Implementation note:
+    # The marks are held in leaves of bounded size in ascending order of
+    # position. Each mark records its leaf and its key, its position relative
+    # to the base position of the leaf. The base positions are the prefix
+    # sums of a Fenwick tree, so moving every mark after an edit only means
+    # adjusting the base of the first leaf after it.
+
+    _LEAF_SIZE = 64 # leaves are split when they reach twice this size
+
+    def __init__(self, length):
+        self._length = length
+        self._leaves = []
+        # the differences between successive base positions and a Fenwick
+        # tree over them
+        self._deltas, self._tree = [], []
+        self._n_marks = 0
+        # a function returning a context manager held while the position of
+        # a mark is looked up; see bytegapbuffer.synchronized
+        self._reading = None
+
+    def __len__(self):
+        return self._n_marks
+
+    def add(self, position, left_gravity=False):
+        """Add and return a mark at *position*."""
+        # pylint: disable=protected-access
+        if position < 0 or position > self._length:
+            raise IndexError('position out of range: %s' % (position,))
+        m = mark(self, left_gravity)
+        self._n_marks += 1
+        if len(self._leaves) == 0:
+            m._leaf = _leaf(0, [0], [m])
+            self._leaves.append(m._leaf)
+            self._deltas = [position]
+            self._tree = _fenwick_build(self._deltas)
+            return m
+
+        # new marks follow any already at the same position
+        idx = min(self._find(position + 1), len(self._leaves) - 1)
+        leaf = self._leaves[idx]
+        m._leaf, m._key = leaf, position - self._base(idx)
+        k = bisect_right(leaf.keys, m._key)
+        leaf.keys.insert(k, m._key)
+        leaf.marks.insert(k, m)
+        if len(leaf.marks) >= 2 * self._LEAF_SIZE:
+            self._reshape(idx)
+        return m
+
+    def remove(self, m):
+        """Remove the mark *m* from the set."""
+        # pylint: disable=protected-access
+        if m._set is not self:
+            raise ValueError('mark is not in this set')
+        leaf = m._leaf
+        idx = bisect_left(leaf.keys, m._key)
+        while leaf.marks[idx] is not m:
+            idx += 1
+        del leaf.keys[idx]
+        del leaf.marks[idx]
+        m._set, m._leaf = None, None
+        self._n_marks -= 1
+        if len(leaf.marks) == 0:
+            self._reshape(leaf.index)
+
+    def marks(self, start=None, stop=None):
+        """Return a list of the marks whose position lies between *start*
+        and *stop* in ascending order of position. If *stop* is None, marks
+        at the very end of the buffer are included.
+
+        """
+        start = 0 if start is None else start
+        stop = self._length + 1 if stop is None else stop
+        if start >= stop:
+            return []
+
+        found = []
+        for idx in range(self._find(start), len(self._leaves)):
+            leaf, base = self._leaves[idx], self._base(idx)
+            hi = bisect_left(leaf.keys, stop - base)
+            found.extend(leaf.marks[bisect_left(leaf.keys, start - base):hi])
+            if hi < len(leaf.keys):
+                break
+        return found
+
+    def on_insert(self, buf, start, stop):
+        """Update the marks after *buf* has had the items between *start*
+        and *stop* inserted.
+
+        """
+        # pylint: disable=unused-argument,protected-access
+        n = stop - start
+
+        # The marks at the insertion point are reordered so that those with
+        # left gravity stay before it. Later marks in the same leaves move
+        # individually and those in later leaves with their leaf.
+        left, right, slots = [], [], []
+        idx = self._find(start)
+        while idx < len(self._leaves):
+            leaf, base = self._leaves[idx], self._base(idx)
+            keys, marks = leaf.keys, leaf.marks
+            k = bisect_left(keys, start - base)
+            while k < len(keys) and keys[k] == start - base:
+                m = marks[k]
+                (left if m._left_gravity else right).append(m)
+                slots.append((leaf, k, base))
+                k += 1
+            for k in range(k, len(keys)):
+                keys[k] += n
+                marks[k]._key = keys[k]
+            idx += 1
+            if keys[-1] + base > start:
+                break
+        if idx < len(self._leaves):
+            self._shift(idx, n)
+
+        for (leaf, k, base), m in zip(slots, left + right):
+            key = start - base if m._left_gravity else start + n - base
+            leaf.keys[k], leaf.marks[k] = key, m
+            m._leaf, m._key = leaf, key
+
+        self._length += n
+
+    def on_delete(self, buf, start, stop):
+        """Update the marks before *buf* has the items between *start* and
+        *stop* deleted.
+
+        """
+        # pylint: disable=unused-argument,protected-access
+        n = stop - start
+
+        # marks within the deletion move to its start and later marks in the
+        # same leaves move individually
+        idx = self._find(start)
+        while idx < len(self._leaves):
+            leaf, base = self._leaves[idx], self._base(idx)
+            keys, marks = leaf.keys, leaf.marks
+            last = keys[-1] + base
+            for k in range(bisect_left(keys, start - base), len(keys)):
+                keys[k] = max(start - base, keys[k] - n)
+                marks[k]._key = keys[k]
+            idx += 1
+            if last > stop:
+                break
+        if idx < len(self._leaves):
+            self._shift(idx, -n)
+
+        self._length -= n
+
+    def _base(self, idx):
+        """Return the base position of the leaf at *idx*."""
+        return _fenwick_prefix(self._tree, idx + 1)
+
+    def _shift(self, idx, delta):
+        """Move the marks in the leaves from *idx* onwards by *delta*."""
+        self._deltas[idx] += delta
+        _fenwick_add(self._tree, idx, delta)
+
+    def _find(self, position):
+        """Return the index of the first leaf whose final mark is at or after
+        *position* or the number of leaves if there is none.
+
+        """
+        # descend the Fenwick tree keeping track of the base position of
+        # the leaf before pos
+        tree, leaves = self._tree, self._leaves
+        pos, base = 0, 0
+        bit = 1 << (len(tree).bit_length() - 1) if len(tree) > 0 else 0
+        while bit:
+            nxt = pos + bit
+            if nxt <= len(tree) and \
+                    base + tree[nxt - 1] + leaves[nxt - 1].keys[-1] < position:
+                pos, base = nxt, base + tree[nxt - 1]
+            bit >>= 1
+        return pos
+
+    def _reshape(self, idx):
+        """Split the leaf at *idx* if it has grown too large or drop it if it
+        is empty and rebuild the Fenwick tree.
+
+        """
+        # pylint: disable=protected-access
+        leaf, n = self._leaves[idx], self._LEAF_SIZE
+        new_leaves = [
+            _leaf(0, leaf.keys[i:i + n], leaf.marks[i:i + n])
+            for i in range(0, len(leaf.marks), n)
+        ]
+        for new_leaf in new_leaves:
+            for m in new_leaf.marks:
+                m._leaf = new_leaf
+        self._leaves[idx:idx + 1] = new_leaves
+
+        # split leaves share a base position and the one after a dropped
+        # leaf keeps its own
+        delta = self._deltas[idx]
+        if len(new_leaves) > 0:
+            self._deltas[idx:idx + 1] = [delta] + [0] * (len(new_leaves) - 1)
+        else:
+            del self._deltas[idx]
+            if idx < len(self._deltas):
+                self._deltas[idx] += delta
+
+        for i, leaf in enumerate(self._leaves):
+            leaf.index = i
+        self._tree = _fenwick_build(self._deltas)
@@ -0,0 +1,71 @@
+"""
+Match objects returned by regular expression searches of a bytegapbuffer.
+
+"""
+
+class gapmatch(object):
+    """A work-alike for the match objects returned by the re module which
+    describes a match found within a bytegapbuffer.
+
+    Positions are indices into the buffer. Unlike re match objects, the
+    matched groups are copied out when the match is made so no reference to
+    the buffer's storage is kept.
+
+    """
+    def __init__(self, m, offset):
+        # pylint: disable=invalid-name
+        self.re = m.re
+        self.lastindex = m.lastindex
+        self.lastgroup = m.lastgroup
+        self._spans = [
+            (s + offset, e + offset) if s != -1 else (-1, -1)
+            for s, e in m.regs
+        ]
+        self._groups = [
+            bytes(g) if g is not None else None
+            for g in (m.group(),) + m.groups()
+        ]
+
+    def start(self, group=0):
+        return self._spans[self._group_index(group)][0]
+
+    def end(self, group=0):
+        return self._spans[self._group_index(group)][1]
+
+    def span(self, group=0):
+        return self._spans[self._group_index(group)]
+
+    def group(self, *groups):
+        if len(groups) == 0:
+            return self._groups[0]
+        if len(groups) == 1:
+            return self._groups[self._group_index(groups[0])]
+        return tuple(self._groups[self._group_index(g)] for g in groups)
+
+    def groups(self, default=None):
+        return tuple(g if g is not None else default for g in self._groups[1:])
+
+    def groupdict(self, default=None):
+        return dict(
+            (name, self._groups[idx] if self._groups[idx] is not None
+             else default)
+            for name, idx in self.re.groupindex.items()
+        )
+
+    def __getitem__(self, group):
+        return self.group(group)
+
+    def __repr__(self):
+        return '<gapmatch object; span=%r, match=%r>' % (
+            self.span(), self.group()
+        )
+
+    def _group_index(self, group):
+        if not isinstance(group, int):
+            try:
+                group = self.re.groupindex[group]
+            except KeyError:
+                raise IndexError('no such group: %r' % (group,))
+        if group < 0 or group >= len(self._spans):
+            raise IndexError('no such group: %r' % (group,))
+        return group
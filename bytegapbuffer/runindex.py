@@ -0,0 +1,533 @@
+"""
+Run-length index used by codedstring to map between rune and byte indices.
+
+"""
+from itertools import chain, islice
+
+class runindex(object):
+    """A sequence of (bpr, rune_count) runs giving the number of bytes per
+    rune (bpr) and number of runes in each run of a coded string.
+
+    The runs are held in leaves of bounded size. Fenwick trees over the rune,
+    byte and UTF-16 code unit totals of each leaf allow the run containing a
+    given rune, byte or code unit index to be found, and a run to be
+    replaced, in time logarithmic in the number of runs.
+
+    Runes of four bytes are counted as two UTF-16 code units, i.e. a
+    surrogate pair, and all others as one. This is exact for UTF-8, UTF-16 and
+    single byte encodings.
+
+    Runs are addressed by the opaque positions returned by find_rune(),
+    find_byte() and last(). A position is invalidated by any modification.
+
+    """
+    # Implementation note:
+    # Inserting or removing a leaf other than the final one would renumber
+    # the leaves after it and so mean rebuilding the Fenwick trees. Instead,
+    # leaves are only added or removed at the end. Leaves which end up without
+    # runs stay in place and an overfull leaf shares its runs with the leaves
+    # around it. The trees are rebuilt only when the leaves are mostly empty.
+    _LEAF_SIZE = 64 # leaves share out their runs at twice this size
+
+    def __init__(self, runs=()):
+        runs = list(runs)
+        n = self._LEAF_SIZE
+        self._leaves = [runs[i:i + n] for i in range(0, len(runs), n)]
+        self._reindex()
+
+    @property
+    def runes(self):
+        """Total number of runes."""
+        return self._runes
+
+    @property
+    def nbytes(self):
+        """Total number of bytes."""
+        return self._nbytes
+
+    @property
+    def units(self):
+        """Total number of UTF-16 code units."""
+        return self._units
+
+    def __len__(self):
+        return self._n_runs
+
+    def __iter__(self):
+        return chain.from_iterable(self._leaves)
+
+    def find_rune(self, idx):
+        """Return a tuple giving the starting byte index, starting rune index,
+        position and entry for the run containing rune index *idx*. Raises
+        IndexError if idx is invalid.
+
+        """
+        if idx < 0 or idx >= self._runes:
+            raise IndexError('Invalid index: %s' % idx)
+        leaf_idx, rune_idx = _fenwick_search(self._rune_tree, idx)
+        byte_idx = _fenwick_prefix(self._byte_tree, leaf_idx)
+        for offset, entry in enumerate(self._leaves[leaf_idx]):
+            bpr, n_runes = entry
+            if idx < rune_idx + n_runes:
+                return byte_idx, rune_idx, (leaf_idx, offset), entry
+            byte_idx += bpr * n_runes
+            rune_idx += n_runes
+
+        # never reached
+        assert False
+
+    def find_byte(self, idx):
+        """Return a tuple giving the starting byte index, starting rune index,
+        position and entry for the run containing byte index *idx*. Raises
+        IndexError if idx is invalid.
+
+        """
+        if idx < 0 or idx >= self._nbytes:
+            raise IndexError('Invalid index: %s' % idx)
+        leaf_idx, byte_idx = _fenwick_search(self._byte_tree, idx)
+        rune_idx = _fenwick_prefix(self._rune_tree, leaf_idx)
+        for offset, entry in enumerate(self._leaves[leaf_idx]):
+            bpr, n_runes = entry
+            if idx < byte_idx + bpr * n_runes:
+                return byte_idx, rune_idx, (leaf_idx, offset), entry
+            byte_idx += bpr * n_runes
+            rune_idx += n_runes
+
+        # never reached
+        assert False
+
+    def rune_to_unit(self, idx):
+        """Return the UTF-16 code unit index of the rune at index *idx*,
+        which may be one past the final rune. Raises IndexError if idx is
+        invalid.
+
+        """
+        if idx == self._runes and idx >= 0:
+            return self._units
+        if idx < 0 or idx > self._runes:
+            raise IndexError('Invalid index: %s' % idx)
+        leaf_idx, rune_idx = _fenwick_search(self._rune_tree, idx)
+        unit_idx = _fenwick_prefix(self._unit_tree, leaf_idx)
+        for bpr, n_runes in self._leaves[leaf_idx]:
+            if idx < rune_idx + n_runes:
+                return unit_idx + _utf16_units(bpr) * (idx - rune_idx)
+            unit_idx += _utf16_units(bpr) * n_runes
+            rune_idx += n_runes
+
+        # never reached
+        assert False
+
+    def unit_to_rune(self, idx):
+        """Return the index of the rune containing the UTF-16 code unit at
+        index *idx*, which may be one past the final code unit. Raises
+        IndexError if idx is invalid.
+
+        """
+        if idx == self._units and idx >= 0:
+            return self._runes
+        if idx < 0 or idx > self._units:
+            raise IndexError('Invalid index: %s' % idx)
+        leaf_idx, unit_idx = _fenwick_search(self._unit_tree, idx)
+        rune_idx = _fenwick_prefix(self._rune_tree, leaf_idx)
+        for bpr, n_runes in self._leaves[leaf_idx]:
+            upr = _utf16_units(bpr)
+            if idx < unit_idx + upr * n_runes:
+                return rune_idx + (idx - unit_idx) // upr
+            unit_idx += upr * n_runes
+            rune_idx += n_runes
+
+        # never reached
+        assert False
+
+    def last(self):
+        """Return a tuple giving the position and entry of the final run.
+        Raises IndexError if there are no runs.
+
+        """
+        if self._n_runs == 0:
+            raise IndexError('no runs')
+        leaf = self._leaves[-1]
+        return (len(self._leaves) - 1, len(leaf) - 1), leaf[-1]
+
+    def runs(self, start, stop):
+        """Return a list of the runs covering the runes in the range [*start*,
+        *stop*), trimmed at either end of the range.
+
+        """
+        if start < 0 or stop < start or stop > self._runes:
+            raise IndexError('Invalid range: %s to %s' % (start, stop))
+        if start == stop:
+            return []
+
+        _, rune_idx, (leaf_idx, offset), _ = self.find_rune(start)
+        runs, skip, n_left = [], start - rune_idx, stop - start
+        for leaf in islice(self._leaves, leaf_idx, None):
+            for bpr, n_runes in leaf[offset:]:
+                n_runes = min(n_runes - skip, n_left)
+                runs.append((bpr, n_runes))
+                skip, n_left = 0, n_left - n_runes
+                if n_left == 0:
+                    return runs
+            offset = 0
+
+        # never reached
+        assert False
+
+    def replace(self, pos, runs):
+        """Replace the run at position *pos* with the sequence of runs
+        *runs*, which may be empty.
+
+        """
+        leaf_idx, offset = pos
+        leaf = self._leaves[leaf_idx]
+        (old_bpr, old_n), runs = leaf[offset], list(runs)
+        leaf[offset:offset + 1] = runs
+        self._adjust(
+            leaf_idx, len(runs) - 1,
+            sum(n for _, n in runs) - old_n,
+            sum(bpr * n for bpr, n in runs) - old_bpr * old_n,
+            _units(runs) - _utf16_units(old_bpr) * old_n
+        )
+        self._rebalance(leaf_idx, leaf_idx + 1)
+
+    def extend(self, runs):
+        """Append the sequence of runs *runs*."""
+        runs = list(runs)
+        if len(runs) == 0:
+            return
+        if len(self._leaves) == 0:
+            self._append_leaf()
+        self._leaves[-1].extend(runs)
+        self._adjust(
+            len(self._leaves) - 1, len(runs),
+            sum(n for _, n in runs), sum(bpr * n for bpr, n in runs),
+            _units(runs)
+        )
+        self._rebalance(len(self._leaves) - 1, len(self._leaves))
+
+    def splice(self, start, stop, runs=()):
+        """Replace the runes in the range [*start*, *stop*) with the sequence
+        of runs *runs*, trimming the runs at either end of the range and
+        merging runs with equal bytes per rune where they meet. Return a tuple
+        giving the byte range which corresponded to the replaced runes.
+
+        """
+        runs = list(runs)
+        if start < 0 or stop < start or stop > self._runes:
+            raise IndexError('Invalid range: %s to %s' % (start, stop))
+
+        if start == self._runes:
+            # a pure append
+            nbytes = self._nbytes
+            if self._n_runs > 0:
+                pos, last = self.last()
+                runs = [last] + runs
+                self.replace(pos, [])
+            self.extend(_coalesce(runs))
+            return nbytes, nbytes
+
+        byte_a, rune_a, (leaf_a, off_a), (bpr_a, _) = self.find_rune(start)
+        if stop > start:
+            byte_b, rune_b, (leaf_b, off_b), (bpr_b, n_b) = \
+                self.find_rune(stop - 1)
+        else:
+            byte_b, rune_b, leaf_b, off_b = byte_a, rune_a, leaf_a, off_a
+            bpr_b, n_b = self._leaves[leaf_a][off_a]
+
+        head = (bpr_a, start - rune_a)
+        tail = (bpr_b, rune_b + n_b - stop)
+        prefix = self._leaves[leaf_a][:off_a]
+        suffix = self._leaves[leaf_b][off_b + 1:]
+        middle = _coalesce(prefix[-1:] + [head] + runs + [tail] + suffix[:1])
+        new_leaf = prefix[:-1] + middle + suffix[1:]
+
+        byte_start = byte_a + bpr_a * (start - rune_a)
+        byte_stop = byte_b + bpr_b * (stop - rune_b)
+
+        if leaf_a == leaf_b:
+            old_leaf = self._leaves[leaf_a]
+            self._leaves[leaf_a] = new_leaf
+            self._adjust(
+                leaf_a, len(new_leaf) - len(old_leaf),
+                sum(n for _, n in runs) - (stop - start),
+                sum(bpr * n for bpr, n in runs) - (byte_stop - byte_start),
+                _units(middle) - _units(old_leaf[max(0, off_a - 1):off_b + 2])
+            )
+            self._rebalance(leaf_a, leaf_a + 1)
+        else:
+            # share the runs between the leaves they replace so that no
+            # other leaf changes
+            self._spread(leaf_a, leaf_b + 1, new_leaf)
+            self._rebalance(leaf_a, leaf_b + 1)
+
+        return byte_start, byte_stop
+
+    def _adjust(self, leaf_idx, d_runs, d_runes, d_bytes, d_units):
+        """Update totals after the leaf at *leaf_idx* has changed."""
+        self._n_runs += d_runs
+        self._runes += d_runes
+        self._nbytes += d_bytes
+        self._units += d_units
+
+        _fenwick_add(self._rune_tree, leaf_idx, d_runes)
+        _fenwick_add(self._byte_tree, leaf_idx, d_bytes)
+        _fenwick_add(self._unit_tree, leaf_idx, d_units)
+
+    def _spread(self, start, stop, runs):
+        """Replace the runs in the leaves from *start* to *stop* with the list
+        *runs* shared evenly between them.
+
+        """
+        n_leaves = stop - start
+        for i in range(n_leaves):
+            new_leaf = runs[
+                i * len(runs) // n_leaves:(i + 1) * len(runs) // n_leaves
+            ]
+            old_leaf = self._leaves[start + i]
+            self._leaves[start + i] = new_leaf
+            self._adjust(
+                start + i, len(new_leaf) - len(old_leaf),
+                sum(n for _, n in new_leaf) - sum(n for _, n in old_leaf),
+                sum(bpr * n for bpr, n in new_leaf) -
+                sum(bpr * n for bpr, n in old_leaf),
+                _units(new_leaf) - _units(old_leaf)
+            )
+
+    def _rebalance(self, start, stop):
+        """Restore the bounds on the size of the leaves after those from
+        *start* to *stop* have changed.
+
+        """
+        n = self._LEAF_SIZE
+        for leaf_idx in range(start, stop):
+            if len(self._leaves[leaf_idx]) < 2 * n:
+                continue
+
+            # Share the runs over the smallest aligned block of leaves
+            # around the leaf with room for them, as in a packed memory
+            # array. The larger the block, the more room it must have left.
+            # A block which reaches the end gains leaves instead. Only the
+            # block's Fenwick tree entries change.
+            depth = max(1, len(self._leaves).bit_length())
+            width = 2
+            while True:
+                lo = leaf_idx - leaf_idx % width
+                hi = min(lo + width, len(self._leaves))
+                runs = list(chain.from_iterable(islice(self._leaves, lo, hi)))
+                if hi == len(self._leaves):
+                    while len(runs) > n * (hi - lo):
+                        self._append_leaf()
+                        hi += 1
+                    break
+                level = width.bit_length() - 1
+                if depth * len(runs) <= n * (hi - lo) * (2 * depth - level):
+                    break
+                width *= 2
+            self._spread(lo, hi, runs)
+
+        # leaves without runs are dropped from the end and the leaves are
+        # rebuilt once they hold under a quarter of their usual number of runs
+        while len(self._leaves) > 0 and len(self._leaves[-1]) == 0:
+            self._leaves.pop()
+            for tree in (self._rune_tree, self._byte_tree, self._unit_tree):
+                tree.pop()
+        if len(self._leaves) > 1 and 4 * self._n_runs < n * len(self._leaves):
+            runs = list(self)
+            self._leaves = [runs[i:i + n] for i in range(0, len(runs), n)]
+            self._reindex()
+
+    def _append_leaf(self):
+        """Add an empty leaf after the final leaf."""
+        self._leaves.append([])
+        for tree in (self._rune_tree, self._byte_tree, self._unit_tree):
+            _fenwick_append(tree, 0)
+
+    def _reindex(self):
+        """Recompute totals and Fenwick trees from the leaves."""
+        self._rune_tree = _fenwick_build(
+            [sum(n for _, n in leaf) for leaf in self._leaves]
+        )
+        self._byte_tree = _fenwick_build(
+            [sum(bpr * n for bpr, n in leaf) for leaf in self._leaves]
+        )
+        self._unit_tree = _fenwick_build(
+            [_units(leaf) for leaf in self._leaves]
+        )
+        self._n_runs = sum(len(leaf) for leaf in self._leaves)
+        self._runes = _fenwick_prefix(self._rune_tree, len(self._leaves))
+        self._nbytes = _fenwick_prefix(self._byte_tree, len(self._leaves))
+        self._units = _fenwick_prefix(self._unit_tree, len(self._leaves))
+
+class fixedindex(object):
+    """A replacement for runindex for encodings in which every rune is
+    encoded with *width* bytes. It holds at most one run and maps between
+    rune and byte indices arithmetically in constant time.
+
+    The runs passed to replace(), extend() and splice() are only used for the
+    total number of bytes they cover. Any incomplete rune at the end of the
+    *nbytes* bytes the index is created with is ignored.
+
+    """
+    def __init__(self, width, nbytes=0):
+        if width < 1:
+            raise ValueError('width must be positive: %r' % (width,))
+        self._width = width
+        self._runes = nbytes // width
+
+    @property
+    def width(self):
+        """Number of bytes per rune."""
+        return self._width
+
+    @property
+    def runes(self):
+        """Total number of runes."""
+        return self._runes
+
+    @property
+    def nbytes(self):
+        """Total number of bytes."""
+        return self._runes * self._width
+
+    @property
+    def units(self):
+        """Total number of UTF-16 code units. Each rune is counted as one code
+        unit.
+
+        """
+        return self._runes
+
+    def __len__(self):
+        return 1 if self._runes > 0 else 0
+
+    def __iter__(self):
+        return iter([(self._width, self._runes)] if self._runes > 0 else [])
+
+    def find_rune(self, idx):
+        """See runindex.find_rune()."""
+        if idx < 0 or idx >= self._runes:
+            raise IndexError('Invalid index: %s' % idx)
+        return 0, 0, 0, (self._width, self._runes)
+
+    def find_byte(self, idx):
+        """See runindex.find_byte()."""
+        if idx < 0 or idx >= self.nbytes:
+            raise IndexError('Invalid index: %s' % idx)
+        return 0, 0, 0, (self._width, self._runes)
+
+    def rune_to_unit(self, idx):
+        """See runindex.rune_to_unit()."""
+        if idx < 0 or idx > self._runes:
+            raise IndexError('Invalid index: %s' % idx)
+        return idx
+
+    def unit_to_rune(self, idx):
+        """See runindex.unit_to_rune()."""
+        if idx < 0 or idx > self._runes:
+            raise IndexError('Invalid index: %s' % idx)
+        return idx
+
+    def last(self):
+        """See runindex.last()."""
+        if self._runes == 0:
+            raise IndexError('no runs')
+        return 0, (self._width, self._runes)
+
+    def runs(self, start, stop):
+        """See runindex.runs()."""
+        if start < 0 or stop < start or stop > self._runes:
+            raise IndexError('Invalid range: %s to %s' % (start, stop))
+        return [(self._width, stop - start)] if stop > start else []
+
+    def replace(self, pos, runs):
+        """See runindex.replace()."""
+        self._runes = self._count(runs)
+
+    def extend(self, runs):
+        """See runindex.extend()."""
+        self._runes += self._count(runs)
+
+    def splice(self, start, stop, runs=()):
+        """See runindex.splice()."""
+        if start < 0 or stop < start or stop > self._runes:
+            raise IndexError('Invalid range: %s to %s' % (start, stop))
+        self._runes += self._count(runs) - (stop - start)
+        return start * self._width, stop * self._width
+
+    def _count(self, runs):
+        """Return the number of runes covered by the bytes of *runs*."""
+        return sum(bpr * n for bpr, n in runs) // self._width
+
+def _utf16_units(bpr):
+    """Return the number of UTF-16 code units per rune for runes of *bpr*
+    bytes.
+
+    """
+    return 2 if bpr == 4 else 1
+
+def _units(runs):
+    """Return the number of UTF-16 code units in *runs*."""
+    return sum(_utf16_units(bpr) * n for bpr, n in runs)
+
+def _coalesce(runs):
+    """Return a list of runs with empty runs removed and adjacent runs with
+    equal bytes per rune merged.
+
+    """
+    merged = []
+    for bpr, n_runes in runs:
+        if n_runes == 0:
+            continue
+        if len(merged) > 0 and merged[-1][0] == bpr:
+            merged[-1] = (bpr, merged[-1][1] + n_runes)
+        else:
+            merged.append((bpr, n_runes))
+    return merged
+
+# Fenwick trees are stored 0-based with node k (1-based) at index k-1.
+
+def _fenwick_build(values):
+    tree = list(values)
+    n = len(tree)
+    for k in range(1, n + 1):
+        parent = k + (k & -k)
+        if parent <= n:
+            tree[parent - 1] += tree[k - 1]
+    return tree
+
+def _fenwick_append(tree, value):
+    """Add *value* after the final value of *tree*."""
+    k = len(tree) + 1
+    tree.append(
+        value + _fenwick_prefix(tree, k - 1) -
+        _fenwick_prefix(tree, k - (k & -k))
+    )
+
+def _fenwick_add(tree, idx, delta):
+    k, n = idx + 1, len(tree)
+    while k <= n:
+        tree[k - 1] += delta
+        k += k & -k
+
+def _fenwick_prefix(tree, idx):
+    """Return the sum of the first *idx* values."""
+    total = 0
+    while idx > 0:
+        total += tree[idx - 1]
+        idx &= idx - 1
+    return total
+
+def _fenwick_search(tree, value):
+    """Return a tuple giving the largest index i such that the sum of the
+    first i (non-negative) values is at most *value* and that sum.
+
+    """
+    pos, remaining = 0, value
+    bit = 1 << (len(tree).bit_length() - 1) if len(tree) > 0 else 0
+    while bit:
+        nxt = pos + bit
+        if nxt <= len(tree) and tree[nxt - 1] <= remaining:
+            pos = nxt
+            remaining -= tree[nxt - 1]
+        bit >>= 1
+    return pos, value - remaining
@@ -0,0 +1,183 @@
+"""
+Copy-on-write snapshots of the contents of a bytegapbuffer.
+
+"""
+from collections.abc import Sequence
+import threading
+
+class snapshot(Sequence):
+    """An immutable copy of the contents of a bytegapbuffer at the time its
+    snapshot() method was called. Snapshots are created by that method and
+    should not be created directly.
+
+    A snapshot shares the storage of the buffer. Before the buffer next
+    overwrites part of that storage, the affected blocks of
+    _BLOCK_SIZE bytes are copied into the snapshot, so taking a snapshot is
+    constant time and each subsequent edit copies at most the blocks it
+    touches. A snapshot may be read from other threads while the buffer is
+    modified.
+
+    While a snapshot shares the storage, the buffer cannot resize it in place.
+    Growing the gap moves the buffer to new storage, leaving the old storage
+    to the snapshot. Call release(), or use the snapshot as a context
+    manager, to drop a snapshot which is no longer needed.
+
+    """
+    _BLOCK_SIZE = 4<<10 # 4KiB
+    _ITER_CHUNK_SIZE = 64<<10 # 64KiB
+
+    # Implementation note:
+    # _view is a memoryview onto the shared storage with the gap between
+    # _gap_start and _gap_end. _saved maps block numbers of the storage to the
+    # bytes the block held when the snapshot was taken for blocks the buffer
+    # has since overwritten. _lock makes saving a block and reading the
+    # storage atomic with respect to each other so that a reader never sees
+    # a block part way through being overwritten. For a buffer created by
+    # from_file(), _head and _tail are views onto the read-only mapping of the
+    # file which come before and after the storage.
+
+    def __init__(self, ba, gap_start, gap_end, head=b'', tail=b''):
+        self._view = memoryview(ba)
+        self._gap_start, self._gap_end = gap_start, gap_end
+        self._head, self._tail = memoryview(head), memoryview(tail)
+        self._n_head = len(head)
+        self._n_window = len(ba) - (gap_end - gap_start)
+        self._length = self._n_head + self._n_window + len(tail)
+        self._saved = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            k = k if k >= 0 else k + self._length
+            if k < 0 or k >= self._length:
+                raise IndexError('index out of range: %s' % (k,))
+            return bytearray(self._read(k, k + 1))[0]
+        elif isinstance(k, slice):
+            start, stop, step = k.indices(self._length)
+            if step == 1:
+                return self._read(start, max(start, stop))
+            lo, hi = (start, stop) if step > 0 else (stop + 1, start + 1)
+            return self._read(lo, max(lo, hi))[start - lo::step]
+        raise TypeError('invalid index type: %s' % (type(k),))
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            for v in bytearray(chunk):
+                yield v
+
+    def __eq__(self, other):
+        if isinstance(other, snapshot):
+            other = other.tobytes()
+        try:
+            with memoryview(other) as view:
+                if view.format == 'B' and view.ndim == 1:
+                    return self.tobytes() == view
+        except TypeError:
+            pass
+        return self.tobytes() == bytes(bytearray(other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'snapshot(%r)' % (self.tobytes(),)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def iter_chunks(self, size=None):
+        """Return an iterator over the contents as bytes objects of length
+        *size*, except possibly the last which may be shorter. If *size* is
+        None, a default chunk size is used.
+
+        """
+        size = size if size is not None else self._ITER_CHUNK_SIZE
+        if size < 1:
+            raise ValueError('chunk size must be positive: %r' % (size,))
+        def g():
+            for idx in range(0, self._length, size):
+                yield self._read(idx, min(self._length, idx + size))
+        return g()
+
+    def tobytes(self):
+        """Return the contents as a bytes object."""
+        return self._read(0, self._length)
+
+    def release(self):
+        """Stop sharing storage with the buffer. The snapshot may no longer be
+        read.
+
+        """
+        with self._lock:
+            if self._view is not None:
+                for view in (self._view, self._head, self._tail):
+                    view.release()
+                self._view, self._saved = None, None
+
+    def _shares(self, ba):
+        """Return True if the snapshot shares the storage *ba*."""
+        return self._view is not None and self._view.obj is ba
+
+    def _preserve(self, start, stop):
+        """Save the blocks of the storage which overlap the range [*start*,
+        *stop*), which is about to be overwritten.
+
+        """
+        size, saved = self._BLOCK_SIZE, self._saved
+        with self._lock:
+            if self._view is None:
+                return
+            for block in range(start // size, (stop - 1) // size + 1):
+                lo = block * size
+                hi = min(lo + size, len(self._view))
+                if block in saved or \
+                        (lo >= self._gap_start and hi <= self._gap_end):
+                    continue
+                saved[block] = self._view[lo:hi].tobytes()
+
+    def _read(self, start, stop):
+        """Return the contents between *start* and *stop* as bytes."""
+        if start >= stop:
+            return b''
+        # map to ranges of the storage, less the head, and of the tail
+        n_head, n_window = self._n_head, self._n_window
+        head = slice(start, min(stop, n_head))
+        tail = slice(max(0, start - n_head - n_window),
+                     max(0, stop - n_head - n_window))
+        start = min(max(0, start - n_head), n_window)
+        stop = min(max(0, stop - n_head), n_window)
+        gs, gap_size = self._gap_start, self._gap_end - self._gap_start
+        ranges = []
+        if start < min(stop, gs):
+            ranges.append((start, min(stop, gs)))
+        if stop > max(start, gs):
+            ranges.append((max(start, gs) + gap_size, stop + gap_size))
+
+        size, pieces = self._BLOCK_SIZE, []
+        with self._lock:
+            if self._view is None:
+                raise ValueError('snapshot has been released')
+            pieces.append(self._head[head].tobytes())
+            saved = self._saved
+            for lo, hi in ranges:
+                while lo < hi:
+                    block, offset = divmod(lo, size)
+                    n = min(hi - lo, size - offset)
+                    if block in saved:
+                        pieces.append(saved[block][offset:offset + n])
+                    else:
+                        # read up to the next saved block in one go
+                        end = lo + n
+                        while end < hi and end // size not in saved:
+                            end = min(hi, end + size)
+                        pieces.append(self._view[lo:end].tobytes())
+                        n = end - lo
+                    lo += n
+            pieces.append(self._tail[tail].tobytes())
+        return b''.join(pieces)
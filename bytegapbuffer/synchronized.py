@@ -0,0 +1,271 @@
+"""
+Thread-safe variants of bytegapbuffer and codedstring which allow many
+concurrent readers and a single writer.
+
+"""
+from functools import wraps
+import threading
+from _thread import get_ident
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.codedstring import codedstring
+
+class rwlock(object):
+    """A readers-writer lock. It may be held by any number of threads for
+    reading or by a single thread for writing. Threads waiting to write take
+    priority over threads which have not yet started reading so that a steady
+    stream of readers cannot starve a writer.
+
+    Both modes are reentrant and a thread holding the lock for writing may
+    also take it for reading. A thread holding the lock only for reading may
+    not take it for writing; RuntimeError is raised if it tries to.
+
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+        self._read_guard = _guard(self.acquire_read, self.release_read)
+        self._write_guard = _guard(self.acquire_write, self.release_write)
+
+    def read(self):
+        """Return a context manager holding the lock for reading."""
+        return self._read_guard
+
+    def write(self):
+        """Return a context manager holding the lock for writing."""
+        return self._write_guard
+
+    def acquire_read(self):
+        """Acquire the lock for reading."""
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if depth == 0 and self._writer != get_ident():
+            with self._cond:
+                while self._writer is not None or self._waiting_writers > 0:
+                    self._cond.wait()
+                self._readers += 1
+        local.depth = depth + 1
+
+    def release_read(self):
+        """Release the lock after acquire_read()."""
+        local = self._local
+        local.depth -= 1
+        if local.depth == 0 and self._writer != get_ident():
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        """Acquire the lock for writing."""
+        me = get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, 'depth', 0) > 0:
+            raise RuntimeError('cannot write while holding the lock to read')
+
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers > 0:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer, self._write_depth = me, 1
+
+    def release_write(self):
+        """Release the lock after acquire_write()."""
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+class _guard(object):
+    """Context manager calling *acquire* on entry and *release* on exit."""
+    __slots__ = ('_acquire', '_release')
+
+    def __init__(self, acquire, release):
+        self._acquire, self._release = acquire, release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, *args):
+        self._release()
+
+def _reader(method):
+    """Wrap *method* to run with the lock held for reading."""
+    @wraps(method)
+    def f(self, *args, **kwargs):
+        with self.reading():
+            return method(self, *args, **kwargs)
+    return f
+
+def _writer(method):
+    """Wrap *method* to run with the lock held for writing."""
+    @wraps(method)
+    def f(self, *args, **kwargs):
+        with self.writing():
+            return method(self, *args, **kwargs)
+    return f
+
+def _iterator(method):
+    """Wrap *method*, which returns an iterator, so that the lock is held
+    for reading while the iterator is created and while each item is
+    produced. The contents may change between items.
+
+    """
+    @wraps(method)
+    def f(self, *args, **kwargs):
+        with self.reading():
+            it = iter(method(self, *args, **kwargs))
+        def g():
+            while True:
+                with self.reading():
+                    try:
+                        v = next(it)
+                    except StopIteration:
+                        return
+                yield v
+        return g()
+    return f
+
+def _synchronize(cls, readers=(), writers=(), iterators=()):
+    """Replace the named methods of *cls*, which it inherits, with ones which
+    hold its lock.
+
+    """
+    for wrapper, names in ((_reader, readers), (_writer, writers),
+                           (_iterator, iterators)):
+        for name in names:
+            setattr(cls, name, wrapper(getattr(cls, name)))
+
+class synchronizedbytegapbuffer(bytegapbuffer):
+    """A bytegapbuffer which may be used from several threads at once. It
+    takes the same arguments as bytegapbuffer.
+
+    Methods which only read the contents, such as find(), slicing and
+    segments(), hold a readers-writer lock for reading and so run
+    concurrently with each other. Methods which modify the buffer, its marks
+    or journal hold it for writing. The line index and mark set are built
+    when the buffer is created so that looking up lines and marks, including
+    the position of a mark, only needs the lock for reading. Iterators hold
+    it for reading while producing each item and so may see modifications
+    made between items.
+
+    Objects which refer to the storage, such as the views returned by
+    segments() and getbuffer(), are only valid while the lock is held. Use
+    reading() to hold it across several calls. copy() returns an ordinary
+    bytegapbuffer.
+
+    """
+    def __init__(self, *args, **kwargs):
+        self._rwlock = rwlock()
+        bytegapbuffer.__init__(self, *args, **kwargs)
+        self._line_index()
+        self._mark_set()
+
+    def reading(self):
+        """Return a context manager which holds the lock for reading."""
+        return self._rwlock.read()
+
+    def writing(self):
+        """Return a context manager which holds the lock for writing."""
+        return self._rwlock.write()
+
+    def _mark_set(self):
+        # pylint: disable=protected-access
+        marks = bytegapbuffer._mark_set(self)
+        marks._reading = self._rwlock.read
+        return marks
+
+_synchronize(
+    synchronizedbytegapbuffer,
+    readers=(
+        '__buffer__', '__contains__', '__eq__', '__getitem__', '__len__',
+        '__ne__', '__repr__', 'copy', 'count', 'digest', 'endswith', 'find',
+        'index', 'line_count', 'line_of', 'marks', 'offset_of_line', 'rfind',
+        'rindex', 'search', 'segments', 'startswith', 'writeto',
+    ),
+    writers=(
+        '__delitem__', '__iadd__', '__setitem__', 'add_mark', 'append',
+        'apply_edits', 'clear', 'compact', 'extend', 'getbuffer', 'insert',
+        'insert_bytes', 'pop', 'readfrom', 'redo', 'remove', 'remove_mark',
+        'reverse', 'save', 'snapshot', 'start_journal', 'stop_journal',
+        'undo',
+    ),
+    iterators=('__reversed__', 'finditer', 'iter_chunks', 'iter_search'),
+)
+
+class synchronizedcodedstring(codedstring):
+    """A codedstring which may be used from several threads at once. It
+    takes the same arguments as codedstring.
+
+    If *bgb* is None, a synchronizedbytegapbuffer is created. If it is a
+    synchronizedbytegapbuffer, the string shares its lock so that the buffer
+    may also be used directly. Otherwise the buffer must only be accessed
+    via the string.
+
+    Locking is as for synchronizedbytegapbuffer. Until a lazy string has
+    been completely indexed, reading may extend the index and so holds the
+    lock for writing. The mark set is built once it has been.
+
+    """
+    def __init__(self, bgb=None, *args, **kwargs):
+        bgb = bgb if bgb is not None else synchronizedbytegapbuffer()
+        self._rwlock = getattr(bgb, '_rwlock', None) or rwlock()
+        with self._rwlock.write():
+            codedstring.__init__(self, bgb, *args, **kwargs)
+            if self._complete:
+                self._mark_set()
+
+    def reading(self):
+        """Return a context manager which holds the lock for reading or, if
+        the string is not completely indexed, for writing.
+
+        """
+        if self._complete:
+            return self._rwlock.read()
+        return self._rwlock.write()
+
+    def writing(self):
+        """Return a context manager which holds the lock for writing."""
+        return self._rwlock.write()
+
+    def _index_more(self):
+        codedstring._index_more(self)
+        if self._complete:
+            self._mark_set()
+
+    def _mark_set(self):
+        # pylint: disable=protected-access
+        marks = codedstring._mark_set(self)
+        marks._reading = self._rwlock.read
+        return marks
+
+_synchronize(
+    synchronizedcodedstring,
+    readers=(
+        '__contains__', '__getitem__', '__len__', 'byte_slice', 'count',
+        'estimated_len', 'index', 'map_byte_index', 'map_utf16_offset',
+        'marks', 'utf16_offset', 'view',
+    ),
+    writers=(
+        '__delitem__', '__iadd__', '__setitem__', 'add_mark', 'append',
+        'apply_edits', 'clear', 'extend', 'grapheme_count', 'grapheme_index',
+        'index_more', 'insert', 'map_grapheme_index', 'pop', 'readfrom',
+        'redo', 'remove', 'remove_mark', 'reverse', 'start_journal',
+        'stop_journal', 'undo',
+    ),
+    # views decode via _iter_range() and _iter_range_chunks()
+    iterators=(
+        '__iter__', '__reversed__', 'slice_iter', '_iter_range',
+        '_iter_range_chunks',
+    ),
+)
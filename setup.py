@@ -9,7 +9,5 @@ setup(
     author_email="rich.bytegapbuffer@richwareham.com",
     url="https://github.com/rjw57/bytegapbuffer",
     keywords=['gap buffer', 'editor', 'collection'],
-    install_requires=[
-        'future', # py2/3 compat
-    ],
+    python_requires='>=3.8',
 )
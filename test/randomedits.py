@@ -0,0 +1,40 @@
+"""
+Random edits shared by the tests which compare buffers and strings after
+long sequences of modifications.
+
+"""
+
+def random_edit(rng, b, pieces=None, max_len=30):
+    """Make a random edit to the bytegapbuffer or codedstring *b* using the
+    random.Random *rng*. Inserted items are chosen from *pieces* or, if it is
+    None, are random bytes. At most *max_len* random bytes are inserted, and
+    items deleted, at once.
+
+    """
+    def piece():
+        if pieces is not None:
+            return rng.choice(pieces)
+        return bytes(bytearray(rng.getrandbits(8)
+                               for _ in range(rng.randint(1, max_len))))
+
+    op = rng.random()
+    start = rng.randint(0, len(b))
+    if op < 0.3:
+        b[start:start] = piece()
+    elif op < 0.4:
+        if pieces is None:
+            b.insert(start, rng.getrandbits(8))
+        else:
+            b[start:start + rng.randint(0, 3)] = piece()
+    elif op < 0.6:
+        del b[start:start + rng.randint(1, max_len)]
+    elif op < 0.7:
+        del b[:rng.randint(0, 20)]
+    elif op < 0.8:
+        del b[-rng.randint(1, 20):]
+    elif op < 0.9 and pieces is None and len(b) > 0:
+        n = len(range(start, min(len(b), start + 50), 7))
+        b[start:start + 50:7] = bytearray(n)
+    else:
+        b.apply_edits([(0, min(len(b), 10), piece()),
+                       (len(b), len(b), piece())])
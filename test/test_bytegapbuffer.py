@@ -1,8 +1,9 @@
-# Make Python2 more like Python 3
-from future import standard_library
-standard_library.install_aliases()
-
+import array
+import hashlib
 import logging
+import random
+import re
+import sys
 from itertools import zip_longest, product
 
 from bytegapbuffer import bytegapbuffer as bgb # pylint: disable=import-error
@@ -270,3 +271,541 @@ def test_set_item(x, b):
         b[idx] = 45
         assert b[idx] == 45
     assert b == bytearray([45] * len(x))
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_move_gap(x, b):
+    # pylint: disable=protected-access
+    for g in list(range(len(x) + 1)) + list(range(len(x), -1, -1)):
+        b._move_gap(g)
+        assert b._gap_start == g
+        assert b == x
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_move_gap_rebuild(x, b):
+    # pylint: disable=protected-access
+    gap_size = b._gap_size
+    b._MOVE_REBUILD_THRESHOLD, b._MOVE_REBUILD_FRACTION = 0, 0
+    for g in list(range(len(x) + 1)) + list(range(len(x), -1, -1)):
+        b._move_gap(g)
+        assert b._gap_start == g
+        assert b._gap_size == gap_size
+        assert b == x
+
+@pytest.mark.parametrize('growth', [
+    'fixed', 'geometric', 'proportional', lambda length, needed, last: needed,
+])
+def test_growth_strategy(growth):
+    # pylint: disable=protected-access
+    x = bytearray()
+    b = bgb(init_gap_size=0, growth=growth)
+    for idx in range(5000):
+        x.insert(idx >> 1, idx & 0xff)
+        b.insert(idx >> 1, idx & 0xff)
+        assert b._gap_size >= 0
+    assert b == x
+
+def test_geometric_growth():
+    # pylint: disable=protected-access
+    b = bgb(init_gap_size=0, growth='geometric')
+    sizes = []
+    for idx in range(100000):
+        if b._gap_size == 0:
+            sizes.append(len(b._ba))
+        b.insert(idx, 65)
+    assert sizes == [0, 4<<10, 12<<10, 28<<10, 60<<10]
+
+def test_unknown_growth_strategy():
+    with pytest.raises(ValueError):
+        bgb(growth='not-a-strategy')
+
+def test_shrink_after_delete():
+    # pylint: disable=protected-access
+    x = bytearray(b'hello, world' * 10000)
+    b = bgb(x)
+    del x[10:-10]
+    del b[10:-10]
+    assert b == x
+    assert b._gap_size <= b._GAP_BLOCK_SIZE
+    assert len(b._ba) == len(x) + b._gap_size
+
+def test_no_shrink():
+    # pylint: disable=protected-access
+    b = bgb(b'hello, world' * 10000, shrink_fraction=None)
+    del b[10:-10]
+    assert b._gap_size >= 120000 - 20
+
+def test_copy_keeps_strategy():
+    # pylint: disable=protected-access
+    b = bgb(b'abc', growth='fixed', shrink_fraction=None)
+    c = b.copy()
+    assert c._growth is b._growth
+    assert c._shrink_fraction is None
+
+@pytest.mark.parametrize('x,b,idx', _insert_params_no_iv())
+def test_insert_bytes(x, b, idx):
+    logging.info('input x: %r', x)
+    logging.info('input b: %r', b)
+
+    s = b'some-sequence'
+    x[idx:idx] = s
+    b.insert_bytes(idx, s)
+    assert x == b
+
+    s = bytearray(b'another') * 1000
+    x[idx:idx] = s
+    b.insert_bytes(idx, memoryview(s))
+    assert x == b
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_insert_bytes_buffer_protocol(x, b):
+    a = array.array('H', [0x4142, 0x4344])
+    x[1:1] = a.tobytes()
+    b.insert_bytes(1, a)
+    assert x == b
+
+    x[0:0] = [1, 2, 3]
+    b.insert_bytes(0, (v for v in [1, 2, 3]))
+    assert x == b
+
+def test_insert_bytes_self():
+    # pylint: disable=protected-access
+    x = bytearray(b'hello')
+    b = bgb(x, init_gap_size=0)
+    x[2:2] = x
+    b.insert_bytes(2, memoryview(b._ba)[:5])
+    assert x == b
+
+@pytest.mark.parametrize('gap', range(9))
+def test_set_slice_self(gap):
+    # pylint: disable=protected-access
+    for start, stop in product(range(9), range(9)):
+        x = bytearray(b'abcdefgh')
+        b = bgb(x, init_gap_size=4)
+        b._move_gap(gap)
+        x[start:stop] = bytes(x)
+        b[start:stop] = b
+        assert b == x
+
+@pytest.mark.parametrize('gap', range(9))
+def test_set_slice_own_views(gap):
+    # pylint: disable=protected-access
+    for start, stop in product(range(9), range(9)):
+        x = bytearray(b'abcdefgh')
+        b = bgb(x, init_gap_size=4)
+        x[start:stop] = x[0:8]
+        v = b.getbuffer()[0:8]
+        b[start:stop] = v
+        v.release()
+        assert b == x
+
+        # both segments either side of the gap
+        for seg_idx in range(2):
+            x = bytearray(b'abcdefgh')
+            b = bgb(x, init_gap_size=4)
+            b._move_gap(gap)
+            segs = b.segments()
+            seg = segs[seg_idx] if seg_idx < len(segs) else memoryview(b'')
+            x[start:stop] = seg.tobytes()
+            b[start:stop] = seg
+            assert b == x
+
+def _apply_edits_reference(x, edits):
+    """Apply *edits* to the bytearray *x* one at a time from right to left."""
+    order = sorted(range(len(edits)), key=lambda i: edits[i][:2])
+    for i in reversed(order):
+        start, stop, data = edits[i]
+        x[start:stop] = data
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_apply_edits(x, b):
+    n = len(x)
+    edits = [(n, n, b'end'), (0, min(1, n), b''), (0, 0, b'ab'), (0, 0, b'c'),
+             (min(2, n), min(2, n), [0x44, 0x45])]
+    _apply_edits_reference(x, edits)
+    b.apply_edits(edits)
+    assert x == b
+
+@pytest.mark.parametrize('gap', [None, 0, 5, 1000])
+def test_apply_edits_random(gap):
+    # pylint: disable=protected-access
+    rng = random.Random(gap)
+    x = bytearray(rng.getrandbits(8) for _ in range(1000))
+    b = bgb(x, init_gap_size=0)
+    for _ in range(20):
+        points = sorted(rng.randint(0, len(x)) for _ in range(10))
+        edits = [
+            (start, stop, bytes(rng.getrandbits(8)
+                                for _ in range(rng.randint(0, 20))))
+            for start, stop in zip(points[::2], points[1::2])
+        ]
+        rng.shuffle(edits)
+        _apply_edits_reference(x, edits)
+        b.apply_edits(edits, gap=gap)
+        assert x == b
+        if gap is not None:
+            assert b._gap_start == min(gap, len(b))
+
+@pytest.mark.parametrize('edits,exc', [
+    ([(0, 2, b'x'), (1, 3, b'y')], ValueError),
+    ([(2, 5, b''), (3, 3, b'y')], ValueError),
+    ([(0, 1, b'x'), (4, 2, b'y')], IndexError),
+    ([(0, 1, b'x'), (-1, 2, b'y')], IndexError),
+    ([(0, 1, b'x'), (5, 6, b'y')], IndexError),
+    ([(0, 1, b'x'), (2, 3, None)], TypeError),
+])
+def test_apply_edits_invalid(edits, exc):
+    b = bgb(b'hello')
+    m = b.add_mark(3)
+    with pytest.raises(exc):
+        b.apply_edits(edits)
+    assert b == b'hello'
+    assert m.position == 3
+
+def test_apply_edits_listeners():
+    b = bgb(b'one\ntwo\nthree\n')
+    b.line_count()
+    m = b.add_mark(8)
+    b.apply_edits([(4, 7, b'2\n2'), (0, 3, b'1'), (8, 13, b'')])
+    assert b == b'1\n2\n2\n\n'
+    assert m.position == 6
+    assert [b.offset_of_line(i) for i in range(b.line_count())] == \
+        [0, 2, 4, 6, 7]
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_extend_bytes(x, b):
+    s = b'\x00\x01\x02' * 5000
+    x.extend(s)
+    b.extend(s)
+    assert x == b
+
+    x += s
+    b2 = b
+    b += s
+    assert b is b2
+    assert x == b
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_set_extended_slice(x, b):
+    x[::2] = bytearray(len(x[::2]))
+    b[::2] = bytearray(len(x[::2]))
+    assert x == b
+    y = bytes(x)
+    x[::-1] = y
+    b[::-1] = y
+    assert x == b
+    with pytest.raises(ValueError):
+        b[::2] = b'0123456789'
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_set_slice_int(x, b):
+    for k in (slice(0, 1), slice(None, None, 2), slice(None, None, -1)):
+        with pytest.raises(TypeError):
+            x[k] = len(x[k])
+        with pytest.raises(TypeError):
+            b[k] = len(x[k])
+        assert b == x
+    with pytest.raises(TypeError):
+        b.insert_bytes(0, 3)
+    assert b == x
+
+@pytest.mark.parametrize('gap', [0, 1, 50, 99, 100])
+def test_get_slice_large_steps(gap):
+    # pylint: disable=protected-access
+    x = bytearray(range(100))
+    b = bgb(x)
+    b._move_gap(gap)
+    for start, stop in product(range(-1, 102, 7), range(-1, 102, 9)):
+        for step in (-7, -3, -1, 1, 3, 7):
+            assert b[start:stop:step] == x[start:stop:step]
+        assert b[start::-2] == x[start::-2]
+        assert b[:stop:-5] == x[:stop:-5]
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_segments(x, b):
+    for start, stop in product(range(-1, 2+len(x)), range(-1, 2+len(x))):
+        segs = b.segments(start, stop)
+        assert len(segs) <= 2
+        assert all(isinstance(s, memoryview) for s in segs)
+        assert b''.join(segs) == x[start:stop]
+        for s in segs:
+            s.release()
+    assert b''.join(b.segments()) == x
+
+def test_segments_read_only():
+    b = bgb(b'hello')
+    s, = b.segments()
+    with pytest.raises(TypeError):
+        s[0] = 65
+
+def test_segments_zero_copy():
+    # pylint: disable=protected-access
+    b = bgb(b'hello, world')
+    b._move_gap(5)
+    pre, post = b.segments()
+    b._ba[0] = ord('j')
+    assert pre.tobytes() == b'jello'
+    assert post.tobytes() == b', world'
+
+def test_modify_with_live_segments():
+    x = bytearray(b'hello, world')
+    b = bgb(x, init_gap_size=0)
+    segs = b.segments()
+    x[5:5] = b'!' * 10000
+    b[5:5] = b'!' * 10000
+    assert b == x
+    del x[5:10005]
+    del b[5:10005]
+    assert b == x
+    del segs
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_getbuffer(x, b):
+    # pylint: disable=protected-access
+    v = b.getbuffer()
+    assert b._gap_start == len(x)
+    assert v.tobytes() == x
+    assert v.readonly
+
+@pytest.mark.skipif(sys.version_info < (3, 12),
+                    reason='Python buffer protocol needs Python 3.12')
+@pytest.mark.parametrize('gap', [0, 3, 10])
+def test_buffer_protocol(gap):
+    # pylint: disable=protected-access
+    b = bgb(b'0123456789')
+    b._move_gap(gap)
+    with memoryview(b) as v:
+        assert v.tobytes() == b'0123456789'
+        assert v.readonly
+    assert b._gap_start == gap
+    assert bytearray(b) == b'0123456789'
+    assert b.snapshot() == b
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_iter_chunks(x, b):
+    for size in (1, 2, 3, 100):
+        chunks = list(b.iter_chunks(size))
+        assert b''.join(chunks) == x
+        assert all(len(c) == size for c in chunks[:-1])
+    with pytest.raises(ValueError):
+        list(b.iter_chunks(0))
+
+def test_iterable_large():
+    # pylint: disable=protected-access
+    x = bytearray(range(256)) * 1000
+    b = bgb(x)
+    b._move_gap(1000)
+    assert list(b) == list(x)
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_equality(x, b):
+    assert b == bytes(x)
+    assert b == list(x)
+    assert b == memoryview(x)
+    assert b != x + b'!'
+    assert b != b'!' + x
+    assert b != list(x) + [1]
+    assert b == array.array('B', x)
+    assert bgb(b'\xff') != array.array('b', [-1])
+    strided = memoryview(bytes(bytearray(v for c in x for v in (c, 0))))[::2]
+    assert b == strided
+    assert bgb(b'ace') == memoryview(b'abcdef')[::2]
+    assert bgb(b'acf') != memoryview(b'abcdef')[::2]
+    for c in _test_buffers(x):
+        assert b == c
+    c = bgb(x + b'!')
+    assert b != c
+    assert c != b
+    if len(x) > 0:
+        y = bytearray(x)
+        y[-1] ^= 1
+        assert b != y
+        assert b != bgb(y)
+
+@pytest.mark.parametrize('x,b', _test_vectors_and_bufs())
+def test_digest(x, b):
+    assert b.digest() == hashlib.sha256(x).digest()
+    assert b.digest('md5') == hashlib.md5(x).digest()
+
+_SEARCH_VECTOR = b'abaabaaabaaaab' * 3
+
+def _search_bufs():
+    # pylint: disable=protected-access
+    for gap in range(len(_SEARCH_VECTOR) + 1):
+        b = bgb(_SEARCH_VECTOR)
+        b._move_gap(gap)
+        yield bytearray(_SEARCH_VECTOR), b
+
+_SEARCH_NEEDLES = [
+    b'', b'a', b'b', b'aa', b'aaa', b'ab', b'ba', b'aab', b'abaa',
+    b'baaab', b'x', _SEARCH_VECTOR, ord('b'),
+]
+_SEARCH_BOUNDS = [
+    (None, None), (3, None), (None, -3), (5, 30), (-20, -2), (30, 5), (100, None)
+]
+
+@pytest.mark.parametrize('x,b', _search_bufs())
+def test_find_rfind(x, b):
+    for sub, (i, j) in product(_SEARCH_NEEDLES, _SEARCH_BOUNDS):
+        assert b.find(sub, i, j) == x.find(sub, i, j)
+        assert b.rfind(sub, i, j) == x.rfind(sub, i, j)
+
+@pytest.mark.parametrize('x,b', _search_bufs())
+def test_rindex(x, b):
+    assert b.rindex(b'aab') == x.rindex(b'aab')
+    with pytest.raises(ValueError):
+        b.rindex(b'x')
+
+@pytest.mark.parametrize('x,b', _search_bufs())
+def test_count(x, b):
+    for sub, (i, j) in product(_SEARCH_NEEDLES, _SEARCH_BOUNDS):
+        assert b.count(sub, i, j) == x.count(sub, i, j)
+
+@pytest.mark.parametrize('x,b', _search_bufs())
+def test_finditer(x, b):
+    for sub, (i, j) in product(_SEARCH_NEEDLES, _SEARCH_BOUNDS):
+        found = list(b.finditer(sub, i, j))
+        assert len(found) == x.count(sub, i, j)
+        if isinstance(sub, int):
+            sub = bytes(bytearray((sub,)))
+        for f in found:
+            assert x[f:f+len(sub)] == sub
+
+@pytest.mark.parametrize('gap', range(12))
+def test_finditer_while_editing(gap):
+    # pylint: disable=protected-access
+    b = bgb(b'ab-ab-abab-')
+    b._move_gap(gap)
+    found = []
+    for f in b.finditer(b'ab'):
+        found.append(f)
+        b[f:f+2] = b'ba'
+        b.insert(0, ord('-'))
+        del b[0]
+    assert found == [0, 3, 6, 8]
+    assert b == b'ba-ba-baba-'
+
+@pytest.mark.parametrize('x,b', _search_bufs())
+def test_startswith_endswith(x, b):
+    for sub, (i, j) in product(_SEARCH_NEEDLES, _SEARCH_BOUNDS):
+        if isinstance(sub, int):
+            continue
+        assert b.startswith(sub, i, j) == x.startswith(sub, i, j)
+        assert b.endswith(sub, i, j) == x.endswith(sub, i, j)
+    assert b.startswith((b'x', b'aba'))
+    assert b.endswith((b'x', b'aab'))
+    assert not b.endswith((b'x', b'y'))
+
+@pytest.mark.parametrize('x,b', _search_bufs())
+def test_in_int(x, b):
+    assert ord('a') in b
+    assert ord('x') not in b
+
+_REGEX_VECTOR = b'hello world\nfoo bar baz\nbarbaz foobar\n' * 3
+_REGEX_PATTERNS = [
+    rb'o+', rb'\bbar\w*', rb'^\w+', rb'(?m)^\w+', rb'(?m)\w+$', rb'z\n?',
+    rb'(?<=o) ', rb'(?P<a>ba)(?P<b>r|z)', rb'x*', rb'world\nfoo', rb'\Z',
+    rb'nomatch',
+]
+
+def _regex_bufs():
+    # pylint: disable=protected-access
+    for gap in range(0, len(_REGEX_VECTOR) + 1, 3):
+        b = bgb(_REGEX_VECTOR)
+        b._move_gap(gap)
+        yield b
+
+@pytest.mark.parametrize('b', _regex_bufs())
+@pytest.mark.parametrize('overlap', [None, 16])
+def test_regex_search(b, overlap):
+    x = _REGEX_VECTOR
+    for p, (i, j) in product(_REGEX_PATTERNS, [(0, None), (5, 60), (40, 41)]):
+        r = re.compile(p)
+        stop = len(x) if j is None else j
+        expected = r.search(x, i, stop)
+        m = b.search(p, i, j, overlap=overlap)
+        if expected is None:
+            assert m is None
+            continue
+        assert m.span() == expected.span()
+        assert m.group() == expected.group()
+        assert m.groups() == expected.groups()
+        assert m.groupdict() == expected.groupdict()
+
+@pytest.mark.parametrize('b', _regex_bufs())
+@pytest.mark.parametrize('overlap', [None, 16])
+def test_iter_search(b, overlap):
+    x = _REGEX_VECTOR
+    for p in _REGEX_PATTERNS:
+        r = re.compile(p)
+        expected = [m.span() for m in r.finditer(x)]
+        found = b.iter_search(r, overlap=overlap)
+        assert [m.span() for m in found] == expected
+
+@pytest.mark.parametrize('gap', range(0, 48, 5))
+def test_iter_search_while_editing(gap):
+    # pylint: disable=protected-access
+    b = bgb(b'foo bar\n' * 6)
+    b._move_gap(gap)
+    for m in b.iter_search(rb'(?m)^\w+', overlap=4):
+        b[m.start():m.end()] = m.group().upper()
+    assert b == b'FOO bar\n' * 6
+
+def test_finditer_is_literal():
+    b = bgb(b'a+b aab a+')
+    assert list(b.finditer(b'a+')) == [0, 8]
+    assert [m.span() for m in b.iter_search(b'a+')] == \
+        [(0, 1), (4, 6), (8, 9)]
+    assert b.search(b'a+', 1).span() == (4, 6)
+    with pytest.raises(TypeError):
+        b.finditer(re.compile(b'a+'))
+
+_LOOKBEHIND_PATTERNS = [
+    rb'(?<=ld\n)f', rb'(?<=ba)r', rb'(?<!ba)r', rb'(?<=o w)or', rb'(?<=r\n)b',
+    rb'(?<!foo)bar\w?', rb'(?<=o)o', rb'(?<=\n)\w+',
+]
+
+@pytest.mark.parametrize('gap', range(len(_REGEX_VECTOR) + 1))
+@pytest.mark.parametrize('overlap', [None, 16])
+def test_regex_lookbehind(gap, overlap):
+    # pylint: disable=protected-access
+    x = _REGEX_VECTOR
+    b = bgb(x)
+    b._move_gap(gap)
+    for p in _LOOKBEHIND_PATTERNS:
+        r = re.compile(p)
+        for i in (0, gap, gap + 1):
+            expected = r.search(x, i)
+            m = b.search(r, i, overlap=overlap)
+            assert (m and m.span()) == (expected and expected.span())
+        expected = [m.span() for m in r.finditer(x)]
+        found = b.iter_search(r, overlap=overlap)
+        assert [m.span() for m in found] == expected
+
+def test_regex_lookbehind_across_gap():
+    # pylint: disable=protected-access
+    b = bgb(b'xxxxabcyyyy')
+    b._move_gap(5)
+    assert b.search(rb'(?<=ab)c').span() == (6, 7)
+    assert [m.span() for m in b.iter_search(rb'(?<=ab)c')] == [(6, 7)]
+    b = bgb(b'xxxa\nbyyy')
+    b._move_gap(4)
+    assert b.search(rb'(?<=a\n)b').span() == (5, 6)
+
+def test_gapmatch():
+    # pylint: disable=protected-access
+    b = bgb(b'hello, world')
+    b._move_gap(9)
+    m = b.search(rb'(?P<w>w(o)r)(x)?')
+    assert m.span() == (7, 10)
+    assert m.span('w') == (7, 10)
+    assert m.start(2) == 8
+    assert m.end(3) == -1
+    assert m.group(1, 2) == (b'wor', b'o')
+    assert m['w'] == b'wor'
+    assert m.groups(b'') == (b'wor', b'o', b'')
+    assert m.lastindex == 1
+    assert m.lastgroup == 'w'
+    with pytest.raises(IndexError):
+        m.group(4)
+    with pytest.raises(IndexError):
+        m.group('nope')
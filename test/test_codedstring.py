@@ -2,16 +2,16 @@
 Tests for coded string.
 
 """
-from __future__ import unicode_literals
-
 import array
 import codecs
 import logging
 import os
+import random
 
 import pytest
 
 from bytegapbuffer import bytegapbuffer
+from bytegapbuffer import codedstring as codedstring_module
 from bytegapbuffer.codedstring import codedstring
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
@@ -22,22 +22,18 @@ with open(os.path.join(DATA_DIR, 'UTF-8-demo.txt'), 'rb') as f:
 with open(os.path.join(DATA_DIR, 'UTF-8-test.txt'), 'rb') as f:
     TORTURE_BUF = f.read()
 
-@pytest.fixture
 def empty_string():
     s = ''
     return s, codedstring()
 
-@pytest.fixture
 def ascii_string():
     s = 'hello, world'
     return s, codedstring(bytegapbuffer(s.encode('utf-8')))
 
-@pytest.fixture
 def demo_string():
     buf = DEMO_BUF
     return codecs.decode(buf, 'utf-8'), codedstring(bytegapbuffer(buf))
 
-@pytest.fixture
 def torture_string():
     buf = TORTURE_BUF
     return (
@@ -54,6 +50,10 @@ def test_default_buf():
     assert cs.buffer is not None
     assert isinstance(cs.buffer, bytegapbuffer)
 
+@pytest.fixture(name='demo_string')
+def demo_string_fixture():
+    return demo_string()
+
 def test_buffer_property(demo_string):
     s, cs = demo_string
     assert cs.buffer == bytearray(s.encode('utf-8'))
@@ -319,3 +319,336 @@ def test_slice_iter(s, cs):
         assert s[idx:idx+5] == ''.join(cs.slice_iter(slice(idx,idx+5)))
         assert s[idx:idx+5:2] == ''.join(cs.slice_iter(slice(idx, idx+5, 2)))
         assert s[-idx-10:-idx-1] == ''.join(cs.slice_iter(slice(-idx-10, -idx-1)))
+
+@pytest.mark.parametrize('s,cs', [
+    ascii_string(), demo_string()
+])
+def test_large_slice_delete(s, cs):
+    s = list(s)
+    for start, stop in [(len(s) // 3, 2 * len(s) // 3), (0, 3), (-4, None)]:
+        del s[start:stop]
+        del cs[start:stop]
+
+        assert len(s) == len(cs)
+        assert ''.join(s) == cs[:]
+        assert cs.buffer == bytearray(''.join(s).encode('utf-8'))
+
+@pytest.mark.parametrize('buf,encoding', [
+    (b'', 'utf-8'),
+    (b'hello, world', 'utf-8'),
+    (DEMO_BUF, 'utf-8'),
+    (DEMO_BUF, 'UTF8'),
+    (TORTURE_BUF, 'utf-8'),
+    (DEMO_BUF, 'latin-1'),
+    (DEMO_BUF, 'ascii'),
+    (DEMO_BUF, 'cp1252'),
+    ('\N{LONG LEFTWARDS ARROW} abc'.encode('utf-16'), 'utf-16'),
+])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1<<20])
+def test_fast_index(buf, encoding, chunk_size, monkeypatch):
+    monkeypatch.setattr(codedstring_module, '_INDEX_CHUNK_SIZE', chunk_size)
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    expected = codedstring_module._index_byte_array(buf, decoder)
+    for b in (buf, bytegapbuffer(buf)):
+        index, length = codedstring_module._index_buffer(
+            b, encoding, codecs.getincrementaldecoder(encoding)('replace')
+        )
+        assert (list(index), length) == (list(expected[0]), expected[1])
+
+@pytest.mark.parametrize('text', [
+    '',
+    'hello, world',
+    codecs.decode(DEMO_BUF, 'utf-8'),
+    'a\N{LONG LEFTWARDS ARROW}\U0001F600\xe9\ud800b\udfff\uffff\x7f\x80',
+])
+@pytest.mark.parametrize('encoding', [
+    'utf-8', 'latin-1', 'ascii', 'cp1252', 'utf-16',
+])
+def test_text_index(text, encoding):
+    encoded = codecs.encode(text, encoding, 'replace')
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    expected = codedstring_module._index_byte_array(encoded, decoder)
+    index, length = codedstring_module._index_text(
+        text, encoded, encoding,
+        codecs.getincrementaldecoder(encoding)('replace')
+    )
+    assert (list(index), length) == (list(expected[0]), expected[1])
+
+@pytest.mark.parametrize('s,cs', [
+    ascii_string(), demo_string(), empty_string()
+])
+def test_slice_iter_chunked(s, cs, monkeypatch):
+    monkeypatch.setattr(codedstring_module, '_DECODE_CHUNK_SIZE', 7)
+    assert s == ''.join(cs.slice_iter(slice(None)))
+    assert s[::-1] == ''.join(cs.slice_iter(slice(None, None, -1)))
+    for idx in range(0, len(s), 97):
+        assert s[idx:idx+50:3] == ''.join(cs.slice_iter(slice(idx, idx+50, 3)))
+        assert s[idx:idx-50:-2] == \
+            ''.join(cs.slice_iter(slice(idx, idx-50, -2)))
+
+def test_slice_iter_after_modification():
+    cs = codedstring(bytegapbuffer('abc\N{LONG LEFTWARDS ARROW}def'.encode()))
+    del cs[1:2]
+    cs.insert(2, '\xe9\xe9')
+    assert ''.join(cs.slice_iter(slice(1, 6))) == \
+        'c\xe9\xe9\N{LONG LEFTWARDS ARROW}d'
+
+@pytest.mark.parametrize('s,cs', [
+    ascii_string(), demo_string(), empty_string()
+])
+def test_view(s, cs, monkeypatch):
+    monkeypatch.setattr(codedstring_module, '_DECODE_CHUNK_SIZE', 7)
+    for start, stop in [(None, None), (3, 40), (-20, -5), (10, 5)]:
+        expected = s[start:stop]
+        v = cs.view(start, stop)
+        assert len(v) == len(expected)
+        assert str(v) == expected
+        assert ''.join(v) == expected
+        assert ''.join(v.iter_chunks()) == expected
+        assert str(v[2:-2]) == expected[2:-2]
+        for idx in range(-len(expected), len(expected), 3):
+            assert v[idx] == expected[idx]
+        with pytest.raises(IndexError):
+            v[len(expected)]
+        with pytest.raises(ValueError):
+            v[::2]
+
+@pytest.mark.parametrize('encoding,fixed_width,expected_width', [
+    ('latin-1', None, 1),
+    ('cp1252', None, 1),
+    ('utf-32-le', None, 4),
+    ('UTF-32-BE', None, 4),
+    ('utf-16-le', 2, 2),
+    ('latin-1', 0, None),
+    ('utf-8', None, None),
+])
+def test_fixed_width(encoding, fixed_width, expected_width):
+    s = 'hello, w\xf6rld \xe9\xe8' * 20
+    cs = codedstring(
+        bytegapbuffer(s.encode(encoding)), encoding, fixed_width=fixed_width
+    )
+    assert cs.fixed_width == expected_width
+    if expected_width is not None:
+        assert cs._index.width == expected_width
+
+    s = list(s)
+    assert len(cs) == len(s)
+    del s[10:30]
+    del cs[10:30]
+    del s[-3]
+    del cs[-3]
+    s[5:7] = 'abc\xe9'
+    cs[5:7] = 'abc\xe9'
+    s[len(s):] = 'xyz'
+    cs[len(cs):] = 'xyz'
+    s = ''.join(s)
+
+    assert len(cs) == len(s)
+    assert cs[:] == s
+    assert cs[3:50:3] == s[3:50:3]
+    assert str(cs.view(-20)) == s[-20:]
+    assert cs.buffer == bytearray(s.encode(encoding))
+    for idx in range(len(s)):
+        assert cs[idx] == s[idx]
+        bs = cs.byte_slice(idx)
+        assert cs.map_byte_index(bs.start) == idx
+        assert cs.map_byte_index(bs.stop - 1) == idx
+
+    del cs[:]
+    assert len(cs) == 0
+    cs[0:0] = s
+    assert cs[:] == s
+
+@pytest.mark.parametrize('encoding,fixed_width', [
+    ('utf-8', None), ('utf-16-le', None), ('utf-16-be', None),
+    ('latin-1', None), ('utf-16-le', 2),
+])
+def test_utf16_offsets(encoding, fixed_width):
+    s = 'a\xe9\N{LONG LEFTWARDS ARROW}\U0001F600b' * 10
+    if encoding == 'latin-1':
+        s = 'hello, w\xf6rld'
+    cs = codedstring(
+        bytegapbuffer(s.encode(encoding)), encoding, fixed_width=fixed_width
+    )
+    del cs[3:9]
+    s = s[:3] + s[9:]
+    ins = '\U0001F601x' if encoding != 'latin-1' else '\xe9x'
+    cs.insert(5, ins)
+    s = s[:5] + ins + s[5:]
+
+    if fixed_width == 2:
+        # UCS-2: surrogates are runes in their own right
+        s = s.encode('utf-16-le').decode('utf-16-le', 'surrogatepass')
+        s = [s[i:i+1] for i in range(len(s))]
+
+    offset = 0
+    for idx, ch in enumerate(s):
+        assert cs.utf16_offset(idx) == offset
+        assert cs.map_utf16_offset(offset) == idx
+        offset += len(ch.encode('utf-16-le')) // 2 if fixed_width is None \
+            else 1
+    assert cs.utf16_offset(len(s)) == offset
+    assert cs.map_utf16_offset(offset) == len(s)
+
+def test_utf16_offsets_unsupported():
+    cs = codedstring(bytegapbuffer('abc'.encode('utf-32-le')), 'utf-32-le')
+    with pytest.raises(ValueError):
+        cs.utf16_offset(0)
+    with pytest.raises(ValueError):
+        cs.map_utf16_offset(0)
+
+@pytest.mark.parametrize('s,starts', [
+    ('', []),
+    ('abc', [0, 1, 2]),
+    ('e\u0301x', [0, 2]),
+    ('\u0301e', [0, 1]),
+    ('a\r\nb\n\r', [0, 1, 3, 4, 5]),
+    ('\U0001F468\u200d\U0001F469\u200d\U0001F467!', [0, 5]),
+    ('\U0001F44D\U0001F3FD\u2764\ufe0f', [0, 2]),
+])
+def test_graphemes(s, starts):
+    cs = codedstring(bytegapbuffer(s.encode('utf-8')))
+    assert cs.grapheme_count() == len(starts)
+    for n, start in enumerate(starts + [len(s)]):
+        assert cs.map_grapheme_index(n) == start
+        assert cs.grapheme_index(start) == n
+    for idx in range(len(s)):
+        assert starts[cs.grapheme_index(idx)] <= idx
+
+def test_graphemes_after_modification():
+    rng = random.Random(4)
+    pieces = ['a', 'e\u0301', '\u0301', '\r', '\n', '\u200d', '\u2764',
+              '\ufe0f', '\U0001F3FD', 'xyz']
+    cs = codedstring(bytegapbuffer(''.join(pieces * 5).encode('utf-8')))
+    cs.grapheme_count()
+    for _ in range(200):
+        if rng.random() < 0.5 and len(cs) > 0:
+            start = rng.randrange(len(cs))
+            del cs[start:start + rng.randint(1, 4)]
+        else:
+            idx = rng.randint(0, len(cs))
+            cs.insert(idx, ''.join(rng.sample(pieces, 2)))
+
+        fresh = codedstring(bytegapbuffer(cs.buffer))
+        assert cs.grapheme_count() == fresh.grapheme_count()
+        for idx in range(len(cs) + 1):
+            assert cs.grapheme_index(idx) == fresh.grapheme_index(idx)
+        for n in range(fresh.grapheme_count() + 1):
+            assert cs.map_grapheme_index(n) == fresh.map_grapheme_index(n)
+
+def test_lazy(monkeypatch):
+    monkeypatch.setattr(codedstring_module, '_INDEX_CHUNK_SIZE', 101)
+    s = codecs.decode(DEMO_BUF, 'utf-8')
+    cs = codedstring(bytegapbuffer(DEMO_BUF), lazy=True)
+    assert cs._frontier == 0
+    assert cs.estimated_len() == len(DEMO_BUF)
+
+    assert cs[10] == s[10]
+    assert cs[100:200] == s[100:200]
+    assert ''.join(cs.slice_iter(slice(300, 310))) == s[300:310]
+    assert str(cs.view(400, 420)) == s[400:420]
+    assert cs.map_byte_index(1000) < len(s)
+    assert cs.utf16_offset(500) == len(s[:500].encode('utf-16-le')) // 2
+    assert 0 < cs._frontier < len(DEMO_BUF)
+    assert 0.5 * len(s) < cs.estimated_len() < 2 * len(s)
+
+    # edits before and at the frontier
+    frontier = cs._frontier
+    s = list(s)
+    del s[50:60]
+    del cs[50:60]
+    s[20:20] = '\N{LONG LEFTWARDS ARROW}abc'
+    cs[20:20] = '\N{LONG LEFTWARDS ARROW}abc'
+    idx = cs._length
+    s[idx:idx] = 'xyz'
+    cs[idx:idx] = 'xyz'
+    del s[idx + 1]
+    del cs[idx + 1]
+    s = ''.join(s)
+    assert cs._frontier < len(cs.buffer)
+    assert cs._frontier != frontier
+
+    while cs.index_more():
+        pass
+    assert cs._frontier == len(cs.buffer)
+    assert cs.estimated_len() == len(s)
+    assert len(cs) == len(s)
+    assert cs[:] == s
+    assert cs.buffer == bytearray(s.encode('utf-8'))
+
+@pytest.mark.parametrize('s', [
+    codecs.decode(DEMO_BUF, 'utf-8'), '\U0001F600' * 100, ''
+])
+def test_lazy_length(s, monkeypatch):
+    monkeypatch.setattr(codedstring_module, '_INDEX_CHUNK_SIZE', 7)
+    cs = codedstring(bytegapbuffer(s.encode('utf-8')), lazy=True)
+    assert cs[-5:] == s[-5:]
+    assert len(cs) == len(s)
+    assert list(cs._index) == list(codedstring(cs.buffer)._index)
+
+def test_lazy_ignored():
+    cs = codedstring(bytegapbuffer('abc'.encode('utf-16-le')), 'utf-16-le',
+                     lazy=True)
+    assert cs._complete
+    assert len(cs) == 3
+
+@pytest.mark.parametrize('make', [empty_string, ascii_string, demo_string])
+@pytest.mark.parametrize('gap', [None, 0, 3, 1000])
+def test_apply_edits(make, gap):
+    # pylint: disable=protected-access
+    s, cs = make()
+    rng = random.Random(len(s))
+    pieces = ['', 'x', '\N{LONG LEFTWARDS ARROW}', '\U0001F600z', 'e\u0301']
+    cs.grapheme_count()
+    for _ in range(10):
+        points = sorted(rng.randint(0, len(s)) for _ in range(6))
+        edits = [(start, stop, rng.choice(pieces))
+                 for start, stop in zip(points[::2], points[1::2])]
+        rng.shuffle(edits)
+        for start, stop, text in reversed(sorted(edits,
+                                                 key=lambda e: e[:2])):
+            s = s[:start] + text + s[stop:]
+        cs.apply_edits(edits, gap=gap)
+
+        assert len(cs) == len(s)
+        assert cs[:] == s
+        if gap is not None:
+            assert cs.buffer._gap_start == \
+                len(s[:gap].encode('utf-8'))
+        assert cs.buffer == bytearray(s.encode('utf-8'))
+        assert cs.grapheme_count() == \
+            codedstring(bytegapbuffer(cs.buffer)).grapheme_count()
+
+def test_apply_edits_lazy(monkeypatch):
+    # pylint: disable=protected-access
+    monkeypatch.setattr(codedstring_module, '_INDEX_CHUNK_SIZE', 7)
+    s = codecs.decode(DEMO_BUF, 'utf-8')
+    cs = codedstring(bytegapbuffer(DEMO_BUF), lazy=True)
+    applied = []
+    apply_edits = cs.buffer.apply_edits
+    def counted(edits, gap=None):
+        applied.append(edits)
+        apply_edits(edits, gap)
+    monkeypatch.setattr(cs.buffer, 'apply_edits', counted)
+
+    cs.apply_edits([(2, 4, 'X'), (0, 1, '\u00e9'), (10, 10, '!')], gap=5)
+    assert not cs._complete
+    assert len(applied) == 1
+    s = '\u00e9' + s[1:2] + 'X' + s[4:10] + '!' + s[10:]
+    assert cs.buffer._gap_start == len(s[:5].encode('utf-8'))
+    assert cs[:] == s
+    assert list(cs._index) == list(codedstring(cs.buffer)._index)
+
+def test_apply_edits_invalid():
+    cs = codedstring(bytegapbuffer('h\u00e9llo'.encode('utf-8')))
+    m = cs.add_mark(3)
+    for edits in ([(0, 2, 'x'), (1, 3, 'y')], [(0, 1, 'x'), (4, 6, 'y')],
+                  [(0, 1, 'x'), (2, 3, None)]):
+        with pytest.raises((ValueError, IndexError, TypeError)):
+            cs.apply_edits(edits)
+        assert cs[:] == 'h\u00e9llo'
+        assert m.position == 3
+
+    cs.apply_edits([(4, 5, '!'), (0, 1, 'H'), (2, 2, 'e')])
+    assert cs[:] == 'H\u00e9ell!'
+    assert m.position == 4
@@ -0,0 +1,162 @@
+"""
+Tests for buffers created from files with from_file().
+
+"""
+from itertools import product
+import random
+import re
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.codedstring import codedstring
+from randomedits import random_edit
+
+_SEARCH_VECTOR = b'abaabaaabaaaab' * 3
+
+_SEARCH_NEEDLES = [
+    b'', b'a', b'b', b'aa', b'aaa', b'ab', b'ba', b'aab', b'abaa',
+    b'baaab', b'x', _SEARCH_VECTOR, ord('b'),
+]
+_SEARCH_BOUNDS = [
+    (None, None), (3, None), (None, -3), (5, 30), (-20, -2), (30, 5), (100, None)
+]
+
+def _write(tmpdir, data, name='data'):
+    path = tmpdir.join(name)
+    path.write_binary(data)
+    return str(path)
+
+def _mapped_buf(tmpdir, data, gap, chunk_size=3):
+    """Return a buffer of *data* mapped from a file with a small window around
+    index *gap*.
+
+    """
+    # pylint: disable=protected-access
+    b = bytegapbuffer.from_file(_write(tmpdir, data))
+    b._MAP_CHUNK_SIZE = chunk_size
+    b._move_gap(gap)
+    b._move_gap(min(gap + 1, len(data)))
+    return b
+
+def test_read(tmpdir):
+    # pylint: disable=protected-access
+    data = bytes(bytearray(range(256))) * 40
+    b = bytegapbuffer.from_file(_write(tmpdir, data))
+    assert b._map is not None
+    assert len(b._ba) - b._gap_size == 0
+    assert len(b) == len(data)
+    assert b == data
+    assert b[:] == data
+    assert b[100:5000:3] == data[100:5000:3]
+    assert b[-1] == data[-1]
+    assert b''.join(bytes(s) for s in b.segments(10, 9000)) == data[10:9000]
+    assert b.find(b'\xfe\xff\x00') == data.find(b'\xfe\xff\x00')
+    assert b.digest() == bytegapbuffer(data).digest()
+
+    with pytest.raises(IndexError):
+        b[len(data)] # pylint: disable=pointless-statement
+
+def test_not_mapped(tmpdir):
+    # pylint: disable=protected-access
+    assert bytegapbuffer.from_file(_write(tmpdir, b'')) == b''
+    b = bytegapbuffer.from_file(_write(tmpdir, b'abc'), mmap=False,
+                                init_gap_size=5)
+    assert b._map is None
+    assert b == b'abc'
+    assert b._gap_size == 5
+
+def test_edits_stay_local(tmpdir):
+    # pylint: disable=protected-access
+    data = b'0123456789abcdef' * (64 << 10)
+    b = bytegapbuffer.from_file(_write(tmpdir, data))
+    b.insert_bytes(1000, b'inserted')
+    b[200000] = ord('X')
+    del b[:3]
+    del b[-3:]
+    expected = bytearray(data)
+    expected[1000:1000] = b'inserted'
+    expected[200000] = ord('X')
+    del expected[:3]
+    del expected[-3:]
+    assert b == expected
+    assert b.count(b'0123') == expected.count(b'0123')
+
+    # only the stretch between the edits has been copied, deleting from the
+    # ends only trims the mapping
+    assert len(b._ba) < len(data) // 4
+    assert b._n_head + b._n_tail > len(data) // 2
+
+    b.compact()
+    assert b._n_head == 0 and b._n_tail == 0
+    assert b == expected
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_edits(tmpdir, seed):
+    # pylint: disable=protected-access
+    rng = random.Random(seed)
+    data = bytes(bytearray(rng.getrandbits(8) for _ in range(2000)))
+    b = bytegapbuffer.from_file(_write(tmpdir, data))
+    b._MAP_CHUNK_SIZE = 16
+    # the same edits are made to an ordinary buffer
+    x = bytegapbuffer(data)
+    snapshots = []
+    for n_edits in range(200):
+        state = rng.getstate()
+        random_edit(rng, b)
+        rng.setstate(state)
+        random_edit(rng, x)
+        assert b == x
+        if n_edits % 20 == 0:
+            snapshots.append((b.snapshot(), x[:]))
+
+        start = rng.randint(0, len(x))
+        stop = rng.randint(start, len(x))
+        sub = x[start:start + rng.randint(0, 3)]
+        assert b[start:stop] == x[start:stop]
+        assert b.find(sub, start) == x.find(sub, start)
+        assert b.rfind(sub, None, stop) == x.rfind(sub, None, stop)
+        assert b.count(sub) == x.count(sub)
+
+    for s, expected in snapshots:
+        assert s == expected
+    assert b.copy() == x
+    assert b.snapshot() == x[:]
+
+@pytest.mark.parametrize('gap', range(len(_SEARCH_VECTOR) + 1))
+def test_search(tmpdir, gap):
+    # pylint: disable=protected-access
+    x = bytearray(_SEARCH_VECTOR)
+    b = _mapped_buf(tmpdir, _SEARCH_VECTOR, gap)
+    assert b._n_head > 0 or b._n_tail > 0
+    for sub, (i, j) in product(_SEARCH_NEEDLES, _SEARCH_BOUNDS):
+        assert b.find(sub, i, j) == x.find(sub, i, j)
+        assert b.rfind(sub, i, j) == x.rfind(sub, i, j)
+        assert b.count(sub, i, j) == x.count(sub, i, j)
+        if not isinstance(sub, int):
+            assert b.startswith(sub, i, j) == x.startswith(sub, i, j)
+            assert b.endswith(sub, i, j) == x.endswith(sub, i, j)
+
+    for p in [b'a+b', b'(?<=b)a', b'^a', b'b$', b'', b'a{3,}|ba']:
+        r = re.compile(p)
+        expected = [m.span() for m in r.finditer(x)]
+        assert [m.span() for m in b.iter_search(r)] == expected
+
+def test_lines_and_codedstring(tmpdir):
+    # pylint: disable=protected-access
+    text = 'h\xe9llo\nw\xf6rld \U0001F600\n' * 1000
+    path = _write(tmpdir, text.encode('utf-8'))
+    b = bytegapbuffer.from_file(path)
+    b._MAP_CHUNK_SIZE = 64
+    assert b.line_count() == 2001
+    cs = codedstring(b, 'utf-8')
+    assert cs[:] == text
+    cs.insert(20000, 'new')
+    del cs[5:7]
+    expected = text[:20000] + 'new' + text[20000:]
+    expected = expected[:5] + expected[7:]
+    assert cs[:] == expected
+    line_starts = [0] + [
+        m.end() for m in re.finditer(b'\n', expected.encode('utf-8'))
+    ]
+    assert [b.offset_of_line(n) for n in range(b.line_count())] == line_starts
@@ -0,0 +1,34 @@
+"""
+Tests for gap growth strategies.
+
+"""
+import pytest
+
+from bytegapbuffer.growth import (
+    fixed_growth, geometric_growth, proportional_growth
+)
+
+def test_fixed():
+    s = fixed_growth(16)
+    assert s(1000, 1, 0) == 16
+    assert s(1000, 16, 0) == 16
+    assert s(1000, 17, 16) == 32
+
+def test_geometric():
+    s = geometric_growth(2, 16)
+    assert s(1000, 1, 0) == 16
+    assert s(1000, 1, 16) == 32
+    assert s(1000, 100, 32) == 100
+
+def test_proportional():
+    s = proportional_growth(0.5, 16)
+    assert s(10, 1, 0) == 16
+    assert s(1000, 1, 0) == 500
+    assert s(1000, 600, 0) == 600
+
+@pytest.mark.parametrize('f,arg', [
+    (fixed_growth, 0), (geometric_growth, 0.5), (proportional_growth, 0),
+])
+def test_invalid(f, arg):
+    with pytest.raises(ValueError):
+        f(arg)
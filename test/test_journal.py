@@ -0,0 +1,193 @@
+"""
+Tests for the undo and redo journal.
+
+"""
+import random
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.codedstring import codedstring
+from randomedits import random_edit
+
+def _check_history(rng, b, snapshot, pieces):
+    # pylint: disable=protected-access
+    j = b.start_journal()
+    history = [snapshot(b)]
+    for _ in range(100):
+        # each edit is a separate undo step unless it was a no-op
+        j.boundary()
+        n_steps = len(j._undo)
+        random_edit(rng, b, pieces, max_len=5)
+        if len(j._undo) > n_steps:
+            history.append(snapshot(b))
+        else:
+            assert snapshot(b) == history[-1]
+
+    for expected in history[-2::-1]:
+        assert b.undo()
+        assert snapshot(b) == expected
+    assert not b.undo()
+    assert not j.can_undo
+
+    for expected in history[1:]:
+        assert b.redo()
+        assert snapshot(b) == expected
+    assert not b.redo()
+    assert not j.can_redo
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_edits(seed):
+    rng = random.Random(seed)
+    b = bytegapbuffer(b'0123456789' * 5)
+    _check_history(rng, b, lambda b: b[:], [b'', b'x', b'yz', b'\n' * 3])
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16-le', 'latin-1'])
+def test_random_edits_codedstring(seed, encoding):
+    rng = random.Random(seed)
+    s = 'héllo, € wörld \U0001F600 ' * 4
+    cs = codedstring(bytegapbuffer(s.encode(encoding, 'replace')), encoding)
+
+    def snapshot(cs):
+        # pylint: disable=protected-access
+        fresh = codedstring(bytegapbuffer(cs.buffer), encoding)
+        assert list(cs._index) == list(fresh._index)
+        assert len(cs) == len(fresh)
+        return bytes(cs.buffer[:])
+
+    pieces = ['', 'x', '€', 'a\U0001F600b']
+    _check_history(rng, cs, snapshot, pieces)
+
+def test_coalesce():
+    b = bytegapbuffer(b'hello world')
+    j = b.start_journal()
+    for idx, c in enumerate(b' there'):
+        b.insert(5 + idx, c)
+    del b[10]
+    del b[9]
+    del b[5]
+    del b[5]
+    assert b == b'hellohe world'
+    assert len(j._undo) == 3 # pylint: disable=protected-access
+
+    assert b.undo()
+    assert b == b'hello the world'
+    assert b.undo()
+    assert b == b'hello there world'
+    assert b.undo()
+    assert b == b'hello world'
+    assert not b.undo()
+
+    b.insert(0, ord('a'))
+    j.boundary()
+    b.insert(1, ord('b'))
+    assert b.undo()
+    assert b == b'ahello world'
+
+@pytest.mark.parametrize('text', [False, True])
+def test_coalesce_slices(text):
+    def item(s):
+        return s if text else s.encode('utf-8')
+    b = bytegapbuffer(b'hello world')
+    if text:
+        b = codedstring(b)
+    j = b.start_journal()
+    b[5:5] = item(' t')
+    b[7:7] = item('he')
+    if text:
+        b.insert(9, 're')
+    else:
+        b[9:9] = b're'
+    b[10:11] = item('')
+    b[9:10] = item('')
+    b[0:1] = item('J')
+    assert b[:] == item('Jello the world')
+    assert len(j._undo) == 3 # pylint: disable=protected-access
+
+    assert b.undo()
+    assert b[:] == item('hello the world')
+    assert b.undo()
+    assert b[:] == item('hello there world')
+    assert b.undo()
+    assert b[:] == item('hello world')
+    assert not b.undo()
+
+def test_group():
+    b = bytegapbuffer(b'abc')
+    j = b.start_journal()
+    with j.group():
+        b.insert(0, ord('x'))
+        with j.group():
+            del b[2]
+        b[:] = b'replaced'
+    b.extend(b'!')
+    assert b.undo()
+    assert b == b'replaced'
+    assert b.undo()
+    assert b == b'abc'
+    assert b.redo()
+    assert b == b'replaced'
+
+    with j.group():
+        with pytest.raises(RuntimeError):
+            b.undo()
+    assert b.redo()
+    assert b == b'replaced!'
+
+def test_undo_restores_marks_and_lines():
+    b = bytegapbuffer(b'one\ntwo\nthree\n')
+    b.start_journal()
+    b.line_count()
+    m = b.add_mark(len(b))
+    b.apply_edits([(0, 4, b''), (8, 8, b'2\n')])
+    b[0:0] = b'zero\n'
+    assert b.undo()
+    assert b.undo()
+    assert b == b'one\ntwo\nthree\n'
+    assert m.position == len(b)
+    assert [b.offset_of_line(i) for i in range(b.line_count())] == \
+        [0, 4, 8, 14]
+
+def test_max_bytes():
+    b = bytegapbuffer()
+    j = b.start_journal(max_bytes=1000)
+    for _ in range(20):
+        j.boundary()
+        b.extend(b'x' * 10)
+        del b[:5]
+    assert 0 < j.nbytes <= 1000
+    n_undone = 0
+    while b.undo():
+        n_undone += 1
+    assert 0 < n_undone < 40
+    assert j.nbytes <= 1000
+
+    b.extend(b'y' * 2000)
+    del b[:]
+    assert j.nbytes <= 1000
+    assert not b.undo()
+
+    j.clear()
+    assert j.nbytes == 0
+    assert not j.can_undo and not j.can_redo
+
+def test_stop_journal():
+    b = bytegapbuffer(b'abc')
+    with pytest.raises(ValueError):
+        b.undo()
+    j = b.start_journal()
+    assert b.start_journal(max_bytes=10) is j
+    assert j.max_bytes == 10
+    b.stop_journal()
+    with pytest.raises(ValueError):
+        b.redo()
+
+    cs = codedstring()
+    cs.start_journal()
+    cs.insert(0, 'abc')
+    assert cs.undo()
+    assert cs[:] == ''
+    cs.stop_journal()
+    with pytest.raises(ValueError):
+        cs.undo()
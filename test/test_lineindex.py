@@ -0,0 +1,63 @@
+"""
+Tests for the line index.
+
+"""
+import random
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+
+def _check_lines(b, x):
+    starts = [0] + [i + 1 for i, c in enumerate(x) if c == ord('\n')]
+    assert b.line_count() == len(starts)
+    for n, s in enumerate(starts):
+        assert b.offset_of_line(n) == s
+    assert b.offset_of_line(-1) == starts[-1]
+    for offset in range(len(x) + 1):
+        assert b.line_of(offset) == len([s for s in starts if s <= offset]) - 1
+    with pytest.raises(IndexError):
+        b.offset_of_line(len(starts))
+    with pytest.raises(IndexError):
+        b.line_of(len(x) + 1)
+
+@pytest.mark.parametrize('x', [
+    b'', b'\n', b'hello', b'hello\n', b'\nhello', b'a\nb\n\nc\n\n',
+])
+def test_initial_index(x):
+    # pylint: disable=protected-access
+    for gap in range(len(x) + 1):
+        b = bytegapbuffer(x)
+        b._move_gap(gap)
+        _check_lines(b, x)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_edits(seed):
+    rng = random.Random(seed)
+    x = bytearray(b'line one\nline two\n\nline four\n')
+    b = bytegapbuffer(x)
+    _check_lines(b, x)
+    for _ in range(100):
+        start = rng.randint(0, len(x))
+        stop = rng.randint(start, min(len(x), start + 10))
+        op = rng.choice(['insert', 'delete', 'replace', 'insert_one', 'step'])
+        if op == 'insert':
+            v = bytes(rng.choice(b'ab\n') for _ in range(rng.randint(0, 8)))
+            x[start:start] = v
+            b[start:start] = v
+        elif op == 'delete':
+            del x[start:stop]
+            del b[start:stop]
+        elif op == 'replace':
+            v = bytes(rng.choice(b'a\n') for _ in range(rng.randint(0, 8)))
+            x[start:stop] = v
+            b[start:stop] = v
+        elif op == 'insert_one':
+            x.insert(start, ord('\n'))
+            b.insert(start, ord('\n'))
+        else:
+            v = bytes(rng.choice(b'a\n') for _ in range(len(x[start:stop:2])))
+            x[start:stop:2] = v
+            b[start:stop:2] = v
+        assert b == x
+        _check_lines(b, x)
@@ -0,0 +1,128 @@
+"""
+Tests for marks.
+
+"""
+import random
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.codedstring import codedstring
+
+def _insert(model, start, n):
+    return [
+        (p + n if p > start or (p == start and not left) else p, left)
+        for p, left in model
+    ]
+
+def _delete(model, start, stop):
+    return [
+        (p if p < start else max(start, p - (stop - start)), left)
+        for p, left in model
+    ]
+
+def _check_marks(b, marks, model):
+    assert [m.position for m in marks] == [p for p, _ in model]
+    by_position = sorted(marks, key=lambda m: m.position)
+    assert [m.position for m in b.marks()] == \
+        [m.position for m in by_position]
+    for start, stop in [(0, 5), (3, 17), (len(b) // 2, len(b)), (4, 4)]:
+        found = b.marks(start, stop)
+        assert all(start <= m.position < stop for m in found)
+        assert len(found) == \
+            len([m for m in marks if start <= m.position < stop])
+        assert [m.position for m in found] == sorted(m.position for m in found)
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('leaf_size', [1, 3, 64])
+def test_random_edits(seed, leaf_size):
+    # pylint: disable=protected-access
+    rng = random.Random(seed)
+    b = bytegapbuffer(b'0123456789' * 5)
+    b._mark_set()._LEAF_SIZE = leaf_size
+    marks, model = [], []
+    for _ in range(200):
+        op = rng.random()
+        if op < 0.3:
+            p, left = rng.randint(0, len(b)), rng.random() < 0.5
+            marks.append(b.add_mark(p, left))
+            model.append((p, left))
+        elif op < 0.35 and len(marks) > 0:
+            idx = rng.randrange(len(marks))
+            b.remove_mark(marks[idx])
+            assert marks[idx].removed
+            del marks[idx]
+            del model[idx]
+        elif op < 0.7:
+            start, n = rng.randint(0, len(b)), rng.randint(1, 5)
+            b[start:start] = b'x' * n
+            model = _insert(model, start, n)
+        else:
+            start = rng.randint(0, len(b))
+            stop = min(len(b), start + rng.randint(1, 5))
+            del b[start:stop]
+            model = _delete(model, start, stop)
+        _check_marks(b, marks, model)
+
+def test_edits_stay_local():
+    # pylint: disable=protected-access
+    b = bytegapbuffer(b'x' * 100000)
+    model = [(p, p % 20 == 0) for p in range(0, 100000, 10)]
+    marks = [b.add_mark(p, left) for p, left in model]
+
+    def keys():
+        return [m._key for m in marks]
+
+    # typing at many cursors and then going back to the first only moves
+    # the marks near each edit individually
+    before = keys()
+    b.apply_edits([(p, p, b'y') for p in range(0, 100000, 20000)])
+    b.insert(1, ord('z'))
+    del b[50000:50005]
+    changed = sum(1 for k, l in zip(before, keys()) if k != l)
+    assert changed <= 7 * 2 * b._marks._LEAF_SIZE
+
+    for p in reversed(range(0, 100000, 20000)):
+        model = _insert(model, p, 1)
+    model = _delete(_insert(model, 1, 1), 50000, 50005)
+    _check_marks(b, marks, model)
+
+def test_gravity():
+    b = bytegapbuffer(b'hello world')
+    left = b.add_mark(5, left_gravity=True)
+    right = b.add_mark(5)
+    assert left.left_gravity and not right.left_gravity
+    b[5:5] = b','
+    assert (left.position, right.position) == (5, 6)
+    b.insert(0, ord('>'))
+    assert (left.position, right.position) == (6, 7)
+    del b[2:9]
+    assert (left.position, right.position) == (2, 2)
+    b.extend(b'!')
+    end = b.add_mark(len(b))
+    assert b.marks() == [left, right, end]
+    assert b.marks(0, len(b)) == [left, right]
+
+def test_removed_mark():
+    b = bytegapbuffer(b'abc')
+    m = b.add_mark(1)
+    b.remove_mark(m)
+    with pytest.raises(ValueError):
+        m.position
+    with pytest.raises(ValueError):
+        b.remove_mark(m)
+    with pytest.raises(IndexError):
+        b.add_mark(4)
+
+def test_codedstring_marks():
+    s = 'h\xe9llo w\N{LONG LEFTWARDS ARROW}rld'
+    cs = codedstring(bytegapbuffer(s.encode('utf-8')))
+    m = cs.add_mark(7)
+    assert cs[m.position] == '\N{LONG LEFTWARDS ARROW}'
+    cs.insert(0, '\xe9\xe9')
+    del cs[3:5]
+    assert cs[m.position] == '\N{LONG LEFTWARDS ARROW}'
+    cs[m.position:m.position] = 'abc'
+    assert cs[m.position] == '\N{LONG LEFTWARDS ARROW}'
+    assert cs.marks(0, 3) == []
+    assert cs.marks() == [m]
@@ -0,0 +1,157 @@
+"""
+Tests for appending to buffers from files with readfrom() and follow().
+
+"""
+import io
+import os
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer.codedstring import codedstring
+
+_TEXT = 'h\xe9llo w\xf6rld \U0001F600 €\n' * 20
+
+class _reader(object):
+    """A file-like object which only has read()."""
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def read(self, n):
+        return self._f.read(n)
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096, None])
+def test_readfrom(chunk_size):
+    # pylint: disable=protected-access
+    data = bytes(bytearray(range(256))) * 10
+    b = bytegapbuffer(b'start')
+    b._move_gap(2)
+    assert b.readfrom(io.BytesIO(data), chunk_size) == len(data)
+    assert b == b'start' + data
+    assert b._gap_start == len(b)
+    assert b.readfrom(io.BytesIO()) == 0
+
+    b = bytegapbuffer()
+    assert b.readfrom(_reader(data), chunk_size) == len(data)
+    assert b == data
+
+def test_readfrom_invalid():
+    with pytest.raises(ValueError):
+        bytegapbuffer().readfrom(io.BytesIO(b'x'), 0)
+
+def test_readfrom_fd():
+    r, w = os.pipe()
+    try:
+        os.write(w, b'hello ')
+        os.write(w, b'world')
+        os.close(w)
+        w = None
+        b = bytegapbuffer()
+        assert b.readfrom(r, 4) == 11
+        assert b == b'hello world'
+    finally:
+        os.close(r)
+        if w is not None:
+            os.close(w)
+
+def test_readfrom_non_blocking():
+    if not hasattr(os, 'set_blocking'):
+        pytest.skip('os.set_blocking() is not available')
+    r, w = os.pipe()
+    try:
+        os.set_blocking(r, False)
+        b = bytegapbuffer()
+        assert b.readfrom(r) == 0
+        os.write(w, b'abc')
+        assert b.readfrom(r) == 3
+        assert b.readfrom(r) == 0
+        os.write(w, b'def')
+        assert b.readfrom(r) == 3
+        assert b == b'abcdef'
+    finally:
+        os.close(r)
+        os.close(w)
+
+def test_follow(tmpdir):
+    path = str(tmpdir.join('log'))
+    with open(path, 'wb', buffering=0) as writer, open(path, 'rb') as f:
+        b = bytegapbuffer()
+        reads = b.follow(f, interval=0)
+        assert next(reads) == 0
+        writer.write(b'one\n')
+        assert next(reads) == 4
+        assert next(reads) == 0
+        writer.write(b'two\nthree\n')
+        assert next(reads) == 10
+        assert b == b'one\ntwo\nthree\n'
+        assert b.line_count() == 4
+
+def test_ring():
+    # pylint: disable=protected-access
+    lines = [('line %d\n' % n).encode('ascii') for n in range(100)]
+    data = b''.join(lines)
+    b = bytegapbuffer()
+    b.line_count()
+    m = b.add_mark(0, left_gravity=True)
+    end = b.add_mark(0)
+    s = b.snapshot()
+    assert b.readfrom(io.BytesIO(data), 10, max_len=50) == len(data)
+    assert b == data[-50:]
+    assert b._gap_start == len(b)
+    assert s == b''
+    assert m.position == 0
+    assert end.position == 50
+    assert b.line_count() == data[-50:].count(b'\n') + 1
+    assert [b.offset_of_line(n) for n in range(1, b.line_count())] == \
+        [i + 1 for i, c in enumerate(bytearray(data[-50:])) if c == ord('\n')]
+
+    s = b.snapshot()
+    before = b[:]
+    b.readfrom(io.BytesIO(b'more\n' * 20), max_len=50)
+    assert s == before
+    assert b == (data + b'more\n' * 20)[-50:]
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16-le', 'utf-32-le',
+                                      'latin-1'])
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+def test_codedstring(encoding, chunk_size):
+    # pylint: disable=protected-access
+    text = _TEXT if encoding != 'latin-1' else _TEXT.encode(
+        'latin-1', 'replace').decode('latin-1')
+    data = text.encode(encoding)
+    cs = codedstring(bytegapbuffer(), encoding)
+    m = cs.add_mark(0)
+    assert cs.readfrom(io.BytesIO(data), chunk_size) == len(data)
+    assert cs[:] == text
+    assert len(cs) == len(text)
+    assert m.position == len(text)
+    assert list(cs._index) == list(codedstring(bytegapbuffer(data),
+                                               encoding)._index)
+
+    cs.readfrom(io.BytesIO(data), chunk_size, max_len=30)
+    assert cs[:] == text[-30:]
+    assert m.position == 30
+
+def test_codedstring_lazy():
+    data = (_TEXT * 1000).encode('utf-8')
+    cs = codedstring(bytegapbuffer(data), lazy=True)
+    cs.readfrom(io.BytesIO(b'\xe2\x82\xac' * 3), 2)
+    assert cs[-3:] == '€' * 3
+    assert cs[:] == _TEXT * 1000 + '€' * 3
+
+def test_codedstring_follow(tmpdir):
+    path = str(tmpdir.join('log'))
+    with open(path, 'wb', buffering=0) as writer, open(path, 'rb') as f:
+        cs = codedstring(bytegapbuffer(), 'utf-8')
+        m = cs.add_mark(0)
+        reads = cs.follow(f, interval=0)
+        assert next(reads) == 0
+        # a sequence split between reads is decoded once it is complete
+        writer.write(b'a\xe2\x82')
+        assert next(reads) == 3
+        assert cs[0] == 'a'
+        writer.write(b'\xacb')
+        assert next(reads) == 2
+        assert cs[:] == 'a\u20acb'
+        assert len(cs) == 3
+        assert m.position == 3
@@ -0,0 +1,265 @@
+"""
+Tests for the run index used by codedstring.
+
+"""
+import random
+
+import pytest
+
+import bytegapbuffer.runindex as runindex_module
+from bytegapbuffer.runindex import fixedindex, runindex
+
+def _runs(n, seed=0):
+    rng = random.Random(seed)
+    return [(rng.randint(1, 4), rng.randint(1, 10)) for _ in range(n)]
+
+def _find_rune(runs, idx):
+    byte_idx, rune_idx = 0, 0
+    for entry_idx, (bpr, n_runes) in enumerate(runs):
+        if idx < rune_idx + n_runes:
+            return byte_idx, rune_idx, entry_idx, (bpr, n_runes)
+        byte_idx += bpr * n_runes
+        rune_idx += n_runes
+    raise IndexError(idx)
+
+def test_empty():
+    ri = runindex()
+    assert len(ri) == 0
+    assert ri.runes == 0
+    assert ri.nbytes == 0
+    assert list(ri) == []
+    with pytest.raises(IndexError):
+        ri.find_rune(0)
+    with pytest.raises(IndexError):
+        ri.find_byte(0)
+    with pytest.raises(IndexError):
+        ri.last()
+
+@pytest.mark.parametrize('n', [1, 5, 64, 129, 1000])
+def test_find(n):
+    runs = _runs(n)
+    ri = runindex(runs)
+    assert list(ri) == runs
+    assert ri.runes == sum(n for _, n in runs)
+    assert ri.nbytes == sum(b * n for b, n in runs)
+
+    for idx in range(ri.runes):
+        byte_idx, rune_idx, _, entry = ri.find_rune(idx)
+        expected = _find_rune(runs, idx)
+        assert (byte_idx, rune_idx, entry) == expected[:2] + expected[3:]
+
+    for idx in range(ri.nbytes):
+        byte_idx, rune_idx, _, (bpr, n_runes) = ri.find_byte(idx)
+        assert byte_idx <= idx < byte_idx + bpr * n_runes
+
+    with pytest.raises(IndexError):
+        ri.find_rune(ri.runes)
+    with pytest.raises(IndexError):
+        ri.find_rune(-1)
+    with pytest.raises(IndexError):
+        ri.find_byte(ri.nbytes)
+
+def test_replace_and_extend():
+    rng = random.Random(1)
+    runs = _runs(300)
+    ri = runindex(runs)
+    for _ in range(300):
+        idx = rng.randrange(ri.runes)
+        _, _, pos, _ = ri.find_rune(idx)
+        new_runs = _runs(rng.randint(0, 3), seed=rng.random())
+        _, _, entry_idx, _ = _find_rune(runs, idx)
+        runs[entry_idx:entry_idx+1] = new_runs
+        ri.replace(pos, new_runs)
+
+        if rng.random() < 0.05:
+            extra = _runs(rng.randint(0, 150), seed=rng.random())
+            runs.extend(extra)
+            ri.extend(extra)
+
+        if len(runs) == 0:
+            runs = _runs(10)
+            ri.extend(runs)
+
+        assert list(ri) == runs
+        assert len(ri) == len(runs)
+        assert ri.runes == sum(n for _, n in runs)
+        assert ri.nbytes == sum(b * n for b, n in runs)
+        assert ri.last()[1] == runs[-1]
+
+    for idx in range(0, ri.runes, 7):
+        byte_idx, rune_idx, _, entry = ri.find_rune(idx)
+        expected = _find_rune(runs, idx)
+        assert (byte_idx, rune_idx, entry) == expected[:2] + expected[3:]
+
+def _expand(runs):
+    return [bpr for bpr, n in runs for _ in range(n)]
+
+def _check_leaves(ri):
+    # pylint: disable=protected-access
+    leaves = ri._leaves
+    assert all(len(leaf) < 2 * ri._LEAF_SIZE for leaf in leaves)
+    assert len(leaves) == 0 or len(leaves[-1]) > 0
+    for tree, totals in (
+            (ri._rune_tree, [sum(n for _, n in leaf) for leaf in leaves]),
+            (ri._byte_tree, [sum(b * n for b, n in leaf) for leaf in leaves])):
+        assert [runindex_module._fenwick_prefix(tree, i)
+                for i in range(len(leaves) + 1)] == \
+            [sum(totals[:i]) for i in range(len(leaves) + 1)]
+
+def _no_rebuild(values):
+    raise AssertionError('Fenwick trees rebuilt: %r' % (values,))
+
+def test_splice():
+    rng = random.Random(2)
+    runs = _runs(1000)
+    ri = runindex(runs)
+    bprs = _expand(runs)
+    for _ in range(300):
+        start = rng.randint(0, len(bprs))
+        stop = rng.randint(start, min(len(bprs), start + rng.choice([5, 500])))
+        new_runs = _runs(rng.choice([0, 3, 300]), seed=rng.random())
+
+        byte_start, byte_stop = ri.splice(start, stop, new_runs)
+        assert byte_start == sum(bprs[:start])
+        assert byte_stop == sum(bprs[:stop])
+        bprs[start:stop] = _expand(new_runs)
+
+        assert _expand(ri) == bprs
+        assert ri.runes == len(bprs)
+        assert ri.nbytes == sum(bprs)
+        assert all(n > 0 for _, n in ri)
+        _check_leaves(ri)
+        if len(bprs) > 0:
+            idx = rng.randrange(len(bprs))
+            byte_idx, rune_idx, _, (_, n_runes) = ri.find_rune(idx)
+            assert rune_idx <= idx < rune_idx + n_runes
+            assert byte_idx == sum(bprs[:rune_idx])
+
+    with pytest.raises(IndexError):
+        ri.splice(1, 0)
+    with pytest.raises(IndexError):
+        ri.splice(0, ri.runes + 1)
+
+def test_splice_across_leaves(monkeypatch):
+    # pylint: disable=protected-access
+    runs = [(1 + i % 2, 1) for i in range(64 * 100)]
+    ri = runindex(runs)
+    leaves = list(ri._leaves)
+    contents = [list(leaf) for leaf in leaves]
+
+    # deleting from leaf 40 to leaf 43 only changes those leaves
+    monkeypatch.setattr(runindex_module, '_fenwick_build', _no_rebuild)
+    start, stop = 40 * 64 + 10, 43 * 64 + 20
+    assert ri.splice(start, stop) == \
+        (sum(b for b, _ in runs[:start]), sum(b for b, _ in runs[:stop]))
+    assert len(ri._leaves) == len(leaves)
+    for idx, leaf in enumerate(ri._leaves):
+        if not 40 <= idx <= 43:
+            assert leaf is leaves[idx]
+            assert leaf == contents[idx]
+    monkeypatch.undo()
+
+    del runs[start:stop]
+    assert list(ri) == runs
+    _check_leaves(ri)
+    assert ri.find_rune(start)[:2] == \
+        (sum(b for b, _ in runs[:start]), start)
+
+def test_insert_shares_runs(monkeypatch):
+    runs = [(1 + i % 2, 1) for i in range(64 * 100)]
+    ri = runindex(runs)
+    monkeypatch.setattr(runindex_module, '_fenwick_build', _no_rebuild)
+    for i in range(1000):
+        ri.splice(3200, 3200, [(3 + i % 2, 1)])
+        runs.insert(3200, (3 + i % 2, 1))
+    monkeypatch.undo()
+    assert list(ri) == runs
+    _check_leaves(ri)
+
+def test_splice_merges():
+    ri = runindex([(1, 3), (2, 3), (1, 3)])
+    assert ri.splice(2, 7) == (2, 10)
+    assert list(ri) == [(1, 4)]
+    assert ri.splice(4, 4, [(1, 2), (3, 1)]) == (4, 4)
+    assert list(ri) == [(1, 6), (3, 1)]
+    assert ri.splice(0, 7) == (0, 9)
+    assert list(ri) == []
+    assert ri.splice(0, 0, [(2, 1)]) == (0, 0)
+    assert list(ri) == [(2, 1)]
+
+def test_runs():
+    rng = random.Random(5)
+    ri = runindex(_runs(300))
+    expanded = _expand(ri)
+    for _ in range(100):
+        start = rng.randint(0, ri.runes)
+        stop = rng.randint(start, ri.runes)
+        runs = ri.runs(start, stop)
+        assert _expand(runs) == expanded[start:stop]
+        assert all(n > 0 for _, n in runs)
+    assert ri.runs(ri.runes, ri.runes) == []
+    with pytest.raises(IndexError):
+        ri.runs(0, ri.runes + 1)
+
+    fi = fixedindex(2, 20)
+    assert fi.runs(3, 7) == [(2, 4)]
+    assert fi.runs(3, 3) == []
+    with pytest.raises(IndexError):
+        fi.runs(5, 11)
+
+def test_fixedindex():
+    fi = fixedindex(4, 42)
+    assert fi.width == 4
+    assert fi.runes == 10
+    assert fi.nbytes == 40
+    assert list(fi) == [(4, 10)]
+    assert fi.find_rune(7)[:2] == (0, 0)
+    assert fi.find_rune(7)[3] == (4, 10)
+    assert fi.find_byte(39)[3] == (4, 10)
+    with pytest.raises(IndexError):
+        fi.find_rune(10)
+    with pytest.raises(IndexError):
+        fi.find_byte(40)
+
+    pos, entry = fi.last()
+    fi.replace(pos, [(4, 3), (4, 12)])
+    assert fi.runes == 15
+    fi.extend([(4, 5)])
+    assert fi.runes == 20
+    assert fi.splice(2, 5, [(4, 1)]) == (8, 20)
+    assert fi.runes == 18
+    with pytest.raises(IndexError):
+        fi.splice(5, 19)
+    assert fi.splice(0, 18) == (0, 72)
+    assert len(fi) == 0
+    assert list(fi) == []
+    with pytest.raises(IndexError):
+        fi.last()
+    with pytest.raises(ValueError):
+        fixedindex(0)
+
+def test_units():
+    rng = random.Random(3)
+    runs = _runs(500)
+    ri = runindex(runs)
+    for _ in range(100):
+        start = rng.randint(0, ri.runes)
+        stop = rng.randint(start, min(ri.runes, start + 20))
+        ri.splice(start, stop, _runs(rng.randint(0, 3), seed=rng.random()))
+
+    units = [0]
+    for bpr in _expand(ri):
+        units.append(units[-1] + (2 if bpr == 4 else 1))
+    assert ri.units == units[-1]
+    for idx, unit_idx in enumerate(units):
+        assert ri.rune_to_unit(idx) == unit_idx
+        assert ri.unit_to_rune(unit_idx) == idx
+        if idx < ri.runes and units[idx + 1] - unit_idx == 2:
+            assert ri.unit_to_rune(unit_idx + 1) == idx
+
+    with pytest.raises(IndexError):
+        ri.rune_to_unit(ri.runes + 1)
+    with pytest.raises(IndexError):
+        ri.unit_to_rune(ri.units + 1)
+    assert runindex().rune_to_unit(0) == 0
+    assert runindex().unit_to_rune(0) == 0
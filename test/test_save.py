@@ -0,0 +1,144 @@
+"""
+Tests for writing buffers to files with writeto() and save().
+
+"""
+import io
+import os
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+
+def _buf(data, gap):
+    # pylint: disable=protected-access
+    b = bytegapbuffer(data)
+    b._move_gap(gap)
+    return b
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+@pytest.mark.parametrize('gap', [0, 3, 10])
+def test_writeto(tmpdir, gap):
+    data = b'0123456789'
+    b = _buf(data, gap)
+
+    f = io.BytesIO()
+    assert b.writeto(f) == len(data)
+    assert b.writeto(f, 2, -2) == 6
+    assert f.getvalue() == data + data[2:-2]
+
+    path = str(tmpdir.join('out'))
+    with open(path, 'wb', buffering=0) as f:
+        assert b.writeto(f) == len(data)
+    assert _read(path) == data
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        assert b.writeto(fd, 5) == 5
+    finally:
+        os.close(fd)
+    assert _read(path) == data + data[5:]
+
+@pytest.mark.parametrize('writev', [True, False])
+def test_writeto_partial_writes(tmpdir, monkeypatch, writev):
+    real_writev, real_write = getattr(os, 'writev', None), os.write
+    if writev and real_writev is None:
+        pytest.skip('os.writev() is not available')
+
+    # only ever write 3 bytes at a time
+    if writev:
+        monkeypatch.setattr(os, 'writev', lambda fd, views: real_write(
+            fd, b''.join(bytes(v) for v in views)[:3]
+        ))
+    elif real_writev is not None:
+        monkeypatch.delattr(os, 'writev')
+    monkeypatch.setattr(os, 'write', lambda fd, v: real_write(fd, v[:3]))
+
+    data = bytes(bytearray(range(100)))
+    path = str(tmpdir.join('out'))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        assert _buf(data, 41).writeto(fd) == len(data)
+    finally:
+        os.close(fd)
+    assert _read(path) == data
+
+def test_save(tmpdir):
+    path = str(tmpdir.join('out'))
+    b = _buf(b'hello world', 5)
+    assert b.save(path) == 11
+    assert _read(path) == b'hello world'
+
+    os.chmod(path, 0o640)
+    b[5:5] = b','
+    b.save(path)
+    assert _read(path) == b'hello, world'
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(str(tmpdir)) == ['out']
+
+def test_save_failure(tmpdir, monkeypatch):
+    path = str(tmpdir.join('out'))
+    b = bytegapbuffer(b'original')
+    b.save(path)
+
+    def fail(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'fsync', fail)
+    b[:] = b'replaced'
+    with pytest.raises(OSError):
+        b.save(path)
+    assert _read(path) == b'original'
+    assert os.listdir(str(tmpdir)) == ['out']
+
+def test_incremental(tmpdir):
+    path = str(tmpdir.join('out'))
+    data = b'0123456789' * 100
+    b = bytegapbuffer(data)
+    assert b.save(path, incremental=True) == len(data)
+
+    b[990:] = b'end'
+    assert b.save(path, incremental=True) == 3
+    assert _read(path) == data[:990] + b'end'
+    del b[-10:]
+    b.extend(b'+')
+    assert b.save(path, incremental=True) == 1
+    assert _read(path) == b[:]
+
+    # edits at the start rewrite everything
+    b.insert(0, ord('>'))
+    b.extend(b'x')
+    assert b.save(path, incremental=True) == len(b)
+    assert _read(path) == b[:]
+
+    # as does saving somewhere else or a file modified since
+    other = str(tmpdir.join('other'))
+    b.extend(b'y')
+    assert b.save(other, incremental=True) == len(b)
+    with open(path, 'ab') as f:
+        f.write(b'changed')
+    b.extend(b'z')
+    assert b.save(path, incremental=True) == len(b)
+    assert _read(path) == b[:]
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_incremental_from_file(tmpdir, mmap):
+    path = str(tmpdir.join('data'))
+    data = b'abcdefghij' * 1000
+    with open(path, 'wb') as f:
+        f.write(data)
+    b = bytegapbuffer.from_file(path, mmap=mmap)
+    b.insert_bytes(5000, b'inserted')
+    expected = data[:5000] + b'inserted' + data[5000:]
+
+    # the mapped file must not be rewritten in place
+    n = b.save(path, incremental=True)
+    assert n == len(expected) if mmap else n == len(expected) - 5000
+    assert _read(path) == expected
+    assert b == expected
+
+    b.extend(b'more')
+    assert b.save(path, incremental=True) == 4
+    assert _read(path) == expected + b'more'
+    assert b == expected + b'more'
@@ -0,0 +1,101 @@
+"""
+Tests for copy-on-write snapshots.
+
+"""
+import random
+import threading
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+from randomedits import random_edit
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('init_gap_size', [0, None, 10000])
+def test_random_edits(seed, init_gap_size):
+    rng = random.Random(seed)
+    data = bytes(bytearray(rng.getrandbits(8) for _ in range(20000)))
+    b = bytegapbuffer(data, init_gap_size=init_gap_size)
+    snapshots = []
+    for _ in range(100):
+        if rng.random() < 0.2:
+            snapshots.append((b.snapshot(), b[:]))
+        if rng.random() < 0.05 and len(snapshots) > 0:
+            s, _ = snapshots.pop(rng.randrange(len(snapshots)))
+            s.release()
+        random_edit(rng, b, max_len=300)
+        for s, expected in snapshots:
+            assert len(s) == len(expected)
+        s, expected = snapshots[-1] if snapshots else (None, None)
+        if s is not None:
+            assert s == expected
+
+    for s, expected in snapshots:
+        assert s.tobytes() == expected
+        assert s == expected
+        assert b''.join(s.iter_chunks(1000)) == expected
+        for k in [slice(None), slice(5, 9000), slice(None, None, 3),
+                  slice(None, None, -7), slice(17000, 10, -1), slice(9, 4)]:
+            assert s[k] == expected[k]
+        assert s[0] == bytearray(expected)[0]
+        assert s[-1] == bytearray(expected)[-1]
+
+def test_shares_storage():
+    # pylint: disable=protected-access
+    b = bytegapbuffer(b'x' * 100000)
+    b._move_gap(50000)
+    s = b.snapshot()
+    b.insert(50000, ord('a'))
+    del b[49990]
+    assert len(s._saved) <= 2
+    assert s == b'x' * 100000
+    assert list(s[:3]) == [ord('x')] * 3
+    assert list(iter(s))[:3] == [ord('x')] * 3
+
+    s.release()
+    with pytest.raises(ValueError):
+        s.tobytes()
+    b.insert(0, ord('b'))
+    assert len(b._snapshots) == 0
+
+def test_context_manager():
+    b = bytegapbuffer(b'hello')
+    with b.snapshot() as s:
+        b[:] = b'world'
+        assert s == b'hello'
+        assert s != b'world'
+        assert s == bytegapbuffer(b'hello')
+        assert repr(s) == "snapshot(b'hello')"
+        assert s.index(ord('l')) == 2
+    with pytest.raises(ValueError):
+        s[0]
+    with pytest.raises(IndexError):
+        b.snapshot()[5]
+
+def test_threaded_readers():
+    rng = random.Random(1)
+    b = bytegapbuffer(
+        bytes(bytearray(rng.getrandbits(8) for _ in range(50000)))
+    )
+    s = b.snapshot()
+    expected = b[:]
+    failures = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            if s.tobytes() != expected:
+                failures.append(True)
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    try:
+        for _ in range(300):
+            random_edit(rng, b, max_len=300)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert not failures
+    assert s == expected
@@ -0,0 +1,197 @@
+"""
+Tests for the thread-safe buffer and string.
+
+"""
+import random
+import threading
+
+import pytest
+
+from bytegapbuffer import bytegapbuffer
+from bytegapbuffer import codedstring as codedstring_module
+from bytegapbuffer.synchronized import (
+    rwlock, synchronizedbytegapbuffer, synchronizedcodedstring
+)
+
+def _run(writer, readers, n_readers=3):
+    """Run *writer* alongside *n_readers* threads calling *readers* until it
+    returns. Return a list of the exceptions raised by the readers.
+
+    """
+    done = threading.Event()
+    errors = []
+    def read():
+        try:
+            while not done.is_set():
+                readers()
+        except Exception as e: # pylint: disable=broad-except
+            errors.append(e)
+    threads = [threading.Thread(target=read) for _ in range(n_readers)]
+    for t in threads:
+        t.start()
+    try:
+        writer()
+    finally:
+        done.set()
+        for t in threads:
+            t.join()
+    return errors
+
+def test_rwlock_readers_concurrent():
+    lock = rwlock()
+    barrier = threading.Barrier(2, timeout=5)
+    def read():
+        with lock.read():
+            barrier.wait()
+    threads = [threading.Thread(target=read) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not barrier.broken
+
+def test_rwlock_writer_exclusive():
+    lock = rwlock()
+    events = []
+    writing = threading.Event()
+    def write():
+        writing.set()
+        with lock.write():
+            events.append('write')
+    with lock.read():
+        t = threading.Thread(target=write)
+        t.start()
+        writing.wait()
+        t.join(0.1)
+        events.append('read')
+    t.join()
+    assert events == ['read', 'write']
+
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+    with lock.read():
+        with lock.read():
+            with pytest.raises(RuntimeError):
+                with lock.write():
+                    pass
+
+def test_synchronized_buffer_behaves():
+    b = synchronizedbytegapbuffer(b'hello', init_gap_size=2)
+    b.insert(0, ord('>'))
+    b[1:1] = b' '
+    b.extend(b' world')
+    del b[-1]
+    assert b == b'> hello worl'
+    assert b.find(b'wo') == 8
+    assert list(b.finditer(b'l')) == [4, 5, 11]
+    assert [m.start() for m in b.iter_search(b'l+')] == [4, 11]
+    assert b''.join(b.iter_chunks(3)) == b'> hello worl'
+    assert b.line_count() == 1
+    assert isinstance(b.copy(), bytegapbuffer)
+    with b.reading():
+        assert b''.join(bytes(s) for s in b.segments()) == b'> hello worl'
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_index_readers(tmpdir, mapped):
+    if mapped:
+        path = str(tmpdir.join('lines'))
+        with open(path, 'wb') as f:
+            f.write(b'one\ntwo\nthree')
+        b = synchronizedbytegapbuffer.from_file(path)
+    else:
+        b = synchronizedbytegapbuffer(b'one\ntwo\nthree')
+    with b.reading():
+        # the line index and mark set are built up front
+        assert b.line_count() == 3
+        assert b.marks() == []
+    m = b.add_mark(5)
+
+    # readers look lines and marks up concurrently
+    barrier = threading.Barrier(2, timeout=5)
+    results = []
+    def read():
+        with b.reading():
+            barrier.wait()
+            results.append((b.line_of(5), b.offset_of_line(2), b.marks()))
+    threads = [threading.Thread(target=read) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not barrier.broken
+    assert results == [(1, 8, [m])] * 2
+
+def test_mark_position_reads():
+    b = synchronizedbytegapbuffer(b'hello')
+    m = b.add_mark(3)
+    positions = []
+    with b.writing():
+        t = threading.Thread(target=lambda: positions.append(m.position))
+        t.start()
+        t.join(0.1)
+        # the lookup waits for the writer
+        assert positions == []
+        b.insert(0, ord('>'))
+    t.join()
+    assert positions == [4]
+
+def test_concurrent_buffer():
+    rng = random.Random(1)
+    b = synchronizedbytegapbuffer(b'ab' * 1000, init_gap_size=0)
+
+    def writer():
+        for _ in range(2000):
+            idx = 2 * rng.randint(0, len(b) // 2)
+            if rng.random() < 0.5:
+                b[idx:idx] = b'ab' * rng.randint(1, 50)
+            else:
+                del b[idx:idx + 2 * rng.randint(1, 50)]
+
+    def readers():
+        with b.reading():
+            contents = b''.join(bytes(s) for s in b.segments())
+            assert contents == b'ab' * (len(b) // 2)
+        assert b.find(b'aa') == -1
+        data = b[:]
+        assert data == b'ab' * (len(data) // 2)
+
+    assert _run(writer, readers) == []
+
+def test_concurrent_codedstring():
+    rng = random.Random(2)
+    cs = synchronizedcodedstring(encoding='utf-8')
+    cs.insert(0, '€\U0001F600' * 100)
+
+    def writer():
+        for _ in range(1000):
+            idx = 2 * rng.randint(0, len(cs) // 2)
+            if rng.random() < 0.5:
+                cs[idx:idx] = '€\U0001F600' * rng.randint(1, 5)
+            else:
+                del cs[idx:idx + 2 * rng.randint(1, 5)]
+            cs.buffer.line_count()
+
+    def readers():
+        text = cs[:]
+        assert text == '€\U0001F600' * (len(text) // 2)
+        with cs.reading():
+            n = len(cs)
+            assert cs.utf16_offset(n) == 3 * n // 2
+            assert str(cs.view(0, n)) == '€\U0001F600' * (n // 2)
+
+    assert _run(writer, readers) == []
+
+def test_lazy_codedstring(monkeypatch):
+    monkeypatch.setattr(codedstring_module, '_INDEX_CHUNK_SIZE', 101)
+    data = ('x' * 1000).encode('utf-8')
+    cs = synchronizedcodedstring(bytegapbuffer(data), lazy=True)
+    assert cs[5] == 'x'
+    assert not cs._complete # pylint: disable=protected-access
+    assert ''.join(cs) == 'x' * 1000
+    assert len(cs) == 1000
+    # the mark set was built once the string was indexed
+    assert cs._marks is not None # pylint: disable=protected-access
+    with cs.reading():
+        assert cs.marks() == []